@@ -1,6 +1,5 @@
-from hadx.urls import Path
-from .views import logout
+from project.routing import LazyPath
 
 urlpatterns = [
-  Path("logout", logout, name="logout")
+  LazyPath("logout", "accounts.views.logout", name="logout")
 ]
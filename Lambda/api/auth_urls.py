@@ -1,8 +1,7 @@
-from hadx.urls import Path, Router
-from .auth_views import token_exchange, auth_status, logout
+from project.routing import LazyPath
 
 urlpatterns = [
-    Path("token", token_exchange, name="token_exchange"),
-    Path("status", auth_status, name="auth_status"), 
-    Path("logout", logout, name="logout"),
-] 
\ No newline at end of file
+    LazyPath("token", "api.auth_views.token_exchange", name="token_exchange"),
+    LazyPath("status", "api.auth_views.auth_status", name="auth_status"), 
+    LazyPath("logout", "api.auth_views.logout", name="logout"),
+] 
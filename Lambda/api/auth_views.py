@@ -1,6 +1,6 @@
-from hadx.shortcuts import json_response
-import json
+from project.serializers import json_response
 import logging
+from project.http_body import json_body
 
 logger = logging.getLogger(__name__)
 
@@ -10,7 +10,7 @@ def token_exchange(master):
     POST /api/auth/token
     """
     try:
-        body = json.loads(master.event.get('body', '{}'))
+        body = json_body(master.event)
         code = body.get('code')
         
         if not code:
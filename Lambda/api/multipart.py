@@ -0,0 +1,219 @@
+"""
+multipart/form-data のストリーミングパーサー
+
+API Gatewayのイベントのbody（base64エンコードされている場合もある）をチャンクごとにデコードしながら走査し、
+パートのデータはmemoryviewのスライスとして受け取り側に渡す（本文全体のコピーは作らない）
+"""
+import binascii
+
+# base64のデコード単位（4の倍数）
+BASE64_CHUNK_SIZE = 512 * 1024
+
+MAX_HEADER_SIZE = 16 * 1024
+
+_DATA = 0
+_AFTER_DELIMITER = 1
+_HEADERS = 2
+_EPILOGUE = 3
+
+class MultipartError(ValueError):
+    """multipart/form-dataの形式が不正"""
+
+def parse_options_header(value):
+    """'form-data; name="file"; filename="a.txt"' のようなヘッダーを (値, パラメータ) に分解"""
+    parts = _split_params(value)
+    main = parts[0].strip().lower() if parts else ''
+    params = {}
+    for part in parts[1:]:
+        key, sep, val = part.strip().partition('=')
+        if not sep:
+            continue
+        key = key.strip().lower()
+        val = val.strip()
+        if len(val) >= 2 and val[0] == val[-1] == '"':
+            val = val[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+        if key.endswith('*'):
+            # RFC 5987（例: filename*=UTF-8''%E3%83%86）
+            from urllib.parse import unquote
+            charset, _, encoded = val.partition("''")
+            key = key[:-1]
+            val = unquote(encoded or charset, encoding=charset if encoded else 'utf-8', errors='replace')
+        elif key in params:
+            continue
+        params[key] = val
+    return main, params
+
+def _split_params(value):
+    parts, current, quoted, escaped = [], [], False, False
+    for ch in value:
+        if escaped:
+            current.append(ch)
+            escaped = False
+        elif ch == '\\' and quoted:
+            current.append(ch)
+            escaped = True
+        elif ch == '"':
+            current.append(ch)
+            quoted = not quoted
+        elif ch == ';' and not quoted:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append(''.join(current))
+    return parts
+
+def get_boundary(content_type):
+    """Content-Typeからboundaryを取得（multipart/form-dataでなければNone）"""
+    main, params = parse_options_header(content_type or '')
+    if main != 'multipart/form-data':
+        return None
+    boundary = params.get('boundary')
+    if not boundary:
+        raise MultipartError("boundary is missing")
+    return boundary.encode('latin-1')
+
+def iter_event_body(event):
+    """イベントのbodyをバイト列のチャンクとして返す"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded', False):
+        for start in range(0, len(body), BASE64_CHUNK_SIZE):
+            try:
+                yield binascii.a2b_base64(body[start:start + BASE64_CHUNK_SIZE])
+            except binascii.Error as e:
+                raise MultipartError("invalid base64 body") from e
+    elif isinstance(body, bytes):
+        yield body
+    else:
+        yield body.encode('utf-8')
+
+class Part:
+    def __init__(self, headers):
+        self.headers = headers
+        disposition, params = parse_options_header(headers.get('content-disposition', ''))
+        if disposition != 'form-data' or 'name' not in params:
+            raise MultipartError("invalid Content-Disposition")
+        self.name = params['name']
+        self.filename = params.get('filename')
+        self.content_type = headers.get('content-type')
+
+class MultipartParser:
+    """
+    part_factory(part) はパートの先頭で呼ばれ、write(memoryview) と close() を持つ受け取り側を返す
+    受け取り側はwriteで渡されたmemoryviewを呼び出し中に消費すること（後で参照しない）
+    """
+    def __init__(self, boundary, part_factory):
+        self._delimiter = b"\r\n--" + boundary
+        self._part_factory = part_factory
+        self._state = _DATA
+        self._sink = None
+        # 本文先頭の "--boundary" を他の区切りと同じ "\r\n--boundary" として扱う
+        self._tail = bytearray(b"\r\n")
+        self._buf = bytearray()
+
+    def feed(self, chunk):
+        view = memoryview(chunk)
+        pos, n = 0, len(chunk)
+        while pos < n:
+            if self._state == _DATA:
+                pos = self._feed_data(chunk, view, pos)
+            elif self._state == _AFTER_DELIMITER:
+                taken = view[pos:pos + 2 - len(self._buf)]
+                self._buf += taken
+                pos += len(taken)
+                if len(self._buf) < 2:
+                    break
+                if self._buf == b"--":
+                    self._state = _EPILOGUE
+                elif self._buf == b"\r\n":
+                    self._state = _HEADERS
+                else:
+                    raise MultipartError("invalid delimiter")
+                self._buf.clear()
+            elif self._state == _HEADERS:
+                pos = self._feed_headers(chunk, view, pos)
+            else:
+                break
+
+    def close(self):
+        if self._state != _EPILOGUE:
+            raise MultipartError("unexpected end of body")
+
+    def _write(self, data):
+        if self._sink is not None and len(data):
+            self._sink.write(data)
+
+    def _end_part(self):
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+        self._state = _AFTER_DELIMITER
+
+    def _feed_data(self, chunk, view, pos):
+        delimiter = self._delimiter
+        dl = len(delimiter)
+        n = len(chunk)
+        if self._tail:
+            # 前のチャンクの末尾から区切りが始まっている場合
+            t = len(self._tail)
+            probe = bytes(self._tail) + bytes(view[pos:pos + dl - 1])
+            k = probe.find(delimiter)
+            if k != -1 and k < t:
+                self._write(memoryview(self._tail)[:k])
+                self._tail = bytearray()
+                self._end_part()
+                return pos + k + dl - t
+            if n - pos < dl - 1:
+                # 判定に足りないので末尾として保持
+                self._tail += view[pos:]
+                excess = len(self._tail) - (dl - 1)
+                if excess > 0:
+                    self._write(memoryview(self._tail)[:excess])
+                    del self._tail[:excess]
+                return n
+            self._write(memoryview(self._tail))
+            self._tail = bytearray()
+        idx = chunk.find(delimiter, pos)
+        if idx != -1:
+            self._write(view[pos:idx])
+            self._end_part()
+            return idx + dl
+        # 区切りの途中かもしれない末尾は次のチャンクまで保持
+        safe = max(pos, n - (dl - 1))
+        self._write(view[pos:safe])
+        self._tail = bytearray(view[safe:])
+        return n
+
+    def _feed_headers(self, chunk, view, pos):
+        terminator = b"\r\n\r\n"
+        if self._buf:
+            tail = bytes(self._buf[-3:])
+            probe = tail + bytes(view[pos:pos + 3])
+            k = probe.find(terminator)
+            if k != -1:
+                consumed = k + 4 - len(tail)
+                self._buf += view[pos:pos + consumed]
+                self._begin_part(bytes(self._buf[:-4]))
+                return pos + consumed
+        idx = chunk.find(terminator, pos)
+        if idx == -1:
+            self._buf += view[pos:]
+            if len(self._buf) > MAX_HEADER_SIZE:
+                raise MultipartError("part headers too large")
+            return len(chunk)
+        self._buf += view[pos:idx]
+        self._begin_part(bytes(self._buf))
+        return idx + 4
+
+    def _begin_part(self, raw_headers):
+        self._buf.clear()
+        headers = {}
+        for line in raw_headers.decode('utf-8', 'replace').split("\r\n"):
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise MultipartError("invalid part header")
+            headers[name.strip().lower()] = value.strip()
+        self._sink = self._part_factory(Part(headers))
+        self._state = _DATA
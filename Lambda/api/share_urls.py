@@ -1,6 +1,5 @@
-from hadx.urls import Path, Router
-from .share_views import share_handler
+from project.routing import LazyPath
 
 urlpatterns = [
-    Path("{share_code}", share_handler, name="share_handler"),  # GET/PUT /api/share/{shareCode}
-] 
\ No newline at end of file
+    LazyPath("{share_code}", "api.share_views.share_handler", name="share_handler"),  # GET/PUT /api/share/{shareCode}
+] 
@@ -1,16 +1,35 @@
-from hadx.shortcuts import json_response
-import json
+from project.serializers import json_response
 import logging
-import boto3
 from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
+from project.aws import get_table
+from project import http_cache
+from project.http_body import json_body
+from .wiki_body import VersionConflict, update_page_item, load_page_text
+from .wiki_views import (
+    InvalidVersion, parse_version, version_error_response, conflict_response,
+    RenderUnavailable, render_mode, with_rendered, render_unavailable_response, page_validators
+)
 
 logger = logging.getLogger(__name__)
 
-def get_dynamodb():
-    """DynamoDBクライアントを取得"""
-    return boto3.resource('dynamodb', region_name='ap-northeast-1')
+def share_conflict_response(master, conflict, share_code):
+    """共有記事の条件付き書き込みの失敗のレスポンス（共有が解除・変更されていれば404、編集権限がなければ403、それ以外は記事更新と同じ）"""
+    current = conflict.current
+    if current is not None and (not current.get('share', False) or current.get('share_code') != share_code):
+        return json_response(master, {
+            "success": False,
+            "message": "共有コードが無効です",
+            "error_code": "INVALID_SHARE_CODE"
+        }, code=404)
+    if current is not None and not current.get('share_edit_permission', False):
+        return json_response(master, {
+            "success": False,
+            "message": "この共有記事の編集権限がありません",
+            "error_code": "PERMISSION_DENIED"
+        }, code=403)
+    return conflict_response(master, conflict)
 
 def share_handler(master, share_code):
     """
@@ -32,11 +51,15 @@ def share_handler(master, share_code):
 def get_shared_page(master, share_code):
     """
     共有コードによる記事取得
-    GET /api/share/{shareCode}
+    GET /api/share/{shareCode}?render=html
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
+        try:
+            mode = render_mode(master)
+        except RenderUnavailable:
+            return render_unavailable_response(master)
+        
+        table = get_table(master.settings.WIKI_TABLE)
         
         # 共有コードでページを検索
         response = table.query(
@@ -61,21 +84,29 @@ def get_shared_page(master, share_code):
                 "error_code": "INVALID_SHARE_CODE"
             }, code=404)
         
+        # 変わっていなければ本文を読み込まずに304を返す
+        headers = page_validators(master.settings, page, mode, kind='share')
+        if http_cache.is_not_modified(master.event, headers):
+            return http_cache.not_modified(headers)
+        
         # レスポンス用データ
         response_data = {
             'username': page.get('username'),
             'slug': page.get('slug'),
             'title': page.get('title'),
-            'text': page.get('text'),
+            'text': load_page_text(master.settings, page),
             'share_code': page.get('share_code'),
             'share_edit_permission': page.get('share_edit_permission', False),
-            'last_updated': page.get('last_updated')
+            'last_updated': page.get('last_updated'),
+            'version': int(page.get('version', 0))
         }
+        if mode == 'html':
+            response_data = with_rendered(master.settings, response_data)
         
-        return json_response(master, {
+        return http_cache.add_headers(json_response(master, {
             "success": True,
             "data": response_data
-        })
+        }), headers)
         
     except Exception as e:
         logger.exception(f"Get shared page error: {e}")
@@ -91,8 +122,7 @@ def update_shared_page(master, share_code):
     PUT /api/share/{shareCode}
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
+        table = get_table(master.settings.WIKI_TABLE)
         
         # 共有コードでページを検索
         response = table.query(
@@ -125,17 +155,23 @@ def update_shared_page(master, share_code):
                 "error_code": "PERMISSION_DENIED"
             }, code=403)
         
-        body = json.loads(master.event.get('body', '{}'))
+        body = json_body(master.event)
+        try:
+            expected_version = parse_version(body)
+        except InvalidVersion as e:
+            return version_error_response(master, e)
         
         # 現在時刻
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
         # 更新可能なフィールドのみ（共有記事では限定的）
         update_data = {}
+        text = None
         if 'title' in body:
             update_data['title'] = body['title']
         if 'text' in body:
-            update_data['text'] = body['text']
+            # 本文は大きさに応じて圧縮・S3・WIKI_BODY_TABLE に保存する
+            text = body['text']
         update_data['last_updated'] = now
         
         if not update_data:
@@ -145,29 +181,26 @@ def update_shared_page(master, share_code):
                 "error_code": "VALIDATION_ERROR"
             }, code=400)
         
-        # DynamoDBを更新
-        update_expression = "SET " + ", ".join([f"#{k} = :{k}" for k in update_data.keys()])
-        expression_attribute_names = {f"#{k}": k for k in update_data.keys()}
-        expression_attribute_values = {f":{k}": v for k, v in update_data.items()}
-        
-        response = table.update_item(
-            Key={'username': page['username'], 'slug': page['slug']},
-            UpdateExpression=update_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues='ALL_NEW'
-        )
+        # versionが一致し、共有・編集権限が有効なままで共有コードが変わっていない場合だけ更新する
+        # （ShareCodeIndexは結果整合性なので、上の確認の後に共有が解除・変更されている可能性がある）
+        try:
+            updated_page = update_page_item(
+                master.settings, page['username'], page['slug'], update_data,
+                text=text, expected_version=expected_version, share_code=share_code
+            )
+        except VersionConflict as conflict:
+            return share_conflict_response(master, conflict, share_code)
         
         # レスポンス用データ
-        updated_page = response['Attributes']
         response_data = {
             'username': updated_page.get('username'),
             'slug': updated_page.get('slug'),
             'title': updated_page.get('title'),
-            'text': updated_page.get('text'),
+            'text': text if text is not None else load_page_text(master.settings, updated_page),
             'share_code': updated_page.get('share_code'),
             'share_edit_permission': updated_page.get('share_edit_permission', False),
-            'last_updated': updated_page.get('last_updated')
+            'last_updated': updated_page.get('last_updated'),
+            'version': int(updated_page.get('version', 0))
         }
         
         return json_response(master, {
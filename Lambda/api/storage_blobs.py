@@ -0,0 +1,262 @@
+"""
+内容のハッシュによる重複排除（STORAGE_DEDUP が有効な場合）
+
+ファイルの実体は blobs/sha256/{digest} に1つだけ保存し、StorageTableの blob#{digest} のアイテムで参照数を数える。
+ファイルのアイテムは blob（digest）と s3_key（実体のキー）を持ち、削除時は実体ではなく参照数を減らす。
+署名付きURLによるアップロードはアップロードごとの一時的なキー（upload_key）に書き込ませ、確定時にチェックサムを確認してから実体にする。
+参照数が0になった実体とどのアイテムからも参照されていない実体は collect_garbage で削除する
+
+GCと同時に参照を増やさないように、GCは削除前に gc_started を付け、参照を増やす側はそれがないことを条件にする
+（競合した場合は重複排除せずに通常のキーに保存する）
+"""
+import base64
+import binascii
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from project.aws import get_table, get_s3
+from project.batch import batch_get_items, batch_write, delete_s3_objects
+
+logger = logging.getLogger(__name__)
+
+BLOB_PREFIX = 'blob#'
+BLOB_KEY_PREFIX = 'blobs/sha256/'
+
+# ハッシュを計算しながら書き込む間の一時的なキー（S3のライフサイクルルールで1日後に削除される）
+TMP_KEY_PREFIX = 'tmp/'
+
+# 参照がなくなってからGCで削除するまでの猶予（秒）
+GC_GRACE = 24 * 60 * 60
+
+class BlobBusy(Exception):
+    """GCで削除中の実体"""
+
+def blob_key(digest):
+    """実体のS3のキー"""
+    return BLOB_KEY_PREFIX + digest
+
+def upload_key(owner, item_id):
+    """アイテムのデータを実体にする前に書き込む一時的なキー"""
+    return f"{TMP_KEY_PREFIX}{owner}/{item_id}"
+
+def parse_digest(value):
+    """クライアントが指定したSHA-256（16進数）を検証して小文字で返す（不正ならNone）"""
+    if not isinstance(value, str) or len(value) != 64:
+        return None
+    try:
+        bytes.fromhex(value)
+    except ValueError:
+        return None
+    return value.lower()
+
+def checksum_sha256(digest):
+    """S3の x-amz-checksum-sha256 の値（base64）"""
+    return base64.b64encode(binascii.unhexlify(digest)).decode('ascii')
+
+def get_blob(table_name, digest):
+    """実体のアイテムを取得（なければNone）"""
+    return get_table(table_name).get_item(Key={'id': BLOB_PREFIX + digest}, ConsistentRead=True).get('Item')
+
+def is_available(blob, owner=None):
+    """実体が保存済みで参照を増やせるか（ownerを指定した場合はその所有者が既に参照したことがあるか）"""
+    if not blob or not blob.get('stored') or 'gc_started' in blob:
+        return False
+    return owner is None or owner in blob.get('owners', set())
+
+def acquire(table_name, digest, size, owner):
+    """
+    実体の参照を1つ増やし、既に保存済みならTrueを返す（Falseの場合は呼び出し側で保存してmark_storedを呼ぶ）
+    GCで削除中の場合はBlobBusy
+    """
+    try:
+        response = get_table(table_name).update_item(
+            Key={'id': BLOB_PREFIX + digest},
+            UpdateExpression='ADD #refs :one, #owners :owner SET #size = :size, updated_at = :now',
+            ConditionExpression='attribute_not_exists(gc_started)',
+            ExpressionAttributeNames={'#refs': 'refs', '#owners': 'owners', '#size': 'size'},
+            ExpressionAttributeValues={
+                ':one': 1,
+                ':owner': {owner},
+                ':size': size,
+                ':now': datetime.now().isoformat()
+            },
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise BlobBusy(digest)
+        raise
+    return bool(response.get('Attributes', {}).get('stored'))
+
+def mark_stored(table_name, digest):
+    """実体をS3に保存した"""
+    get_table(table_name).update_item(
+        Key={'id': BLOB_PREFIX + digest},
+        UpdateExpression='SET #stored = :true',
+        ExpressionAttributeNames={'#stored': 'stored'},
+        ExpressionAttributeValues={':true': True}
+    )
+
+def release(table_name, items):
+    """アイテムが参照していた実体の参照数を減らす（確定前・確定処理中の status のあるアイテムは参照を持たない）"""
+    counts = {}
+    for item in items:
+        if item.get('blob') and not item.get('status'):
+            counts[item['blob']] = counts.get(item['blob'], 0) + 1
+    for digest, count in counts.items():
+        _add_refs(table_name, digest, -count)
+
+def _add_refs(table_name, digest, count):
+    get_table(table_name).update_item(
+        Key={'id': BLOB_PREFIX + digest},
+        UpdateExpression='ADD #refs :count SET updated_at = :now',
+        ExpressionAttributeNames={'#refs': 'refs'},
+        ExpressionAttributeValues={':count': count, ':now': datetime.now().isoformat()}
+    )
+
+def reuse(table_name, digest, owner):
+    """
+    所有者が既に参照したことのある保存済みの実体なら参照を増やしてサイズを返す（アップロード不要）
+    ハッシュを知っているだけで他のユーザーのファイルを取得できないように、他の所有者の実体は再利用しない
+    """
+    blob = get_blob(table_name, digest)
+    if not is_available(blob, owner):
+        return None
+    try:
+        stored = acquire(table_name, digest, int(blob['size']), owner)
+    except BlobBusy:
+        return None
+    if not stored:
+        _add_refs(table_name, digest, -1)
+        return None
+    return int(blob['size'])
+
+def store_bytes(settings, owner, content, content_type):
+    """
+    データを実体として保存し、(s3_key, digest) を返す
+    既に同じ内容の実体があればS3には書き込まない。GCと競合した場合は digest を None で返す（呼び出し側で通常のキーに保存）
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    try:
+        stored = acquire(settings.STORAGE_TABLE, digest, len(content), owner)
+    except BlobBusy:
+        return None, None
+    if not stored:
+        get_s3().put_object(
+            Bucket=settings.S3_BUCKET,
+            Key=blob_key(digest),
+            Body=content,
+            ContentType=content_type,
+            ChecksumSHA256=checksum_sha256(digest)
+        )
+        mark_stored(settings.STORAGE_TABLE, digest)
+    return blob_key(digest), digest
+
+def promote(settings, owner, tmp_key, digest, size, fallback_key):
+    """
+    一時的なキーに書き込んだデータを実体にし、(s3_key, digest) を返す
+    既に同じ内容の実体があれば一時的なオブジェクトを捨てるだけにする。GCと競合した場合は fallback_key に移す
+    """
+    s3 = get_s3()
+    bucket_name = settings.S3_BUCKET
+    try:
+        stored = acquire(settings.STORAGE_TABLE, digest, size, owner)
+        target, result = blob_key(digest), (blob_key(digest), digest)
+    except BlobBusy:
+        stored = False
+        target, result = fallback_key, (fallback_key, None)
+    if not stored:
+        s3.copy_object(Bucket=bucket_name, Key=target, CopySource={'Bucket': bucket_name, 'Key': tmp_key}, MetadataDirective='COPY')
+        if result[1]:
+            mark_stored(settings.STORAGE_TABLE, digest)
+    s3.delete_object(Bucket=bucket_name, Key=tmp_key)
+    return result
+
+def verify_uploaded(settings, key, digest):
+    """
+    署名付きURLで一時的なキーにアップロードされたデータのチェックサムを確認してサイズを返す（一致しなければNone）
+    実体のキーに直接アップロードさせると、他のユーザーの実体のハッシュを指定するだけで参照を得られるため、
+    アップロード先はアップロードごとの一時的なキーにして、確認後に promote で実体にする
+    """
+    try:
+        head = get_s3().head_object(Bucket=settings.S3_BUCKET, Key=key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    if head.get('ChecksumSHA256') != checksum_sha256(digest):
+        return None
+    return head['ContentLength']
+
+def collect_garbage(settings, grace=GC_GRACE):
+    """
+    不要になった実体を削除し、削除した件数を返す
+    1. 参照数が0以下のまま猶予を過ぎた blob# のアイテムと実体
+    2. blob# のアイテムがないまま猶予を過ぎた実体（確定されなかった署名付きURLのアップロードなど）
+    """
+    table = get_table(settings.STORAGE_TABLE)
+    s3 = get_s3()
+    bucket_name = settings.S3_BUCKET
+    cutoff = datetime.fromtimestamp(time.time() - grace).isoformat()
+    deleted = 0
+
+    scan_kwargs = {
+        'FilterExpression': Attr('id').begins_with(BLOB_PREFIX) & Attr('refs').lte(0) & Attr('updated_at').lt(cutoff),
+        'ProjectionExpression': 'id'
+    }
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response['Items']:
+            digest = item['id'][len(BLOB_PREFIX):]
+            try:
+                # 以降はacquireが失敗するので、参照が増えることはない
+                table.update_item(
+                    Key={'id': item['id']},
+                    UpdateExpression='SET gc_started = :now',
+                    ConditionExpression='#refs <= :zero',
+                    ExpressionAttributeNames={'#refs': 'refs'},
+                    ExpressionAttributeValues={':now': datetime.now().isoformat(), ':zero': 0}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    continue
+                raise
+            s3.delete_object(Bucket=bucket_name, Key=blob_key(digest))
+            table.delete_item(Key={'id': item['id']})
+            deleted += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    threshold = datetime.fromtimestamp(time.time() - grace, tz=timezone.utc)
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=BLOB_KEY_PREFIX):
+        candidates = {obj['Key'][len(BLOB_KEY_PREFIX):]: obj['Key'] for obj in page.get('Contents', []) if obj['LastModified'] < threshold}
+        if not candidates:
+            continue
+        rows = batch_get_items(settings.STORAGE_TABLE, [{'id': BLOB_PREFIX + digest} for digest in candidates], projection='id')
+        referenced = {row['id'][len(BLOB_PREFIX):] for row in rows}
+        orphans = []
+        for digest, key in candidates.items():
+            if digest in referenced:
+                continue
+            try:
+                # 削除中のアイテムを作り、同時にacquireされないようにする
+                table.put_item(
+                    Item={'id': BLOB_PREFIX + digest, 'refs': 0, 'gc_started': datetime.now().isoformat()},
+                    ConditionExpression='attribute_not_exists(id)'
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    continue
+                raise
+            orphans.append(digest)
+        failed = set(delete_s3_objects(bucket_name, [blob_key(digest) for digest in orphans]))
+        batch_write(settings.STORAGE_TABLE, delete_keys=[{'id': BLOB_PREFIX + digest} for digest in orphans if blob_key(digest) not in failed])
+        deleted += len(orphans) - len(failed)
+
+    logger.info(f"storage gc: deleted {deleted} blobs")
+    return deleted
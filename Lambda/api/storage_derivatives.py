@@ -0,0 +1,110 @@
+"""
+ストレージの画像のサムネイル・プレビュー（派生画像）
+
+アップロードの確定時に schedule で対象のIDを渡してLambda自身を非同期に呼び出し、
+run で元の画像を読み込んで派生画像を derived/{owner}/{id}/{名前}.{拡張子} に保存し、アイテムの derived に記録する
+（元の画像は同時に処理する数ずつ読み込むので、メモリ使用量は thumbnails.pool_size で決まる）
+"""
+import logging
+from botocore.exceptions import ClientError
+from project.aws import get_table, get_s3, invoke_self
+from project.batch import batch_get_items, delete_s3_objects
+from . import thumbnails
+
+logger = logging.getLogger(__name__)
+
+# Lambdaの呼び出しイベントで派生画像の作成を表すキー
+DERIVE_EVENT_KEY = 'storage_derive'
+
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff')
+
+# 派生画像を作成する元の画像の最大サイズ
+MAX_SOURCE_SIZE = 30 * 1024 * 1024
+
+# 1回の呼び出しで処理するアイテム数
+# 派生画像はAPIと同じ関数（512MB・30秒）で作るので、最大サイズの画像でも時間内に終わる数にする
+IDS_PER_INVOCATION = 4
+
+# 残り時間がこれより少なくなったら、残りのアイテムを次の呼び出しに回す（ミリ秒）
+REMAINING_TIME_MARGIN = 10 * 1000
+
+def is_image(item):
+    """派生画像を作成する対象か"""
+    return (
+        item.get('type') == 'file'
+        and 'status' not in item
+        and item.get('mimetype') in IMAGE_TYPES
+        and 0 < int(item.get('size') or 0) <= MAX_SOURCE_SIZE
+    )
+
+def schedule(items):
+    """確定したアイテムのうち画像のものの派生画像の作成を依頼（失敗してもアップロードは失敗させない）"""
+    ids = [item['id'] for item in items if is_image(item)]
+    try:
+        for start in range(0, len(ids), IDS_PER_INVOCATION):
+            invoke_self({DERIVE_EVENT_KEY: {'ids': ids[start:start + IDS_PER_INVOCATION]}})
+    except Exception as e:
+        logger.exception(f"Schedule derivatives error: {e}")
+
+def derived_keys(item):
+    """アイテムの派生画像のS3のキー"""
+    return [variant['key'] for variant in (item.get('derived') or {}).values()]
+
+def run(settings, payload, context=None):
+    """派生画像を作成（lambda_handlerから呼ばれる。残り時間が少なくなったら残りは次の呼び出しに回す）"""
+    if not thumbnails.available():
+        logger.warning("Pillow is not installed; skipping derivatives")
+        return
+    items = batch_get_items(settings.STORAGE_TABLE, [{'id': item_id} for item_id in payload.get('ids', [])])
+    targets = [item for item in items if is_image(item) and not item.get('derived')]
+    if not targets:
+        return
+    s3 = get_s3()
+    workers = min(thumbnails.pool_size(), len(targets))
+    with thumbnails.open_pool(workers) as pool:
+        # 同時に処理する数ずつ読み込む
+        for start in range(0, len(targets), workers):
+            if context is not None and context.get_remaining_time_in_millis() < REMAINING_TIME_MARGIN:
+                schedule(targets[start:])
+                return
+            batch = targets[start:start + workers]
+            sources = [(item['id'], s3.get_object(Bucket=settings.S3_BUCKET, Key=item['s3_key'])['Body'].read()) for item in batch]
+            results = thumbnails.render_many(sources, pool)
+            del sources
+            for item in batch:
+                result = results[item['id']]
+                if isinstance(result, Exception):
+                    logger.warning(f"derivatives for {item['id']} failed: {result}")
+                    continue
+                store(settings, item, result)
+
+def store(settings, item, variants):
+    """派生画像を保存してアイテムに記録（処理中にアイテムが削除・置き換えられていたら保存した派生画像を消す）"""
+    s3 = get_s3()
+    derived = {}
+    for name, variant in variants.items():
+        key = f"derived/{item['owner']}/{item['id']}/{name}.{variant['extension']}"
+        s3.put_object(
+            Bucket=settings.S3_BUCKET,
+            Key=key,
+            Body=variant['data'],
+            ContentType=variant['content_type'],
+            CacheControl='private, max-age=31536000, immutable'
+        )
+        derived[name] = {
+            'key': key,
+            'content_type': variant['content_type'],
+            'width': variant['width'],
+            'height': variant['height']
+        }
+    try:
+        get_table(settings.STORAGE_TABLE).update_item(
+            Key={'id': item['id']},
+            UpdateExpression='SET derived = :derived',
+            ConditionExpression='s3_key = :s3_key',
+            ExpressionAttributeValues={':derived': derived, ':s3_key': item['s3_key']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        delete_s3_objects(settings.S3_BUCKET, [variant['key'] for variant in derived.values()])
@@ -0,0 +1,77 @@
+"""
+ストレージのファイルへの署名付きURLを作成する
+
+STORAGE_CDN_DOMAIN と STORAGE_CDN_KEY_PAIR_ID が設定されていればCloudFrontの署名付きURL、
+それ以外はS3の署名付きURLを返す
+"""
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, urlencode
+from project.aws import get_s3, get_client
+
+logger = logging.getLogger(__name__)
+
+_signer = None
+_signer_lock = threading.Lock()
+
+def content_disposition(filename, disposition='attachment'):
+    """日本語のファイル名にも対応したContent-Dispositionを作成（RFC 6266）"""
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('"', '_').replace('?', '_')
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def download_url(settings, item, disposition='attachment', expires_in=300):
+    """アイテムのダウンロード用の短期間有効なURLを作成"""
+    return _signed_url(settings, item['s3_key'], {
+        'ResponseContentDisposition': content_disposition(item.get('name', 'download'), disposition),
+        'ResponseContentType': item.get('mimetype') or 'application/octet-stream'
+    }, expires_in)
+
+def variant_url(settings, variant, expires_in=3600):
+    """派生画像（サムネイルなど）の表示用のURLを作成"""
+    return _signed_url(settings, variant['key'], {}, expires_in)
+
+def _signed_url(settings, key, response_params, expires_in):
+    signer = _cloudfront_signer(settings)
+    if signer is not None:
+        url = f"https://{settings.STORAGE_CDN_DOMAIN}/{quote(key)}"
+        if response_params:
+            url += '?' + urlencode({
+                'response-content-disposition': response_params['ResponseContentDisposition'],
+                'response-content-type': response_params['ResponseContentType']
+            }, quote_via=quote)
+        expires = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+        return signer.generate_presigned_url(url, date_less_than=expires)
+    return get_s3().generate_presigned_url('get_object', Params={
+        'Bucket': settings.S3_BUCKET,
+        'Key': key,
+        **response_params
+    }, ExpiresIn=expires_in)
+
+def _cloudfront_signer(settings):
+    """CloudFrontの署名器を取得（未設定またはcryptographyがない場合はNone）"""
+    global _signer
+    if not settings.STORAGE_CDN_DOMAIN or not settings.STORAGE_CDN_KEY_PAIR_ID:
+        return None
+    if _signer is None:
+        with _signer_lock:
+            if _signer is None:
+                _signer = _build_cloudfront_signer(settings) or False
+    return _signer or None
+
+def _build_cloudfront_signer(settings):
+    try:
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import padding
+    except ImportError:
+        logger.warning("cryptography is not installed; falling back to S3 presigned URLs")
+        return None
+    from botocore.signers import CloudFrontSigner
+
+    parameter = get_client('ssm').get_parameter(Name=settings.STORAGE_CDN_PRIVATE_KEY_PARAMETER, WithDecryption=True)
+    private_key = serialization.load_pem_private_key(parameter['Parameter']['Value'].encode('utf-8'), password=None)
+
+    def rsa_signer(message):
+        return private_key.sign(message, padding.PKCS1v15(), hashes.SHA1())
+
+    return CloudFrontSigner(settings.STORAGE_CDN_KEY_PAIR_ID, rsa_signer)
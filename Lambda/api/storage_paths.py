@@ -0,0 +1,60 @@
+"""
+ストレージのパス
+
+アイテムの path は親フォルダのパス（"/" または "/a/b" の形式、末尾の "/" なし）で、
+フォルダ自身の配下のパスは join_path(folder['path'], folder['name']) になる
+"""
+
+class InvalidPath(ValueError):
+    """パスまたは名前が不正"""
+
+def normalize_path(path):
+    """'a//b/' のようなパスを '/a/b' に正規化（'.' や '..' を含むパスはInvalidPath）"""
+    if path is None:
+        return '/'
+    if not isinstance(path, str):
+        raise InvalidPath("path must be a string")
+    segments = [segment for segment in path.split('/') if segment]
+    if any(segment in ('.', '..') for segment in segments):
+        raise InvalidPath(f"invalid path: {path}")
+    return '/' + '/'.join(segments)
+
+def validate_name(name):
+    """ファイル名・フォルダ名を検証して返す"""
+    if not isinstance(name, str) or not name.strip() or '/' in name or name in ('.', '..'):
+        raise InvalidPath(f"invalid name: {name}")
+    return name
+
+def join_path(path, name):
+    """親フォルダのパスと名前から配下のパスを作成"""
+    return path.rstrip('/') + '/' + name
+
+def is_within(path, root):
+    """path が root 自身またはその配下か"""
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+def rebase_path(path, old_root, new_root):
+    """old_root 配下のパスを new_root 配下に付け替える"""
+    if path == old_root:
+        return new_root
+    return new_root.rstrip('/') + path[len(old_root):]
+
+def subtree_range(root):
+    """root 以下のパスを含むソートキーの範囲（DynamoDBの between 用）"""
+    # 文字列はUTF-8のバイト順で比較されるので、U+10FFFFはどのパスよりも後ろになる
+    return root, root.rstrip('/') + '/\U0010ffff'
+
+def parent_key(owner, path):
+    """ParentIndexのパーティションキー（所有者とフォルダごと）"""
+    return f"{owner}#{path}"
+
+def name_key(item_type, name):
+    """ParentIndexのソートキー（フォルダを先に、名前は大文字小文字を区別せずに並べる）"""
+    return f"{0 if item_type == 'folder' else 1}#{name.casefold()}"
+
+def index_attributes(item):
+    """アイテムの owner / path / type / name から ParentIndex 用の属性を作成"""
+    return {
+        'parent': parent_key(item['owner'], item.get('path') or '/'),
+        'name_key': name_key(item.get('type', 'file'), item.get('name') or '')
+    }
@@ -0,0 +1,221 @@
+"""
+フォルダ配下（サブツリー）の再帰的な削除・移動
+
+OwnerPathIndex を path の範囲でページごとに読み、配下のアイテムは BatchGetItem / BatchWriteItem /
+S3 DeleteObjects でまとめて処理する。配下のアイテムが多い場合は最初のページだけを処理してジョブを登録し、
+残りはLambdaを非同期に呼び出して処理する（進捗はStorageTableのジョブのアイテムに記録する）
+"""
+import logging
+import time
+import uuid
+from datetime import datetime
+from boto3.dynamodb.conditions import Key
+from project.aws import get_table, get_s3, invoke_self
+from project.batch import batch_get_items, batch_write, delete_s3_objects
+from .storage_usage import record_usage
+from . import storage_blobs, storage_derivatives
+from .storage_paths import join_path, is_within, rebase_path, subtree_range, index_attributes
+
+logger = logging.getLogger(__name__)
+
+# 1回のQueryで読むアイテム数
+PAGE_SIZE = 500
+
+# ジョブのアイテムのIDの接頭辞（pathを持たないのでOwnerPathIndexには現れない）
+JOB_PREFIX = 'job-'
+
+# Lambdaの呼び出しイベントでジョブを表すキー
+JOB_EVENT_KEY = 'storage_job'
+
+# 残り時間が（これまでで最も遅かったページの処理時間 × この倍率）を下回ったら次の呼び出しに引き継ぐ
+HANDOFF_FACTOR = 2
+
+# ジョブのアイテムを残しておく期間（秒、StorageTableのTTLで削除される）
+JOB_RETENTION = 7 * 24 * 60 * 60
+
+def folder_root(folder):
+    """フォルダの配下のアイテムが持つパス"""
+    return join_path(folder.get('path') or '/', folder['name'])
+
+def query_subtree_page(table_name, owner, root, cursor=None, limit=PAGE_SIZE):
+    """root 以下のアイテムを1ページ分取得し、(アイテム, 次のページのカーソル) を返す"""
+    start, end = subtree_range(root)
+    params = {
+        'IndexName': 'OwnerPathIndex',
+        'KeyConditionExpression': Key('owner').eq(owner) & Key('path').between(start, end),
+        'Limit': limit
+    }
+    if cursor:
+        params['ExclusiveStartKey'] = cursor
+    response = get_table(table_name).query(**params)
+    # "/docs-old" のような root で始まる別のフォルダを除外（キー属性はFilterExpressionに使えない）
+    items = [item for item in response['Items'] if is_within(item['path'], root)]
+    return items, response.get('LastEvaluatedKey')
+
+def delete_items(settings, items):
+    """
+    アイテムをまとめて削除し、(削除したID, S3から削除できなかったID) を返す
+    ファイルのS3オブジェクトを先に削除し、削除できたものだけDynamoDBから削除する
+    """
+    s3 = get_s3()
+    bucket_name = settings.S3_BUCKET
+    s3_keys = []
+    for item in items:
+        if item.get('blob') and not item.get('status'):
+            # 重複排除の実体は他のアイテムと共有されるので、参照を減らすだけにする（確定前は一時的なキーを削除する）
+            continue
+        if item.get('type') == 'file' and item.get('s3_key'):
+            if item.get('upload_id'):
+                # 確定前のマルチパートアップロードは中止する
+                s3.abort_multipart_upload(Bucket=bucket_name, Key=item['s3_key'], UploadId=item['upload_id'])
+            s3_keys.append(item['s3_key'])
+    s3_errors = set(delete_s3_objects(bucket_name, s3_keys))
+
+    deleted = []
+    failed = []
+    for item in items:
+        if item.get('s3_key') in s3_errors:
+            failed.append(item['id'])
+        else:
+            deleted.append(item['id'])
+    batch_write(settings.STORAGE_TABLE, delete_keys=[{'id': item_id} for item_id in deleted])
+    # 派生画像は削除できなくてもアイテムの削除は失敗させない
+    deleted_ids = set(deleted)
+    delete_s3_objects(bucket_name, [key for item in items if item['id'] in deleted_ids for key in storage_derivatives.derived_keys(item)])
+    storage_blobs.release(settings.STORAGE_TABLE, [item for item in items if item.get('blob')])
+    record_usage(settings.STORAGE_TABLE, removed=[item for item in items if item.get('s3_key') not in s3_errors])
+    return deleted, failed
+
+def move_items(settings, items, old_root, new_root):
+    """
+    old_root 配下のアイテムのパスを new_root 配下に付け替え、付け替えた件数を返す
+    GSIの結果は古い場合があるので、強い整合性で読み直してから書き込む（移動済みのアイテムは対象外）
+    """
+    current = batch_get_items(settings.STORAGE_TABLE, [{'id': item['id']} for item in items])
+    now = datetime.now().isoformat()
+    moved = []
+    previous = []
+    for item in current:
+        if item.get('path') is None or not is_within(item['path'], old_root):
+            continue
+        previous.append(dict(item))
+        item['path'] = rebase_path(item['path'], old_root, new_root)
+        item.update(index_attributes(item))
+        item['updated_at'] = now
+        moved.append(item)
+    batch_write(settings.STORAGE_TABLE, put_items=moved)
+    record_usage(settings.STORAGE_TABLE, added=moved, removed=previous)
+    return len(moved)
+
+def process_page(settings, job, items):
+    """ジョブの1ページ分を処理し、(処理した件数, 失敗した件数) を返す"""
+    if job['operation'] == 'delete':
+        deleted, failed = delete_items(settings, items)
+        return len(deleted), len(failed)
+    return move_items(settings, items, job['root'], job['new_root']), 0
+
+def finish(settings, job):
+    """配下のアイテムをすべて処理した後の仕上げ"""
+    if job['operation'] == 'delete' and not job.get('failed'):
+        # 配下をすべて削除できた場合だけフォルダ自身を削除する（失敗した場合はやり直せるように残す）
+        get_table(settings.STORAGE_TABLE).delete_item(Key={'id': job['folder_id']})
+
+def run_folder_operation(settings, owner, folder, operation, new_root=None):
+    """
+    フォルダの削除・移動を開始
+    配下が1ページに収まればその場で完了してジョブの内容を返し、収まらなければ最初のページを処理した後に
+    残りを非同期のジョブに引き継ぐ（戻り値の status が 'running'）
+    """
+    now = datetime.now().isoformat()
+    job = {
+        'id': JOB_PREFIX + str(uuid.uuid4()),
+        'type': 'job',
+        'owner': owner,
+        'operation': operation,
+        'folder_id': folder['id'],
+        'root': folder_root(folder),
+        'status': 'running',
+        'processed': 0,
+        'failed': 0,
+        'created_at': now,
+        'updated_at': now,
+        'expires_at': int(time.time()) + JOB_RETENTION
+    }
+    if new_root is not None:
+        job['new_root'] = new_root
+
+    items, cursor = query_subtree_page(settings.STORAGE_TABLE, owner, job['root'])
+    processed, failed = process_page(settings, job, items)
+    job['processed'] += processed
+    job['failed'] += failed
+
+    if cursor is None:
+        finish(settings, job)
+        job['status'] = 'done'
+        return job
+
+    get_table(settings.STORAGE_TABLE).put_item(Item=job)
+    invoke_job(job['id'], cursor)
+    return job
+
+def invoke_job(job_id, cursor):
+    """このLambda自身を非同期に呼び出してジョブの続きを処理する"""
+    invoke_self({JOB_EVENT_KEY: {'id': job_id, 'cursor': cursor}})
+
+def get_job(settings, job_id):
+    """ジョブのアイテムを取得（存在しなければNone）"""
+    if not job_id.startswith(JOB_PREFIX):
+        return None
+    return get_table(settings.STORAGE_TABLE).get_item(Key={'id': job_id}, ConsistentRead=True).get('Item')
+
+def run_job(settings, payload, context):
+    """非同期に呼び出されたジョブを処理（lambda_handlerから呼ばれる）"""
+    table = get_table(settings.STORAGE_TABLE)
+    job_id = payload['id']
+    cursor = payload.get('cursor')
+    job = get_job(settings, job_id)
+    if job is None or job.get('status') != 'running':
+        logger.warning(f"storage job {job_id} is not running")
+        return
+
+    slowest = 0
+    try:
+        while cursor:
+            started = time.perf_counter()
+            items, cursor = query_subtree_page(settings.STORAGE_TABLE, job['owner'], job['root'], cursor)
+            processed, failed = process_page(settings, job, items)
+            job['failed'] += failed
+            table.update_item(
+                Key={'id': job_id},
+                UpdateExpression='ADD processed :processed, failed :failed SET updated_at = :now',
+                ExpressionAttributeValues={
+                    ':processed': processed,
+                    ':failed': failed,
+                    ':now': datetime.now().isoformat()
+                }
+            )
+            slowest = max(slowest, (time.perf_counter() - started) * 1000)
+            if cursor and context.get_remaining_time_in_millis() < slowest * HANDOFF_FACTOR:
+                invoke_job(job_id, cursor)
+                return
+
+        finish(settings, job)
+        status = 'done'
+        error = None
+    except Exception as e:
+        # 非同期呼び出しの自動再試行ではなく、クライアントに操作をやり直してもらう
+        logger.exception(f"storage job {job_id} failed: {e}")
+        status = 'failed'
+        error = str(e)
+
+    update = 'SET #status = :status, updated_at = :now'
+    values = {':status': status, ':now': datetime.now().isoformat()}
+    if error:
+        update += ', #error = :error'
+        values[':error'] = error
+    table.update_item(
+        Key={'id': job_id},
+        UpdateExpression=update,
+        ExpressionAttributeNames={'#status': 'status', '#error': 'error'} if error else {'#status': 'status'},
+        ExpressionAttributeValues=values
+    )
@@ -1,13 +1,16 @@
-from hadx.urls import Path, Router
-from .storage_views import (
-    storage_items_handler, storage_upload_handler, storage_folder_handler,
-    download_file, delete_item
-)
+from project.routing import LazyPath
 
 urlpatterns = [
-    Path("items", storage_items_handler, name="storage_items_handler"),       # GET /api/storage/items
-    Path("upload", storage_upload_handler, name="storage_upload_handler"),    # POST /api/storage/upload
-    Path("folder", storage_folder_handler, name="storage_folder_handler"),    # POST /api/storage/folder
-    Path("download/{item_id}", download_file, name="download_file"),      # GET /api/storage/download/{item_id}
-    Path("item/{item_id}", delete_item, name="delete_item"),              # DELETE /api/storage/item/{item_id}
-] 
\ No newline at end of file
+    LazyPath("items", "api.storage_views.storage_items_handler", name="storage_items_handler"),       # GET /api/storage/items
+    LazyPath("upload", "api.storage_views.storage_upload_handler", name="storage_upload_handler"),    # POST /api/storage/upload
+    LazyPath("upload/{item_id}/commit", "api.storage_views.storage_commit_handler", name="storage_commit_handler"),  # POST /api/storage/upload/{item_id}/commit
+    LazyPath("folder", "api.storage_views.storage_folder_handler", name="storage_folder_handler"),    # POST /api/storage/folder
+    LazyPath("bulk/upload", "api.storage_views.storage_bulk_upload_handler", name="storage_bulk_upload_handler"),  # POST /api/storage/bulk/upload
+    LazyPath("bulk/commit", "api.storage_views.storage_bulk_commit_handler", name="storage_bulk_commit_handler"),  # POST /api/storage/bulk/commit
+    LazyPath("bulk/delete", "api.storage_views.storage_bulk_delete_handler", name="storage_bulk_delete_handler"),  # POST /api/storage/bulk/delete
+    LazyPath("download/{item_id}", "api.storage_views.download_file", name="download_file"),      # GET /api/storage/download/{item_id}
+    LazyPath("item/{item_id}", "api.storage_views.delete_item", name="delete_item"),              # DELETE /api/storage/item/{item_id}
+    LazyPath("item/{item_id}/move", "api.storage_views.storage_move_handler", name="storage_move_handler"),  # POST /api/storage/item/{item_id}/move
+    LazyPath("usage", "api.storage_views.storage_usage_handler", name="storage_usage_handler"),     # GET /api/storage/usage
+    LazyPath("jobs/{job_id}", "api.storage_views.storage_job_handler", name="storage_job_handler"),  # GET /api/storage/jobs/{job_id}
+] 
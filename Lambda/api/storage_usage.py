@@ -0,0 +1,169 @@
+"""
+ストレージの使用量（バイト数・ファイル数）のカウンター
+
+所有者・フォルダごとのカウンターをStorageTableの usage#{owner}#{path} のアイテムに持ち、
+ファイルの追加・削除・移動のたびに祖先のフォルダすべてのカウンターをADDで増減する（path='/' が所有者の合計）。
+確定前のアップロードは合計のカウンターの reserved に計上し、容量の上限の判定に含める。
+合計のカウンターは上限の判定用に charged_bytes（bytes + reserved）・charged_files（確定済みと確定前のファイル数）も持ち、
+アップロードの前に reserve_quota が条件付きのADDで枠を確保する（確認と確保の間に他のアップロードが割り込まない）
+カウンターは scripts/reconcile_storage_usage.py で作り直せる
+"""
+import logging
+from datetime import datetime
+from botocore.exceptions import ClientError
+from project.aws import get_table
+
+logger = logging.getLogger(__name__)
+
+USAGE_PREFIX = 'usage#'
+
+class QuotaExceeded(Exception):
+    """容量またはファイル数の上限を超える"""
+
+def usage_id(owner, path='/'):
+    """カウンターのアイテムのID"""
+    return f"{USAGE_PREFIX}{owner}#{path}"
+
+def ancestors(path):
+    """path とその祖先のフォルダのパス（'/a/b' -> ['/', '/a', '/a/b']）"""
+    paths = ['/']
+    current = ''
+    for segment in (path or '/').split('/'):
+        if segment:
+            current += '/' + segment
+            paths.append(current)
+    return paths
+
+def item_deltas(items, sign=1):
+    """
+    アイテムの追加（sign=1）・削除（sign=-1）によるカウンターの増減を集計
+    確定済みのファイルは祖先のフォルダの bytes / files、確定前・確定処理中（status のある）ファイルは合計の reserved に計上する
+    どちらも合計の charged_bytes / charged_files に含める
+    """
+    deltas = {}
+    for item in items:
+        if item.get('type') != 'file':
+            continue
+        size = int(item.get('size') or 0) * sign
+        _add(deltas, (item['owner'], '/'), charged_bytes=size, charged_files=sign)
+        if item.get('status'):
+            _add(deltas, (item['owner'], '/'), reserved=size)
+            continue
+        for path in ancestors(item.get('path')):
+            _add(deltas, (item['owner'], path), bytes=size, files=sign)
+    return deltas
+
+def merge_deltas(*deltas_list):
+    """増減を合算（打ち消し合ってゼロになったものは除く）"""
+    merged = {}
+    for deltas in deltas_list:
+        for key, values in deltas.items():
+            _add(merged, key, **values)
+    return {key: values for key, values in merged.items() if any(values.values())}
+
+def _add(deltas, key, **values):
+    counter = deltas.setdefault(key, {})
+    for name, value in values.items():
+        counter[name] = counter.get(name, 0) + value
+
+def apply_deltas(table_name, deltas):
+    """カウンターをADDで増減（件数は増減のあったフォルダの数）"""
+    table = get_table(table_name)
+    now = datetime.now().isoformat()
+    for (owner, path), values in deltas.items():
+        values = {name: value for name, value in values.items() if value}
+        if not values:
+            continue
+        # owner / path はOwnerPathIndexに載らないように別名で持つ
+        table.update_item(
+            Key={'id': usage_id(owner, path)},
+            UpdateExpression='ADD ' + ', '.join(f"#{name} :{name}" for name in values) +
+                             ' SET usage_owner = :owner, usage_path = :path, updated_at = :now',
+            ExpressionAttributeNames={f"#{name}": name for name in values},
+            ExpressionAttributeValues={
+                **{f":{name}": value for name, value in values.items()},
+                ':owner': owner,
+                ':path': path,
+                ':now': now
+            }
+        )
+
+def reservation_deltas(reservations, sign=1):
+    """reserve_quota で確保した枠によるカウンターの増減"""
+    deltas = {}
+    for reservation in reservations:
+        size = reservation['size'] * sign
+        _add(deltas, (reservation['owner'], '/'),
+             reserved=size, charged_bytes=size, charged_files=reservation['files'] * sign)
+    return deltas
+
+def record_usage(table_name, added=(), removed=(), reservations=()):
+    """
+    アイテムの追加・削除をカウンターに反映（失敗してもリクエストは失敗させず、照合スクリプトで直す）
+    reservations は追加したアイテムの分として確保済みの枠で、アイテムの分に置き換える
+    （確定前のアイテムと同じサイズの枠なら打ち消し合って書き込みはない）
+    """
+    try:
+        apply_deltas(table_name, merge_deltas(
+            item_deltas(added), item_deltas(removed, -1), reservation_deltas(reservations, -1)
+        ))
+    except Exception as e:
+        logger.exception(f"Record usage error: {e}")
+
+def release_quota(table_name, *reservations):
+    """アップロードに失敗した場合などに、確保した枠を戻す（失敗しても照合スクリプトで直す）"""
+    try:
+        apply_deltas(table_name, merge_deltas(reservation_deltas(reservations, -1)))
+    except Exception as e:
+        logger.exception(f"Release usage error: {e}")
+
+def get_usage(table_name, owner, path='/'):
+    """カウンターを取得（まだない場合は0）"""
+    item = get_table(table_name).get_item(Key={'id': usage_id(owner, path)}).get('Item') or {}
+    return {
+        'bytes': max(0, int(item.get('bytes', 0))),
+        'files': max(0, int(item.get('files', 0))),
+        'reserved': max(0, int(item.get('reserved', 0)))
+    }
+
+def reserve_quota(settings, owner, size, files=1):
+    """
+    size バイト・files 件の枠を合計のカウンターに条件付きのADDで確保し、確保した枠を返す
+    上限を超える場合は何も書き込まずにQuotaExceeded（上限が0なら無制限で、枠は常に確保できる）
+    確保した枠は record_usage(reservations=...) でアイテムの分に置き換えるか、release_quota で戻す
+    """
+    quota_bytes = settings.STORAGE_QUOTA_BYTES
+    quota_files = settings.STORAGE_QUOTA_FILES
+    if (quota_bytes and size > quota_bytes) or (quota_files and files > quota_files):
+        raise QuotaExceeded(f"{owner}: {size} bytes / {files} files exceeds the quota")
+    
+    # 条件式では加算ができないため、上限から今回の分を引いた値と比較する
+    conditions = []
+    values = {}
+    if quota_bytes:
+        conditions.append("(attribute_not_exists(charged_bytes) OR charged_bytes <= :max_bytes)")
+        values[':max_bytes'] = quota_bytes - size
+    if quota_files:
+        conditions.append("(attribute_not_exists(charged_files) OR charged_files <= :max_files)")
+        values[':max_files'] = quota_files - files
+    kwargs = {'ConditionExpression': ' AND '.join(conditions)} if conditions else {}
+    try:
+        get_table(settings.STORAGE_TABLE).update_item(
+            Key={'id': usage_id(owner)},
+            UpdateExpression='ADD reserved :size, charged_bytes :size, charged_files :files'
+                             ' SET usage_owner = :owner, usage_path = :path, updated_at = :now',
+            ExpressionAttributeValues={
+                ':size': size,
+                ':files': files,
+                ':owner': owner,
+                ':path': '/',
+                ':now': datetime.now().isoformat(),
+                **values
+            },
+            **kwargs
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            raise QuotaExceeded(f"{owner}: {size} bytes / {files} files exceeds the quota")
+        raise
+    return {'owner': owner, 'size': size, 'files': files}
@@ -1,24 +1,70 @@
-from hadx.shortcuts import json_response
-import json
+from project.serializers import json_response
 import logging
-import boto3
+import time
 import uuid
 import base64
 import mimetypes
 from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import os
+from project.aws import get_table, get_s3
+from project.pagination import encode_cursor, decode_cursor, parse_limit, InvalidCursor
+from project.http_body import json_body
+from project.batch import batch_get_items, batch_write, delete_s3_objects
+from .storage_links import download_url, variant_url, content_disposition
+from .multipart import MultipartParser, MultipartError, get_boundary, iter_event_body
+from .storage_writer import S3StreamWriter
+from .storage_paths import InvalidPath, normalize_path, validate_name, join_path, is_within, parent_key, name_key, subtree_range
+from .storage_tree import run_folder_operation, folder_root, delete_items, get_job
+from .storage_usage import QuotaExceeded, reserve_quota, release_quota, record_usage, get_usage
+from . import storage_blobs, storage_derivatives
 
 logger = logging.getLogger(__name__)
 
-def get_dynamodb():
-    """DynamoDBクライアントを取得"""
-    return boto3.resource('dynamodb', region_name='ap-northeast-1')
+# 署名付きURLの有効期限（秒）
+UPLOAD_URL_EXPIRES = 3600
 
-def get_s3():
-    """S3クライアントを取得"""
-    return boto3.client('s3', region_name='ap-northeast-1')
+# このサイズを超えるファイルはマルチパートアップロードにする
+MULTIPART_THRESHOLD = 100 * 1024 * 1024
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+# 確定処理中（status = committing）のまま残ったアップロード（Lambdaのタイムアウトなど）を再び確定できるまでの秒数
+COMMIT_CLAIM_TIMEOUT = 300
+
+# 確定されないまま残った確定前のアップロードを削除するまでの、アップロード先の有効期限からの猶予（秒）
+# 一時的なキー・マルチパートのパートもS3のライフサイクルルールで1日後に削除されるので、それ以降は確定できない
+PENDING_UPLOAD_GRACE = 24 * 60 * 60
+
+# ダウンロード用の署名付きURLの有効期限（秒）
+DOWNLOAD_URL_EXPIRES = 300
+
+# Lambda経由で返せるファイルサイズの上限（base64エンコード後にAPI Gatewayの上限6MBに収まるサイズ）
+PROXY_DOWNLOAD_MAX_SIZE = 4 * 1024 * 1024
+
+# multipart/form-data のファイル以外のフィールドの最大サイズ
+MAX_FORM_FIELD_SIZE = 64 * 1024
+
+# 一覧で返す属性と、アイテムにない場合の値
+LISTING_FIELDS = ('id', 'name', 'type', 'path', 'size', 'mimetype', 'created_at', 'updated_at', 'owner', 'thumbnail_url', 'preview_url')
+LISTING_DEFAULTS = {'type': 'file', 'size': 0, 'mimetype': ''}
+
+# 派生画像のURLを返す項目（項目名: 派生画像の名前）
+LISTING_VARIANTS = {'thumbnail_url': 'thumb', 'preview_url': 'preview'}
+LISTING_SORTS = ('name', '-name', 'updated_at', '-updated_at', 'size', '-size')
+
+# 一覧の1ページの件数（mode=children / mode=tree）
+LISTING_LIMIT_DEFAULT = 100
+LISTING_LIMIT_MAX = 1000
+TREE_LIMIT_DEFAULT = 1000
+TREE_LIMIT_MAX = 1000
+
+# 一括操作で1リクエストに指定できる件数
+BULK_MAX_ITEMS = 1000
+BULK_MAX_UPLOADS = 100
+BULK_COMMIT_CONCURRENCY = 8
 
 def storage_items_handler(master):
     """
@@ -50,6 +96,21 @@ def storage_upload_handler(master):
             "error_code": "METHOD_NOT_ALLOWED"
         }, code=405)
 
+def storage_commit_handler(master, item_id):
+    """
+    アップロードの確定（POST /api/storage/upload/{item_id}/commit）
+    """
+    method = master.event.get('httpMethod', 'POST')
+    
+    if method == 'POST':
+        return commit_upload(master, item_id)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
 def storage_folder_handler(master):
     """
     フォルダ作成（POST /api/storage/folder）
@@ -65,10 +126,103 @@ def storage_folder_handler(master):
             "error_code": "METHOD_NOT_ALLOWED"
         }, code=405)
 
+def storage_bulk_delete_handler(master):
+    """
+    一括削除（POST /api/storage/bulk/delete）
+    """
+    method = master.event.get('httpMethod', 'POST')
+    
+    if method == 'POST':
+        return bulk_delete_items(master)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
+def storage_bulk_upload_handler(master):
+    """
+    一括アップロードの開始（POST /api/storage/bulk/upload）
+    """
+    method = master.event.get('httpMethod', 'POST')
+    
+    if method == 'POST':
+        return bulk_create_upload_sessions(master)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
+def storage_bulk_commit_handler(master):
+    """
+    一括アップロードの確定（POST /api/storage/bulk/commit）
+    """
+    method = master.event.get('httpMethod', 'POST')
+    
+    if method == 'POST':
+        return bulk_commit_uploads(master)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
+def storage_move_handler(master, item_id):
+    """
+    ファイル・フォルダの移動・名前変更（POST /api/storage/item/{item_id}/move）
+    """
+    method = master.event.get('httpMethod', 'POST')
+    
+    if method == 'POST':
+        return move_item(master, item_id)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
+def storage_job_handler(master, job_id):
+    """
+    フォルダの削除・移動のジョブの進捗（GET /api/storage/jobs/{job_id}）
+    """
+    method = master.event.get('httpMethod', 'GET')
+    
+    if method == 'GET':
+        return get_storage_job(master, job_id)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
+def storage_usage_handler(master):
+    """
+    使用量の取得（GET /api/storage/usage）
+    """
+    method = master.event.get('httpMethod', 'GET')
+    
+    if method == 'GET':
+        return get_storage_usage(master)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
 def get_storage_items(master):
     """
     ファイル・フォルダ一覧取得
-    GET /api/storage/items?path=/
+    GET /api/storage/items?path=/&mode=children&sort=name&limit=100&fields=id,name,type&next=...
+    mode=children: pathの直下のアイテムのみ（ParentIndex。sortはname/-name/updated_at/-updated_at/size/-size）
+    mode=tree（既定）: path以下のすべてのアイテム（OwnerPathIndex、パス順）
+    続きがある場合はレスポンスのnextをクエリパラメータnextに指定する
     """
     if not master.request.auth:
         return json_response(master, {
@@ -79,36 +233,44 @@ def get_storage_items(master):
     
     try:
         username = master.request.decode_token.get('cognito:username')
-        path = master.request.query_params.get('path', '/')
-        
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.STORAGE_TABLE)
+        params = master.request.query_params
+        mode = params.get('mode', 'tree')
+        sort = params.get('sort', 'name')
+        try:
+            path = normalize_path(params.get('path', '/'))
+            fields = parse_listing_fields(params.get('fields'))
+            cursor = decode_cursor(params.get('next'))
+        except ValueError:
+            return json_response(master, {
+                "success": False,
+                "message": "path・fields・nextの値が不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        if mode not in ('children', 'tree') or sort not in LISTING_SORTS:
+            return json_response(master, {
+                "success": False,
+                "message": "modeまたはsortの値が不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
         
-        # ユーザーのファイル一覧を取得
-        response = table.query(
-            IndexName='OwnerPathIndex',
-            KeyConditionExpression=Key('owner').eq(username) & Key('path').begins_with(path)
-        )
+        table = get_table(master.settings.STORAGE_TABLE)
         
-        items = []
-        for item in response['Items']:
-            items.append({
-                'id': item.get('id'),
-                'name': item.get('name'),
-                'type': item.get('type', 'file'),
-                'path': item.get('path'),
-                'size': item.get('size', 0),
-                'mimetype': item.get('mimetype', ''),
-                'created_at': item.get('created_at'),
-                'updated_at': item.get('updated_at'),
-                'owner': item.get('owner')
-            })
+        if mode == 'children':
+            limit = parse_limit(params.get('limit'), LISTING_LIMIT_DEFAULT, LISTING_LIMIT_MAX)
+            if sort.lstrip('-') == 'name':
+                items, cursor = list_children_by_name(table, username, path, fields, limit, cursor, descending=sort == '-name')
+            else:
+                items, cursor = list_children_sorted(table, username, path, fields, limit, cursor, sort)
+        else:
+            limit = parse_limit(params.get('limit'), TREE_LIMIT_DEFAULT, TREE_LIMIT_MAX)
+            items, cursor = list_subtree(table, username, path, fields, limit, cursor)
         
         return json_response(master, {
             "success": True,
             "data": {
-                "items": items,
-                "total": len(items)
+                "items": [to_listing_item(master, item, fields) for item in items],
+                "total": len(items),
+                "next": encode_cursor(cursor)
             }
         })
         
@@ -120,10 +282,113 @@ def get_storage_items(master):
             "error_code": "INTERNAL_ERROR"
         }, code=500)
 
+def parse_listing_fields(value):
+    """fieldsパラメータを検証（idは常に含める）"""
+    if not value:
+        return LISTING_FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if any(field not in LISTING_FIELDS for field in fields):
+        raise ValueError(f"invalid fields: {value}")
+    return tuple(dict.fromkeys(['id'] + fields))
+
+def listing_projection(fields, extra=()):
+    """一覧で読む属性のProjectionExpression"""
+    names = dict.fromkeys(['derived' if field in LISTING_VARIANTS else field for field in fields] + list(extra))
+    return {
+        'ProjectionExpression': ', '.join(f"#{name}" for name in names),
+        'ExpressionAttributeNames': {f"#{name}": name for name in names}
+    }
+
+def to_listing_item(master, item, fields):
+    """一覧のレスポンス用の表現（派生画像があればその署名付きURLを含める）"""
+    listing = {}
+    for field in fields:
+        if field in LISTING_VARIANTS:
+            variant = (item.get('derived') or {}).get(LISTING_VARIANTS[field])
+            listing[field] = variant_url(master.settings, variant) if variant else None
+        else:
+            listing[field] = item.get(field, LISTING_DEFAULTS.get(field))
+    return listing
+
+def query_listing(table, query, limit, start_key=None, keep=None):
+    """
+    フィルター付きのQueryでlimit件になるまでページを読み、(アイテム, 次のページのLastEvaluatedKey) を返す
+    Limitはフィルター前の件数に掛かるので、残りの件数だけを読むことで取りすぎないようにする
+    keepはキー属性の条件など、FilterExpressionに書けない条件
+    """
+    items = []
+    while len(items) < limit:
+        if start_key:
+            query['ExclusiveStartKey'] = start_key
+        response = table.query(Limit=limit - len(items), **query)
+        items.extend(item for item in response['Items'] if keep is None or keep(item))
+        start_key = response.get('LastEvaluatedKey')
+        if not start_key:
+            break
+    return items, start_key
+
+def list_children_by_name(table, username, path, fields, limit, cursor, descending=False):
+    """フォルダの直下を名前順に1ページ分取得（フォルダが先）"""
+    query = {
+        'IndexName': 'ParentIndex',
+        'KeyConditionExpression': Key('parent').eq(parent_key(username, path)),
+        # アップロード確定前のファイルは除外
+        'FilterExpression': Attr('status').not_exists(),
+        'ScanIndexForward': not descending,
+        **listing_projection(fields)
+    }
+    items, last_key = query_listing(table, query, limit, (cursor or {}).get('key'))
+    return items, {'key': last_key} if last_key else None
+
+def list_children_sorted(table, username, path, fields, limit, cursor, sort):
+    """
+    フォルダの直下を更新日時・サイズ順に1ページ分取得
+    インデックスがないのでフォルダの直下をすべて読んで並べ替える（コストはフォルダ内の件数に比例）
+    """
+    key = sort.lstrip('-')
+    query = {
+        'IndexName': 'ParentIndex',
+        'KeyConditionExpression': Key('parent').eq(parent_key(username, path)),
+        'FilterExpression': Attr('status').not_exists(),
+        **listing_projection(fields, extra=(key,))
+    }
+    items = []
+    while True:
+        response = table.query(**query)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    items.sort(key=lambda item: (item.get(key, LISTING_DEFAULTS.get(key, '')), item['id']), reverse=sort.startswith('-'))
+    offset = int((cursor or {}).get('offset', 0))
+    page = items[offset:offset + limit]
+    return page, {'offset': offset + limit} if offset + limit < len(items) else None
+
+def list_subtree(table, username, path, fields, limit, cursor):
+    """path以下のすべてのアイテムをパス順に1ページ分取得"""
+    start, end = subtree_range(path)
+    query = {
+        'IndexName': 'OwnerPathIndex',
+        'KeyConditionExpression': Key('owner').eq(username) & Key('path').between(start, end),
+        # アップロード確定前のファイルは除外
+        'FilterExpression': Attr('status').not_exists(),
+        **listing_projection(fields, extra=('path',))
+    }
+    # "/docs-old" のような path で始まる別のフォルダを除外（キー属性はFilterExpressionに使えない）
+    items, last_key = query_listing(table, query, limit, (cursor or {}).get('key'), keep=lambda item: is_within(item['path'], path))
+    return items, {'key': last_key} if last_key else None
+
 def upload_file(master):
     """
     ファイルアップロード
     POST /api/storage/upload
+    
+    {"filename", "path", "size", "content_type"} を受け取り、S3へ直接アップロードするための
+    署名付きURL（大きなファイルはマルチパート用のURL一覧）と保留中のアイテムIDを返す
+    アップロード後に POST /api/storage/upload/{item_id}/commit で確定する
+    
+    multipart/form-data の場合は本文を逐次パースし、ファイルごとにS3へ書き込む（複数ファイル可）
+    file_data（base64エンコードされたファイルデータ）を含む場合は従来通りLambda経由で保存する
     """
     if not master.request.auth:
         return json_response(master, {
@@ -135,72 +400,425 @@ def upload_file(master):
     try:
         username = master.request.decode_token.get('cognito:username')
         
-        # multipart/form-dataのパース（簡単な実装）
-        body = master.event.get('body', '')
-        is_base64 = master.event.get('isBase64Encoded', False)
-        
-        if is_base64:
-            body = base64.b64decode(body)
-        else:
-            body = body.encode('utf-8')
+        # ブラウザのフォームからのmultipart/form-data
+        try:
+            boundary = get_boundary(get_header(master, 'content-type'))
+        except MultipartError:
+            boundary = None
+        if boundary:
+            return upload_multipart_files(master, username, boundary)
         
-        # ここではJSONとして送信されたファイルデータを想定
-        # 実際の実装ではmultipart/form-dataのパーサーが必要
         try:
-            data = json.loads(master.event.get('body', '{}'))
-        except:
+            data = json_body(master.event)
+        except (ValueError, TypeError):
             return json_response(master, {
                 "success": False,
                 "message": "無効なリクエスト形式です",
                 "error_code": "VALIDATION_ERROR"
             }, code=400)
         
-        file_data = data.get('file_data')  # base64エンコードされたファイルデータ
-        filename = data.get('filename')
-        path = data.get('path', '/')
+        if 'file_data' in data:
+            return upload_inline_file(master, username, data)
+        return create_upload_session(master, username, data)
+        
+    except Exception as e:
+        logger.exception(f"Upload file error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "ファイルのアップロードに失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def guess_mimetype(filename, content_type=None):
+    """MIMEタイプを推測"""
+    if content_type:
+        return content_type
+    mimetype, _ = mimetypes.guess_type(filename)
+    return mimetype or 'application/octet-stream'
+
+def get_header(master, name):
+    """リクエストヘッダーを取得（大文字小文字を区別しない）"""
+    for key, value in (master.event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+class FormField:
+    """multipart/form-data のファイル以外のフィールドを受け取る"""
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.buffer = bytearray()
+    
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) > MAX_FORM_FIELD_SIZE:
+            raise MultipartError(f"field {self.name} too large")
+    
+    def close(self):
+        self.fields[self.name] = self.buffer.decode('utf-8', 'replace')
+
+def upload_multipart_files(master, username, boundary):
+    """
+    multipart/form-data で送信されたファイルを保存
+    本文はチャンクごとにデコード・パースし、各ファイルはS3StreamWriterで逐次S3へ書き込む
+    """
+    # S3へ書き込む前に本文のサイズ（ファイルの合計以上）の枠を確保（保存しなかった場合は戻す）
+    body = master.event.get('body') or ''
+    body_size = len(body) * 3 // 4 if master.event.get('isBase64Encoded', False) else len(body)
+    try:
+        reservations = [reserve_quota(master.settings, username, body_size)]
+    except QuotaExceeded:
+        return quota_exceeded_response(master)
+    recorded = False
+    try:
+        bucket_name = master.settings.S3_BUCKET
+        fields = {}
+        files = []
+        
+        def part_factory(part):
+            if part.filename is None:
+                return FormField(part.name, fields)
+            # ブラウザによってはパス付きのファイル名が送られる
+            filename = part.filename.replace('\\', '/').rsplit('/', 1)[-1]
+            if not filename:
+                return None
+            file_id = str(uuid.uuid4())
+            content_type = part.content_type if part.content_type != 'application/octet-stream' else None
+            mimetype = guess_mimetype(filename, content_type)
+            if master.settings.STORAGE_DEDUP:
+                # 内容のハッシュが分かるまでは一時的なキーに書き込む
+                writer = S3StreamWriter(bucket_name, storage_blobs.upload_key(username, file_id), mimetype, sha256=True)
+            else:
+                writer = S3StreamWriter(bucket_name, f"{username}/{file_id}/{filename}", mimetype)
+            files.append((file_id, filename, writer))
+            return writer
         
-        if not file_data or not filename:
+        parser = MultipartParser(boundary, part_factory)
+        try:
+            for chunk in iter_event_body(master.event):
+                parser.feed(chunk)
+            parser.close()
+        except Exception as e:
+            for _, _, writer in files:
+                writer.abort()
+            if isinstance(e, MultipartError):
+                return json_response(master, {
+                    "success": False,
+                    "message": "無効なリクエスト形式です",
+                    "error_code": "VALIDATION_ERROR"
+                }, code=400)
+            raise
+        
+        if not files:
             return json_response(master, {
                 "success": False,
                 "message": "ファイルデータまたはファイル名が不正です",
                 "error_code": "VALIDATION_ERROR"
             }, code=400)
         
-        # ファイルIDを生成
-        file_id = str(uuid.uuid4())
-        
-        # S3にアップロード
-        s3 = get_s3()
-        bucket_name = master.settings.S3_BUCKET
-        s3_key = f"{username}/{file_id}/{filename}"
-        
-        # ファイルデータをデコード
-        file_content = base64.b64decode(file_data)
-        file_size = len(file_content)
+        # ファイル数が分かったので2件目以降の分の枠も確保
+        if len(files) > 1:
+            try:
+                reservations.append(reserve_quota(master.settings, username, 0, files=len(files) - 1))
+            except QuotaExceeded:
+                for _, _, writer in files:
+                    writer.abort()
+                return quota_exceeded_response(master)
         
-        # MIMEタイプを推測
-        mimetype, _ = mimetypes.guess_type(filename)
-        if not mimetype:
-            mimetype = 'application/octet-stream'
+        try:
+            path = normalize_path(fields.get('path', '/'))
+        except InvalidPath:
+            for _, _, writer in files:
+                writer.abort()
+            return json_response(master, {
+                "success": False,
+                "message": "パスが不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        now = datetime.now().isoformat()
+        table = get_table(master.settings.STORAGE_TABLE)
+        uploaded_files = []
+        items = []
+        with table.batch_writer() as batch:
+            for file_id, filename, writer in files:
+                s3_key, digest = writer.key, None
+                if master.settings.STORAGE_DEDUP:
+                    s3_key, digest = storage_blobs.promote(
+                        master.settings, username, writer.key, writer.hexdigest(), writer.size,
+                        fallback_key=f"{username}/{file_id}/{filename}"
+                    )
+                item_data = {
+                    'id': file_id,
+                    'name': filename,
+                    'type': 'file',
+                    'path': path,
+                    'parent': parent_key(username, path),
+                    'name_key': name_key('file', filename),
+                    'size': writer.size,
+                    'mimetype': writer.content_type,
+                    'owner': username,
+                    's3_key': s3_key,
+                    'created_at': now,
+                    'updated_at': now
+                }
+                if digest:
+                    item_data['blob'] = digest
+                batch.put_item(Item=item_data)
+                items.append(item_data)
+                uploaded_files.append({
+                    'id': file_id,
+                    'name': filename,
+                    'path': path,
+                    'size': writer.size,
+                    'url': f"/api/storage/download/{file_id}"
+                })
+        record_usage(master.settings.STORAGE_TABLE, added=items, reservations=reservations)
+        recorded = True
+        storage_derivatives.schedule(items)
         
-        # S3にアップロード
-        s3.put_object(
+        return json_response(master, {
+            "success": True,
+            "data": {
+                'uploaded_files': uploaded_files
+            }
+        })
+    finally:
+        if not recorded:
+            release_quota(master.settings.STORAGE_TABLE, *reservations)
+
+class UploadSpecError(ValueError):
+    """アップロードするファイルの指定が不正"""
+
+def upload_size(data):
+    """アップロードするファイルの申告されたサイズ（不正な場合はUploadSpecError）"""
+    try:
+        size = int(data.get('size', 0))
+    except (AttributeError, TypeError, ValueError):
+        raise UploadSpecError("invalid size")
+    if size < 0:
+        raise UploadSpecError("invalid size")
+    return size
+
+def prepare_upload(master, username, data):
+    """
+    署名付きURLによるアップロードの準備
+    保留中のアイテムと、クライアントに返すアップロード先の情報を返す（アイテムの保存は呼び出し側で行う）
+    容量の枠は呼び出し側がアップロード先を発行する前に reserve_quota で確保し、保存後に record_usage で置き換える
+    """
+    filename = data.get('filename')
+    size = upload_size(data)
+    try:
+        path = normalize_path(data.get('path', '/'))
+    except (TypeError, ValueError):
+        raise UploadSpecError("invalid path")
+    
+    if not filename:
+        raise UploadSpecError("invalid filename")
+    
+    file_id = str(uuid.uuid4())
+    s3 = get_s3()
+    bucket_name = master.settings.S3_BUCKET
+    s3_key = f"{username}/{file_id}/{filename}"
+    mimetype = guess_mimetype(filename, data.get('content_type'))
+    now = datetime.now().isoformat()
+    
+    item_data = {
+        'id': file_id,
+        'name': filename,
+        'type': 'file',
+        'path': path,
+        'parent': parent_key(username, path),
+        'name_key': name_key('file', filename),
+        'size': size,
+        'mimetype': mimetype,
+        'owner': username,
+        's3_key': s3_key,
+        'status': 'pending',
+        # 確定されなければ expire_pending_uploads で削除し、確保した容量の枠を戻す（UNIX時間の秒）
+        'expires_at': int(time.time()) + UPLOAD_URL_EXPIRES + PENDING_UPLOAD_GRACE,
+        'created_at': now,
+        'updated_at': now
+    }
+    
+    # 重複排除はS3がチェックサムを検証できる単一のPUTの場合のみ
+    digest = None
+    if master.settings.STORAGE_DEDUP and size <= MULTIPART_THRESHOLD and data.get('upload_method') != 'post':
+        digest = storage_blobs.parse_digest(data.get('sha256'))
+    
+    if digest:
+        item_data['blob'] = digest
+        blob_size = storage_blobs.reuse(master.settings.STORAGE_TABLE, digest, username)
+        if blob_size is not None:
+            # 同じ内容の実体があるのでアップロードは不要（メタデータのみ保存）
+            del item_data['status']
+            del item_data['expires_at']
+            item_data['size'] = blob_size
+            item_data['s3_key'] = storage_blobs.blob_key(digest)
+            return item_data, {
+                'id': file_id,
+                'upload': None,
+                'duplicate': True,
+                'url': f"/api/storage/download/{file_id}"
+            }
+        # アップロード先はこのアップロードだけの一時的なキー（確定時にチェックサムを確認してから実体にする）
+        item_data['s3_key'] = storage_blobs.upload_key(username, file_id)
+        checksum = storage_blobs.checksum_sha256(digest)
+        upload = {
+            'method': 'PUT',
+            'url': s3.generate_presigned_url('put_object', Params={
+                'Bucket': bucket_name,
+                'Key': item_data['s3_key'],
+                'ContentType': mimetype,
+                'ChecksumSHA256': checksum
+            }, ExpiresIn=UPLOAD_URL_EXPIRES),
+            'headers': {'Content-Type': mimetype, 'x-amz-checksum-sha256': checksum}
+        }
+    elif size > MULTIPART_THRESHOLD:
+        # マルチパートアップロード（パートごとの署名付きURLを並列に使用できる）
+        part_size = max(MULTIPART_PART_SIZE, -(-size // MULTIPART_MAX_PARTS))
+        part_count = -(-size // part_size)
+        multipart = s3.create_multipart_upload(Bucket=bucket_name, Key=s3_key, ContentType=mimetype)
+        upload_id = multipart['UploadId']
+        item_data['upload_id'] = upload_id
+        upload = {
+            'method': 'multipart',
+            'upload_id': upload_id,
+            'part_size': part_size,
+            'parts': [{
+                'part_number': part_number,
+                'url': s3.generate_presigned_url('upload_part', Params={
+                    'Bucket': bucket_name,
+                    'Key': s3_key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number
+                }, ExpiresIn=UPLOAD_URL_EXPIRES)
+            } for part_number in range(1, part_count + 1)]
+        }
+    elif data.get('upload_method') == 'post':
+        # ブラウザのフォームから送信する場合の署名付きPOST
+        presigned = s3.generate_presigned_post(
             Bucket=bucket_name,
             Key=s3_key,
-            Body=file_content,
-            ContentType=mimetype
+            Fields={'Content-Type': mimetype},
+            Conditions=[{'Content-Type': mimetype}, ['content-length-range', 0, size]],
+            ExpiresIn=UPLOAD_URL_EXPIRES
         )
+        upload = {
+            'method': 'POST',
+            'url': presigned['url'],
+            'fields': presigned['fields']
+        }
+    else:
+        upload = {
+            'method': 'PUT',
+            'url': s3.generate_presigned_url('put_object', Params={
+                'Bucket': bucket_name,
+                'Key': s3_key,
+                'ContentType': mimetype
+            }, ExpiresIn=UPLOAD_URL_EXPIRES),
+            'headers': {'Content-Type': mimetype}
+        }
+    
+    return item_data, {
+        'id': file_id,
+        'upload': upload,
+        'expires_in': UPLOAD_URL_EXPIRES,
+        'commit_url': f"/api/storage/upload/{file_id}/commit"
+    }
+
+def create_upload_session(master, username, data):
+    """
+    署名付きURLによるアップロードの開始
+    """
+    # アップロード先を発行する前に申告されたサイズの枠を確保（保存できなかった場合は戻す）
+    try:
+        reservation = reserve_quota(master.settings, username, upload_size(data))
+    except UploadSpecError:
+        return spec_error_response(master)
+    except QuotaExceeded:
+        return quota_exceeded_response(master)
+    
+    try:
+        item_data, session = prepare_upload(master, username, data)
+        table = get_table(master.settings.STORAGE_TABLE)
+        table.put_item(Item=item_data)
+    except Exception as e:
+        release_quota(master.settings.STORAGE_TABLE, reservation)
+        if isinstance(e, UploadSpecError):
+            return spec_error_response(master)
+        raise
+    record_usage(master.settings.STORAGE_TABLE, added=[item_data], reservations=[reservation])
+    storage_derivatives.schedule([item_data])
+    
+    return json_response(master, {
+        "success": True,
+        "data": session
+    })
+
+def upload_inline_file(master, username, data):
+    """
+    base64エンコードされたファイルデータをLambda経由で保存（従来の方式）
+    """
+    file_data = data.get('file_data')  # base64エンコードされたファイルデータ
+    filename = data.get('filename')
+    try:
+        path = normalize_path(data.get('path', '/'))
+    except InvalidPath:
+        path = None
+    
+    if not file_data or not filename or path is None:
+        return json_response(master, {
+            "success": False,
+            "message": "ファイルデータまたはファイル名が不正です",
+            "error_code": "VALIDATION_ERROR"
+        }, code=400)
+    
+    # ファイルIDを生成
+    file_id = str(uuid.uuid4())
+    
+    s3 = get_s3()
+    bucket_name = master.settings.S3_BUCKET
+    s3_key = f"{username}/{file_id}/{filename}"
+    
+    # ファイルデータをデコード
+    file_content = base64.b64decode(file_data)
+    file_size = len(file_content)
+    
+    # 書き込む前に枠を確保（保存できなかった場合は戻す）
+    try:
+        reservation = reserve_quota(master.settings, username, file_size)
+    except QuotaExceeded:
+        return quota_exceeded_response(master)
+    
+    try:
+        mimetype = guess_mimetype(filename)
+        
+        # S3にアップロード（重複排除が有効なら同じ内容の実体を共有する）
+        digest = None
+        if master.settings.STORAGE_DEDUP:
+            blob_s3_key, digest = storage_blobs.store_bytes(master.settings, username, file_content, mimetype)
+            if digest:
+                s3_key = blob_s3_key
+        if not digest:
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=s3_key,
+                Body=file_content,
+                ContentType=mimetype
+            )
         
         # DynamoDBにメタデータを保存
         now = datetime.now().isoformat()
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.STORAGE_TABLE)
+        table = get_table(master.settings.STORAGE_TABLE)
         
         item_data = {
             'id': file_id,
             'name': filename,
             'type': 'file',
             'path': path,
+            'parent': parent_key(username, path),
+            'name_key': name_key('file', filename),
             'size': file_size,
             'mimetype': mimetype,
             'owner': username,
@@ -208,11 +826,19 @@ def upload_file(master):
             'created_at': now,
             'updated_at': now
         }
+        if digest:
+            item_data['blob'] = digest
         
         table.put_item(Item=item_data)
-        
-        # レスポンス
-        response_data = {
+    except Exception:
+        release_quota(master.settings.STORAGE_TABLE, reservation)
+        raise
+    record_usage(master.settings.STORAGE_TABLE, added=[item_data], reservations=[reservation])
+    storage_derivatives.schedule([item_data])
+    
+    return json_response(master, {
+        "success": True,
+        "data": {
             'uploaded_files': [{
                 'id': file_id,
                 'name': filename,
@@ -221,17 +847,308 @@ def upload_file(master):
                 'url': f"/api/storage/download/{file_id}"
             }]
         }
+    })
+
+class UploadNotFound(Exception):
+    """アップロードされたオブジェクトがS3にない"""
+
+def finalize_upload(master, item, parts=None):
+    """
+    S3へのアップロードを確定し、確定後のアイテムで更新する属性（size、重複排除の場合は s3_key / blob も）を返す
+    マルチパートの場合はpartsでアップロードを完了する
+    """
+    s3 = get_s3()
+    bucket_name = master.settings.S3_BUCKET
+    
+    if item.get('blob'):
+        return finalize_blob_upload(master, item)
+    
+    if item.get('upload_id'):
+        parts = sorted(parts or [], key=lambda p: int(p['part_number']))
+        if not parts:
+            raise UploadSpecError("parts are required")
+        s3.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=item['s3_key'],
+            UploadId=item['upload_id'],
+            MultipartUpload={'Parts': [
+                {'PartNumber': int(p['part_number']), 'ETag': p['etag']} for p in parts
+            ]}
+        )
+    
+    # S3にオブジェクトがあることを確認
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=item['s3_key'])
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise UploadNotFound(item['s3_key'])
+        raise
+    
+    # 容量の上限がある場合は、開始時に申告したサイズ（上限の判定に使ったサイズ）を超えるファイルは受け付けない
+    if master.settings.STORAGE_QUOTA_BYTES and head['ContentLength'] > int(item.get('size') or 0):
+        s3.delete_object(Bucket=bucket_name, Key=item['s3_key'])
+        raise QuotaExceeded(f"{item['s3_key']}: {head['ContentLength']} bytes exceeds the declared size")
+    return {'size': head['ContentLength']}
+
+def claim_upload(table, item_id):
+    """
+    確定前のアップロードを確定処理中（status = committing）にして、処理中の印（claimed_at）を返す
+    確定済み・削除済み・他の確定処理の途中の場合はNone（同じアップロードを同時に確定しない）
+    """
+    now = int(time.time() * 1000)
+    try:
+        table.update_item(
+            Key={'id': item_id},
+            UpdateExpression="SET #status = :committing, #claimed_at = :now",
+            ConditionExpression="#status = :pending OR (#status = :committing AND #claimed_at < :stale)",
+            ExpressionAttributeNames={'#status': 'status', '#claimed_at': 'claimed_at'},
+            ExpressionAttributeValues={
+                ':pending': 'pending',
+                ':committing': 'committing',
+                ':now': now,
+                ':stale': now - COMMIT_CLAIM_TIMEOUT * 1000
+            }
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return None
+        raise
+    return now
+
+def release_claim(table, item_id, claimed_at):
+    """確定に失敗したアップロードを確定前に戻す（既に他の処理が引き継いでいれば何もしない）"""
+    try:
+        table.update_item(
+            Key={'id': item_id},
+            UpdateExpression="SET #status = :pending REMOVE #claimed_at",
+            ConditionExpression="#status = :committing AND #claimed_at = :claimed_at",
+            ExpressionAttributeNames={'#status': 'status', '#claimed_at': 'claimed_at'},
+            ExpressionAttributeValues={':pending': 'pending', ':committing': 'committing', ':claimed_at': claimed_at}
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+
+def complete_upload(table, item_id, claimed_at, updates, now):
+    """
+    確定処理中のアップロードを updates（値がNoneの属性は削除）で更新して確定済みにする
+    処理中に削除・引き継ぎされていればFalse
+    """
+    updates = {**updates, 'updated_at': now}
+    sets = [name for name, value in updates.items() if value is not None]
+    removes = [name for name, value in updates.items() if value is None] + ['status', 'upload_id', 'claimed_at', 'expires_at']
+    try:
+        table.update_item(
+            Key={'id': item_id},
+            UpdateExpression="SET " + ", ".join(f"#{name} = :{name}" for name in sets) +
+                             " REMOVE " + ", ".join(f"#{name}" for name in removes),
+            ConditionExpression="#status = :committing AND #claimed_at = :claimed_at",
+            ExpressionAttributeNames={f"#{name}": name for name in sets + removes},
+            ExpressionAttributeValues={
+                **{f":{name}": updates[name] for name in sets},
+                ':committing': 'committing',
+                ':claimed_at': claimed_at
+            }
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+def commit_claimed(master, table, item, parts):
+    """
+    確定処理中にしたアップロードを確定し、確定後のアイテムを返す（確定できなかった場合はNone）
+    参照数・使用量は条件付きの書き込みに成功したアイテムだけに反映する
+    finalize_upload の例外（UploadSpecError など）はアップロードを確定前に戻してから送出する
+    """
+    claimed_at = claim_upload(table, item['id'])
+    if claimed_at is None:
+        return None
+    try:
+        updates = finalize_upload(master, item, parts)
+    except Exception:
+        release_claim(table, item['id'], claimed_at)
+        raise
+    now = datetime.now().isoformat()
+    committed = {k: v for k, v in item.items() if k not in ('status', 'upload_id', 'claimed_at', 'expires_at')}
+    committed.update(updates)
+    committed = {k: v for k, v in committed.items() if v is not None}
+    committed['updated_at'] = now
+    if not complete_upload(table, item['id'], claimed_at, updates, now):
+        # 処理中に削除された場合など。finalize_upload で増やした実体の参照を戻す
+        storage_blobs.release(master.settings.STORAGE_TABLE, [committed])
+        if item.get('blob') and not committed.get('blob'):
+            # GCと競合して通常のキーに移したデータは、どのアイテムからも参照されない
+            get_s3().delete_object(Bucket=master.settings.S3_BUCKET, Key=committed['s3_key'])
+        return None
+    record_usage(master.settings.STORAGE_TABLE, added=[committed], removed=[item])
+    return committed
+
+def expire_pending_uploads(settings):
+    """
+    期限（expires_at）を過ぎても確定されなかったアップロードを削除し、削除した件数を返す（storage_gc のスケジュールで呼ばれる）
+    確定前・確定処理中のまま止まったアイテムだけを条件付きで削除するので、同時に確定されたものは削除しない。
+    アイテムは一覧に表示されず利用者は削除できないため、ここでS3のデータと確保した容量の枠も戻す
+    """
+    table = get_table(settings.STORAGE_TABLE)
+    s3 = get_s3()
+    now = int(time.time())
+    # expires_at を付ける前に作られたアイテムは作成日時で判定する
+    cutoff = datetime.fromtimestamp(now - UPLOAD_URL_EXPIRES - PENDING_UPLOAD_GRACE).isoformat()
+    deleted = 0
+    scan_kwargs = {'FilterExpression': Attr('status').exists() & (
+        Attr('expires_at').lt(now) | (Attr('expires_at').not_exists() & Attr('created_at').lt(cutoff))
+    )}
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response['Items']:
+            try:
+                table.delete_item(
+                    Key={'id': item['id']},
+                    ConditionExpression="(#expires_at < :now OR (attribute_not_exists(#expires_at) AND #created_at < :cutoff)) AND "
+                                        "(#status = :pending OR (#status = :committing AND #claimed_at < :stale))",
+                    ExpressionAttributeNames={
+                        '#expires_at': 'expires_at',
+                        '#created_at': 'created_at',
+                        '#status': 'status',
+                        '#claimed_at': 'claimed_at'
+                    },
+                    ExpressionAttributeValues={
+                        ':now': now,
+                        ':cutoff': cutoff,
+                        ':pending': 'pending',
+                        ':committing': 'committing',
+                        ':stale': (now - COMMIT_CLAIM_TIMEOUT) * 1000
+                    }
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                    continue
+                raise
+            release_quota(settings.STORAGE_TABLE, {'owner': item['owner'], 'size': int(item.get('size') or 0), 'files': 1})
+            try:
+                if item.get('upload_id'):
+                    s3.abort_multipart_upload(Bucket=settings.S3_BUCKET, Key=item['s3_key'], UploadId=item['upload_id'])
+                # 確定前のデータは一時的なキーかアイテム専用のキーにある（共有される実体のキーは削除しない）
+                if not item['s3_key'].startswith(storage_blobs.BLOB_KEY_PREFIX):
+                    s3.delete_object(Bucket=settings.S3_BUCKET, Key=item['s3_key'])
+            except ClientError as e:
+                # 残ったデータはS3のライフサイクルルールで削除される
+                logger.warning(f"delete expired upload {item['id']} failed: {e}")
+            deleted += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    logger.info(f"storage gc: expired {deleted} pending uploads")
+    return deleted
+
+def finalize_blob_upload(master, item):
+    """
+    重複排除のアップロードを確定して、確定後のアイテムで更新する属性を返す
+    このアップロードの一時的なキーにあるデータのチェックサム（S3が検証したもの）が申告されたハッシュと
+    一致することを確認してから実体にする（ハッシュを指定しただけでは他のユーザーの実体の参照は得られない）
+    """
+    digest = item['blob']
+    size = storage_blobs.verify_uploaded(master.settings, item['s3_key'], digest)
+    if size is None:
+        raise UploadNotFound(item['s3_key'])
+    if master.settings.STORAGE_QUOTA_BYTES and size > int(item.get('size') or 0):
+        get_s3().delete_object(Bucket=master.settings.S3_BUCKET, Key=item['s3_key'])
+        raise QuotaExceeded(f"{item['s3_key']}: {size} bytes exceeds the declared size")
+    s3_key, blob = storage_blobs.promote(
+        master.settings, item['owner'], item['s3_key'], digest, size,
+        fallback_key=f"{item['owner']}/{item['id']}/{item['name']}"
+    )
+    # GCと競合した場合は通常のキーに保存されている（blob を削除する）
+    return {'size': size, 's3_key': s3_key, 'blob': blob}
+
+def commit_upload(master, item_id):
+    """
+    署名付きURLによるアップロードの確定
+    POST /api/storage/upload/{item_id}/commit
+    マルチパートの場合は {"parts": [{"part_number": 1, "etag": "..."}]} を送信する
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        table = get_table(master.settings.STORAGE_TABLE)
+        
+        response = table.get_item(Key={'id': item_id})
+        if 'Item' not in response:
+            return json_response(master, {
+                "success": False,
+                "message": "アイテムが見つかりません",
+                "error_code": "ITEM_NOT_FOUND"
+            }, code=404)
+        
+        item = response['Item']
+        if item.get('owner') != username:
+            return json_response(master, {
+                "success": False,
+                "message": "アイテムを更新する権限がありません",
+                "error_code": "PERMISSION_DENIED"
+            }, code=403)
+        
+        if item.get('status') not in ('pending', 'committing'):
+            return json_response(master, {
+                "success": False,
+                "message": "このアップロードは既に確定しています",
+                "error_code": "UPLOAD_ALREADY_COMMITTED"
+            }, code=409)
+        
+        body = json_body(master.event)
+        try:
+            committed = commit_claimed(master, table, item, body.get('parts'))
+        except UploadSpecError:
+            return json_response(master, {
+                "success": False,
+                "message": "パート情報が必要です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        except UploadNotFound:
+            return json_response(master, {
+                "success": False,
+                "message": "アップロードされたファイルが見つかりません",
+                "error_code": "UPLOAD_NOT_FOUND"
+            }, code=409)
+        except QuotaExceeded:
+            return quota_exceeded_response(master)
+        
+        if committed is None:
+            return json_response(master, {
+                "success": False,
+                "message": "このアップロードは既に確定しています",
+                "error_code": "UPLOAD_ALREADY_COMMITTED"
+            }, code=409)
+        
+        file_size = committed['size']
+        storage_derivatives.schedule([committed])
         
         return json_response(master, {
             "success": True,
-            "data": response_data
+            "data": {
+                'uploaded_files': [{
+                    'id': item_id,
+                    'name': item.get('name'),
+                    'path': item.get('path'),
+                    'size': file_size,
+                    'url': f"/api/storage/download/{item_id}"
+                }]
+            }
         })
         
     except Exception as e:
-        logger.exception(f"Upload file error: {e}")
+        logger.exception(f"Commit upload error: {e}")
         return json_response(master, {
             "success": False,
-            "message": "ファイルのアップロードに失敗しました",
+            "message": "アップロードの確定に失敗しました",
             "error_code": "INTERNAL_ERROR"
         }, code=500)
 
@@ -249,10 +1166,9 @@ def create_folder(master):
     
     try:
         username = master.request.decode_token.get('cognito:username')
-        body = json.loads(master.event.get('body', '{}'))
+        body = json_body(master.event)
         
         name = body.get('name')
-        path = body.get('path', '/')
         
         if not name:
             return json_response(master, {
@@ -261,19 +1177,30 @@ def create_folder(master):
                 "error_code": "VALIDATION_ERROR"
             }, code=400)
         
+        try:
+            validate_name(name)
+            path = normalize_path(body.get('path', '/'))
+        except InvalidPath:
+            return json_response(master, {
+                "success": False,
+                "message": "フォルダ名またはパスが不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
         # フォルダIDを生成
         folder_id = str(uuid.uuid4())
         
         # DynamoDBにフォルダ情報を保存
         now = datetime.now().isoformat()
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.STORAGE_TABLE)
+        table = get_table(master.settings.STORAGE_TABLE)
         
         folder_data = {
             'id': folder_id,
             'name': name,
             'type': 'folder',
             'path': path,
+            'parent': parent_key(username, path),
+            'name_key': name_key('folder', name),
             'size': 0,
             'mimetype': '',
             'owner': username,
@@ -304,11 +1231,14 @@ def create_folder(master):
 def download_file(master, item_id):
     """
     ファイルダウンロード
-    GET /api/storage/download/{item_id}
+    GET /api/storage/download/{item_id}?mode=redirect|url|proxy&disposition=attachment|inline
+    
+    - redirect（既定）: 署名付きURLへ302でリダイレクト
+    - url: 署名付きURLをJSONで返す
+    - proxy: Lambda経由でファイルを返す（小さいファイルのみ、Rangeヘッダーに対応）
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.STORAGE_TABLE)
+        table = get_table(master.settings.STORAGE_TABLE)
         
         # ファイル情報を取得
         response = table.get_item(Key={'id': item_id})
@@ -338,32 +1268,38 @@ def download_file(master, item_id):
                 "error_code": "AUTH_REQUIRED"
             }, code=401)
         
-        # S3からファイルを取得
-        s3 = get_s3()
-        bucket_name = master.settings.S3_BUCKET
         s3_key = item.get('s3_key')
         
-        if not s3_key:
+        if not s3_key or item.get('status'):
             return json_response(master, {
                 "success": False,
                 "message": "ファイルデータが見つかりません",
                 "error_code": "FILE_NOT_FOUND"
             }, code=404)
         
-        # S3オブジェクトを取得
-        obj = s3.get_object(Bucket=bucket_name, Key=s3_key)
-        file_content = obj['Body'].read()
+        mode = master.request.query_params.get('mode', 'redirect')
+        disposition = 'inline' if master.request.query_params.get('disposition') == 'inline' else 'attachment'
+        
+        if mode == 'proxy':
+            return proxy_download(master, item, disposition)
         
-        # バイナリレスポンスを返す
+        # 短期間有効な署名付きURL（Rangeリクエストは取得先で処理される）
+        url = download_url(master.settings, item, disposition, DOWNLOAD_URL_EXPIRES)
+        if mode == 'url':
+            return json_response(master, {
+                "success": True,
+                "data": {
+                    'url': url,
+                    'expires_in': DOWNLOAD_URL_EXPIRES
+                }
+            })
         return {
-            'statusCode': 200,
+            'statusCode': 302,
             'headers': {
-                'Content-Type': item.get('mimetype', 'application/octet-stream'),
-                'Content-Disposition': f'attachment; filename="{item.get("name")}"',
-                'Content-Length': str(len(file_content))
+                'Location': url,
+                'Cache-Control': 'private, no-store'
             },
-            'body': base64.b64encode(file_content).decode('utf-8'),
-            'isBase64Encoded': True
+            'body': ''
         }
         
     except Exception as e:
@@ -374,6 +1310,53 @@ def download_file(master, item_id):
             "error_code": "INTERNAL_ERROR"
         }, code=500)
 
+def proxy_download(master, item, disposition):
+    """
+    Lambda経由でファイルを返す（Rangeヘッダーに対応）
+    API Gatewayのレスポンスサイズの上限を超える範囲は返せないため、通常はリダイレクトを使用する
+    """
+    s3 = get_s3()
+    headers = {k.lower(): v for k, v in (master.event.get('headers') or {}).items()}
+    get_kwargs = {'Bucket': master.settings.S3_BUCKET, 'Key': item['s3_key']}
+    if headers.get('range'):
+        get_kwargs['Range'] = headers['range']
+    
+    try:
+        obj = s3.get_object(**get_kwargs)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'InvalidRange':
+            return {
+                'statusCode': 416,
+                'headers': {'Content-Range': f"bytes */{item.get('size', 0)}"},
+                'body': ''
+            }
+        raise
+    
+    if obj['ContentLength'] > PROXY_DOWNLOAD_MAX_SIZE:
+        obj['Body'].close()
+        return json_response(master, {
+            "success": False,
+            "message": "ファイルが大きすぎます。mode=redirectを使用してください",
+            "error_code": "FILE_TOO_LARGE"
+        }, code=413)
+    
+    file_content = obj['Body'].read()
+    response_headers = {
+        'Content-Type': item.get('mimetype') or 'application/octet-stream',
+        'Content-Disposition': content_disposition(item.get('name', 'download'), disposition),
+        'Content-Length': str(len(file_content)),
+        'Accept-Ranges': 'bytes'
+    }
+    if 'ContentRange' in obj:
+        response_headers['Content-Range'] = obj['ContentRange']
+    
+    return {
+        'statusCode': 206 if 'ContentRange' in obj else 200,
+        'headers': response_headers,
+        'body': base64.b64encode(file_content).decode('utf-8'),
+        'isBase64Encoded': True
+    }
+
 def delete_item(master, item_id):
     """
     ファイル・フォルダ削除
@@ -389,8 +1372,7 @@ def delete_item(master, item_id):
     try:
         username = master.request.decode_token.get('cognito:username')
         
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.STORAGE_TABLE)
+        table = get_table(master.settings.STORAGE_TABLE)
         
         # アイテム情報を取得
         response = table.get_item(Key={'id': item_id})
@@ -412,14 +1394,26 @@ def delete_item(master, item_id):
                 "error_code": "PERMISSION_DENIED"
             }, code=403)
         
-        # ファイルの場合はS3からも削除
-        if item.get('type') == 'file' and item.get('s3_key'):
+        # フォルダの場合は配下のファイル・フォルダもすべて削除
+        if item.get('type') == 'folder':
+            return folder_job_response(master, run_folder_operation(master.settings, username, item, 'delete'))
+        
+        # ファイルの場合はS3からも削除（重複排除の実体は参照を減らすだけ。確定前は一時的なキーを削除する）
+        if item.get('blob') and not item.get('status'):
+            storage_blobs.release(master.settings.STORAGE_TABLE, [item])
+        elif item.get('type') == 'file' and item.get('s3_key'):
             s3 = get_s3()
             bucket_name = master.settings.S3_BUCKET
+            if item.get('upload_id'):
+                # 確定前のマルチパートアップロードは中止する
+                s3.abort_multipart_upload(Bucket=bucket_name, Key=item['s3_key'], UploadId=item['upload_id'])
             s3.delete_object(Bucket=bucket_name, Key=item['s3_key'])
+        # 派生画像（サムネイルなど）も削除
+        delete_s3_objects(master.settings.S3_BUCKET, storage_derivatives.derived_keys(item))
         
         # DynamoDBから削除
         table.delete_item(Key={'id': item_id})
+        record_usage(master.settings.STORAGE_TABLE, removed=[item])
         
         return json_response(master, {
             "success": True,
@@ -432,4 +1426,538 @@ def delete_item(master, item_id):
             "success": False,
             "message": "アイテムの削除に失敗しました",
             "error_code": "INTERNAL_ERROR"
-        }, code=500) 
\ No newline at end of file
+        }, code=500) 
+
+def bulk_delete_items(master):
+    """
+    ファイル・フォルダの一括削除
+    POST /api/storage/bulk/delete {"ids": ["...", ...]}
+    所有者チェックはBatchGetItem、S3はDeleteObjects、DynamoDBはBatchWriteItemでまとめて処理する
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        body = json_body(master.event)
+        ids = body.get('ids')
+        
+        if not isinstance(ids, list) or not ids or len(ids) > BULK_MAX_ITEMS:
+            return json_response(master, {
+                "success": False,
+                "message": f"idsには1〜{BULK_MAX_ITEMS}件のIDを指定してください",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        ids = list(dict.fromkeys(str(item_id) for item_id in ids))
+        
+        items = batch_get_items(
+            master.settings.STORAGE_TABLE,
+            [{'id': item_id} for item_id in ids],
+            projection='#id, #owner, #type, #name, #path, #size, #status, #s3_key, #upload_id, #blob, #derived',
+            attribute_names={
+                '#id': 'id',
+                '#owner': 'owner',
+                '#type': 'type',
+                '#name': 'name',
+                '#path': 'path',
+                '#size': 'size',
+                '#status': 'status',
+                '#s3_key': 's3_key',
+                '#upload_id': 'upload_id',
+                '#blob': 'blob',
+                '#derived': 'derived'
+            }
+        )
+        found = {item['id']: item for item in items}
+        
+        failed = []
+        targets = []
+        for item_id in ids:
+            item = found.get(item_id)
+            if item is None:
+                failed.append({'id': item_id, 'error_code': 'ITEM_NOT_FOUND'})
+            elif item.get('owner') != username:
+                failed.append({'id': item_id, 'error_code': 'PERMISSION_DENIED'})
+            else:
+                targets.append(item)
+        
+        # フォルダは配下ごと削除（配下が多い場合はジョブに引き継ぐ）
+        jobs = []
+        deleted_folders = []
+        for folder in targets:
+            if folder.get('type') != 'folder':
+                continue
+            job = run_folder_operation(master.settings, username, folder, 'delete')
+            if job['status'] == 'running':
+                jobs.append(job_summary(job))
+            elif job['failed']:
+                failed.append({'id': folder['id'], 'error_code': 'S3_DELETE_FAILED'})
+            else:
+                deleted_folders.append(folder['id'])
+        
+        # ファイルはS3とDynamoDBからまとめて削除
+        deleted, s3_failed = delete_items(master.settings, [item for item in targets if item.get('type') != 'folder'])
+        failed += [{'id': item_id, 'error_code': 'S3_DELETE_FAILED'} for item_id in s3_failed]
+        deleted += deleted_folders
+        
+        return json_response(master, {
+            "success": True,
+            "data": {
+                "deleted": deleted,
+                "failed": failed,
+                "jobs": jobs
+            }
+        })
+        
+    except Exception as e:
+        logger.exception(f"Bulk delete error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "アイテムの一括削除に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def bulk_create_upload_sessions(master):
+    """
+    署名付きURLによる一括アップロードの開始
+    POST /api/storage/bulk/upload {"files": [{"filename", "path", "size", "content_type"}, ...]}
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        body = json_body(master.event)
+        files = body.get('files')
+        
+        if not isinstance(files, list) or not files or len(files) > BULK_MAX_UPLOADS:
+            return json_response(master, {
+                "success": False,
+                "message": f"filesには1〜{BULK_MAX_UPLOADS}件のファイルを指定してください",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        files = [data if isinstance(data, dict) else {} for data in files]
+        sizes = []
+        for index, data in enumerate(files):
+            try:
+                sizes.append(upload_size(data))
+            except UploadSpecError:
+                return bulk_spec_error_response(master, index)
+        
+        # 容量の枠はファイルごとではなく合計で確保（保存できなかった場合は戻す）
+        try:
+            reservation = reserve_quota(master.settings, username, sum(sizes), files=len(files))
+        except QuotaExceeded:
+            return quota_exceeded_response(master)
+        
+        try:
+            items = []
+            sessions = []
+            for index, data in enumerate(files):
+                try:
+                    item_data, session = prepare_upload(master, username, data)
+                except UploadSpecError:
+                    release_quota(master.settings.STORAGE_TABLE, reservation)
+                    return bulk_spec_error_response(master, index)
+                items.append(item_data)
+                sessions.append(session)
+            
+            batch_write(master.settings.STORAGE_TABLE, put_items=items)
+        except Exception:
+            release_quota(master.settings.STORAGE_TABLE, reservation)
+            raise
+        record_usage(master.settings.STORAGE_TABLE, added=items, reservations=[reservation])
+        storage_derivatives.schedule(items)
+        
+        return json_response(master, {
+            "success": True,
+            "data": {
+                "uploads": sessions
+            }
+        })
+        
+    except Exception as e:
+        logger.exception(f"Bulk upload error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "ファイルの一括アップロードに失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def bulk_commit_uploads(master):
+    """
+    署名付きURLによる一括アップロードの確定
+    POST /api/storage/bulk/commit {"items": [{"id": "...", "parts": [...]}, ...]}
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        body = json_body(master.event)
+        entries = body.get('items')
+        
+        if not isinstance(entries, list) or not entries or len(entries) > BULK_MAX_UPLOADS:
+            return json_response(master, {
+                "success": False,
+                "message": f"itemsには1〜{BULK_MAX_UPLOADS}件のアイテムを指定してください",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        parts_by_id = {str(r.get('id')): r.get('parts') for r in entries if isinstance(r, dict)}
+        
+        items = batch_get_items(master.settings.STORAGE_TABLE, [{'id': item_id} for item_id in parts_by_id])
+        found = {item['id']: item for item in items}
+        
+        failed = []
+        targets = []
+        for item_id in parts_by_id:
+            item = found.get(item_id)
+            if item is None:
+                failed.append({'id': item_id, 'error_code': 'ITEM_NOT_FOUND'})
+            elif item.get('owner') != username:
+                failed.append({'id': item_id, 'error_code': 'PERMISSION_DENIED'})
+            elif item.get('status') not in ('pending', 'committing'):
+                failed.append({'id': item_id, 'error_code': 'UPLOAD_ALREADY_COMMITTED'})
+            else:
+                targets.append(item)
+        
+        # S3にはまとめて確認するAPIがないため並列に確認し、アイテムごとに条件付きで確定する
+        # （Tableはスレッドセーフではないので、ワーカーごとに get_table で取得する）
+        def finalize(item):
+            table = get_table(master.settings.STORAGE_TABLE)
+            try:
+                return item, commit_claimed(master, table, item, parts_by_id[item['id']]), None
+            except UploadSpecError:
+                return item, None, 'VALIDATION_ERROR'
+            except UploadNotFound:
+                return item, None, 'UPLOAD_NOT_FOUND'
+            except QuotaExceeded:
+                return item, None, 'QUOTA_EXCEEDED'
+        
+        committed = []
+        uploaded_files = []
+        with ThreadPoolExecutor(max_workers=BULK_COMMIT_CONCURRENCY) as executor:
+            for item, committed_item, error_code in executor.map(finalize, targets):
+                if committed_item is None:
+                    failed.append({'id': item['id'], 'error_code': error_code or 'UPLOAD_ALREADY_COMMITTED'})
+                    continue
+                committed.append(committed_item)
+                uploaded_files.append({
+                    'id': item['id'],
+                    'name': item.get('name'),
+                    'path': item.get('path'),
+                    'size': committed_item['size'],
+                    'url': f"/api/storage/download/{item['id']}"
+                })
+        
+        storage_derivatives.schedule(committed)
+        
+        return json_response(master, {
+            "success": True,
+            "data": {
+                "uploaded_files": uploaded_files,
+                "failed": failed
+            }
+        })
+        
+    except Exception as e:
+        logger.exception(f"Bulk commit error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "アップロードの一括確定に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def job_summary(job):
+    """ジョブのレスポンス用の表現"""
+    summary = {
+        'id': job['id'],
+        'operation': job['operation'],
+        'status': job['status'],
+        'processed': int(job.get('processed', 0)),
+        'failed': int(job.get('failed', 0)),
+        'url': f"/api/storage/jobs/{job['id']}"
+    }
+    if job.get('error'):
+        summary['error'] = job['error']
+    return summary
+
+def folder_job_response(master, job):
+    """
+    フォルダの削除・移動の結果を返す
+    配下が多くジョブに引き継いだ場合は202で進捗確認用のURLを返す
+    """
+    if job['status'] == 'running':
+        return json_response(master, {
+            "success": True,
+            "message": "処理を開始しました",
+            "data": {"job": job_summary(job)}
+        }, code=202)
+    if job['failed']:
+        return json_response(master, {
+            "success": False,
+            "message": "一部のファイルを削除できませんでした",
+            "error_code": "S3_DELETE_FAILED",
+            "data": {"job": job_summary(job)}
+        }, code=500)
+    return json_response(master, {
+        "success": True,
+        "message": "削除が完了しました" if job['operation'] == 'delete' else "移動が完了しました",
+        "data": {"job": job_summary(job)}
+    })
+
+def folder_exists(table, username, path, name):
+    """path に name という名前のフォルダがあるか"""
+    params = {
+        'IndexName': 'OwnerPathIndex',
+        'KeyConditionExpression': Key('owner').eq(username) & Key('path').eq(path),
+        'FilterExpression': Attr('name').eq(name) & Attr('type').eq('folder'),
+        'ProjectionExpression': 'id'
+    }
+    while True:
+        response = table.query(**params)
+        if response['Items']:
+            return True
+        if 'LastEvaluatedKey' not in response:
+            return False
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def move_item(master, item_id):
+    """
+    ファイル・フォルダの移動・名前変更
+    POST /api/storage/item/{item_id}/move {"path": "/移動先", "name": "新しい名前"}
+    フォルダの場合は配下のアイテムのパスもまとめて付け替える
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        body = json_body(master.event)
+        
+        table = get_table(master.settings.STORAGE_TABLE)
+        response = table.get_item(Key={'id': item_id})
+        
+        if 'Item' not in response:
+            return json_response(master, {
+                "success": False,
+                "message": "アイテムが見つかりません",
+                "error_code": "ITEM_NOT_FOUND"
+            }, code=404)
+        
+        item = response['Item']
+        
+        # 所有者チェック
+        if item.get('owner') != username:
+            return json_response(master, {
+                "success": False,
+                "message": "アイテムを移動する権限がありません",
+                "error_code": "PERMISSION_DENIED"
+            }, code=403)
+        
+        old_path = item.get('path') or '/'
+        try:
+            new_path = normalize_path(body.get('path', old_path))
+            new_name = validate_name(body.get('name', item.get('name')))
+        except InvalidPath:
+            return json_response(master, {
+                "success": False,
+                "message": "名前またはパスが不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        is_folder = item.get('type') == 'folder'
+        if is_folder:
+            old_root = folder_root(item)
+            if is_within(new_path, old_root):
+                return json_response(master, {
+                    "success": False,
+                    "message": "フォルダを自身の配下に移動することはできません",
+                    "error_code": "VALIDATION_ERROR"
+                }, code=400)
+            if (new_path, new_name) != (old_path, item.get('name')) and folder_exists(table, username, new_path, new_name):
+                return json_response(master, {
+                    "success": False,
+                    "message": "移動先に同じ名前のフォルダがあります",
+                    "error_code": "ITEM_ALREADY_EXISTS"
+                }, code=409)
+        
+        # アイテム自身を移動（同時に移動・削除された場合は競合）
+        now = datetime.now().isoformat()
+        try:
+            table.update_item(
+                Key={'id': item_id},
+                UpdateExpression='SET #path = :path, #name = :name, #parent = :parent, name_key = :name_key, updated_at = :now',
+                ConditionExpression='#path = :old_path AND #name = :old_name',
+                ExpressionAttributeNames={'#path': 'path', '#name': 'name', '#parent': 'parent'},
+                ExpressionAttributeValues={
+                    ':path': new_path,
+                    ':name': new_name,
+                    ':parent': parent_key(username, new_path),
+                    ':name_key': name_key(item.get('type', 'file'), new_name),
+                    ':now': now,
+                    ':old_path': item.get('path'),
+                    ':old_name': item.get('name')
+                }
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return json_response(master, {
+                "success": False,
+                "message": "アイテムが他の操作で変更されました",
+                "error_code": "CONFLICT"
+            }, code=409)
+        
+        if not is_folder:
+            record_usage(master.settings.STORAGE_TABLE, added=[{**item, 'path': new_path}], removed=[item])
+        
+        # フォルダの場合は配下のパスを付け替え
+        if is_folder:
+            new_root = join_path(new_path, new_name)
+            if new_root != old_root:
+                return folder_job_response(master, run_folder_operation(master.settings, username, item, 'move', new_root))
+        
+        return json_response(master, {
+            "success": True,
+            "message": "移動が完了しました",
+            "data": {
+                'id': item_id,
+                'name': new_name,
+                'path': new_path,
+                'updated_at': now
+            }
+        })
+        
+    except Exception as e:
+        logger.exception(f"Move item error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "アイテムの移動に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def get_storage_job(master, job_id):
+    """
+    フォルダの削除・移動のジョブの進捗
+    GET /api/storage/jobs/{job_id}
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        job = get_job(master.settings, job_id)
+        
+        if job is None or job.get('owner') != username:
+            return json_response(master, {
+                "success": False,
+                "message": "ジョブが見つかりません",
+                "error_code": "JOB_NOT_FOUND"
+            }, code=404)
+        
+        return json_response(master, {
+            "success": True,
+            "data": job_summary(job)
+        })
+        
+    except Exception as e:
+        logger.exception(f"Get storage job error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "ジョブの取得に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def spec_error_response(master):
+    """アップロードするファイルの指定が不正な場合のレスポンス"""
+    return json_response(master, {
+        "success": False,
+        "message": "ファイル名またはサイズが不正です",
+        "error_code": "VALIDATION_ERROR"
+    }, code=400)
+
+def bulk_spec_error_response(master, index):
+    """一括アップロードの index 番目のファイルの指定が不正な場合のレスポンス"""
+    return json_response(master, {
+        "success": False,
+        "message": f"{index}番目のファイル名またはサイズが不正です",
+        "error_code": "VALIDATION_ERROR"
+    }, code=400)
+
+def quota_exceeded_response(master):
+    """容量の上限を超える場合のレスポンス"""
+    return json_response(master, {
+        "success": False,
+        "message": "ストレージの容量の上限を超えています",
+        "error_code": "QUOTA_EXCEEDED"
+    }, code=413)
+
+def get_storage_usage(master):
+    """
+    使用量の取得
+    GET /api/storage/usage?path=/
+    pathを指定した場合はそのフォルダ以下の使用量（カウンターを1件読むだけ）
+    """
+    if not master.request.auth:
+        return json_response(master, {
+            "success": False,
+            "message": "認証が必要です",
+            "error_code": "AUTH_REQUIRED"
+        }, code=401)
+    
+    try:
+        username = master.request.decode_token.get('cognito:username')
+        try:
+            path = normalize_path(master.request.query_params.get('path', '/'))
+        except InvalidPath:
+            return json_response(master, {
+                "success": False,
+                "message": "パスが不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        usage = get_usage(master.settings.STORAGE_TABLE, username, path)
+        data = {
+            'path': path,
+            'bytes': usage['bytes'],
+            'files': usage['files']
+        }
+        if path == '/':
+            data['reserved'] = usage['reserved']
+            data['quota_bytes'] = master.settings.STORAGE_QUOTA_BYTES or None
+            data['quota_files'] = master.settings.STORAGE_QUOTA_FILES or None
+        
+        return json_response(master, {
+            "success": True,
+            "data": data
+        })
+        
+    except Exception as e:
+        logger.exception(f"Get storage usage error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "使用量の取得に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
@@ -0,0 +1,82 @@
+"""
+S3へのストリーミング書き込み
+
+受け取ったデータをパートサイズまでバッファし、超えた時点でマルチパートアップロードに切り替える
+（メモリ使用量はパートサイズで上限が決まる）。小さいファイルは1回のPutObjectで保存する
+sha256=True の場合は書き込みながらSHA-256を計算する（重複排除用）
+"""
+import hashlib
+from project.aws import get_s3
+
+# S3のマルチパートアップロードの最小パートサイズは5MB
+PART_SIZE = 8 * 1024 * 1024
+
+class S3StreamWriter:
+    def __init__(self, bucket, key, content_type, part_size=PART_SIZE, sha256=False):
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_size = part_size
+        self.size = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+        self._closed = False
+        self._hash = hashlib.sha256() if sha256 else None
+
+    def hexdigest(self):
+        """書き込んだデータのSHA-256（sha256=Trueの場合のみ）"""
+        return self._hash.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self._hash is not None:
+            self._hash.update(data)
+        self._buffer += data
+        if len(self._buffer) >= self.part_size:
+            self._flush_part()
+
+    def close(self):
+        """書き込みを完了してS3のオブジェクトを確定"""
+        if self._closed:
+            return
+        self._closed = True
+        s3 = get_s3()
+        if self._upload_id is None:
+            s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), ContentType=self.content_type)
+        else:
+            if self._buffer:
+                self._flush_part()
+            s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': self._parts}
+            )
+        self._buffer = bytearray()
+
+    def abort(self):
+        """途中で失敗した場合に書き込んだデータを破棄"""
+        s3 = get_s3()
+        if self._upload_id is not None and not self._closed:
+            s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        elif self._closed:
+            s3.delete_object(Bucket=self.bucket, Key=self.key)
+        self._closed = True
+        self._buffer = bytearray()
+
+    def _flush_part(self):
+        s3 = get_s3()
+        if self._upload_id is None:
+            response = s3.create_multipart_upload(Bucket=self.bucket, Key=self.key, ContentType=self.content_type)
+            self._upload_id = response['UploadId']
+        part_number = len(self._parts) + 1
+        response = s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=bytes(self._buffer)
+        )
+        self._parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        self._buffer = bytearray()
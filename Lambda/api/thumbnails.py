@@ -0,0 +1,142 @@
+"""
+画像のサムネイル・プレビューの作成（Pillowが必要。ない場合は available() が False）
+
+render_variants はプロセスプールのワーカーでも実行できるように、バイト列を受け取ってバイト列を返す。
+メモリ使用量は「同時に処理する画像の数 × 1枚あたりの上限」で決まるので、
+画素数の多い画像は展開せずにスキップし、同時に処理する数は割り当てメモリから決める
+"""
+import io
+import os
+import logging
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# 作成する派生画像（名前, 長辺の最大ピクセル数, 品質）
+VARIANTS = (
+    ('thumb', 256, 75),
+    ('preview', 1280, 80),
+)
+
+# 展開する画像の最大画素数（RGBAで約200MB）
+MAX_PIXELS = 50_000_000
+
+# 1枚の処理に見込むメモリ（MAX_PIXELS の画像を展開した場合）
+WORKER_MEMORY = 256 * 1024 * 1024
+
+# Lambdaのランタイム自体が使うメモリ
+BASE_MEMORY = 128 * 1024 * 1024
+
+# ワーカープロセスを作り直すまでに処理する画像の数（断片化したメモリを解放する）
+TASKS_PER_CHILD = 20
+
+CONTENT_TYPES = {'AVIF': 'image/avif', 'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_format = None
+
+class UnsupportedImage(ValueError):
+    """画像として読めない、または大きすぎる"""
+
+def available():
+    """Pillowが使えるか"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def output_format():
+    """派生画像の形式（AVIF、WebP、JPEGの順に使えるもの）"""
+    global _format
+    if _format is None:
+        from PIL import features
+        if features.check('avif'):
+            _format = 'AVIF'
+        elif features.check('webp'):
+            _format = 'WEBP'
+        else:
+            _format = 'JPEG'
+    return _format
+
+def pool_size():
+    """同時に処理する画像の数（CPU数と割り当てメモリの小さい方）"""
+    memory = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', 0)) * 1024 * 1024
+    by_memory = (memory - BASE_MEMORY) // WORKER_MEMORY if memory else os.cpu_count() or 1
+    return max(1, min(os.cpu_count() or 1, by_memory))
+
+def render_variants(data, variants=VARIANTS, fmt=None):
+    """
+    画像のバイト列から派生画像を作成
+    {名前: {'data', 'content_type', 'extension', 'width', 'height'}} を返す
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    fmt = fmt or output_format()
+    try:
+        image = Image.open(io.BytesIO(data))
+    except (UnidentifiedImageError, OSError) as e:
+        raise UnsupportedImage(str(e)) from e
+    with image:
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise UnsupportedImage(f"too many pixels: {width}x{height}")
+        largest = max(size for _, size, _ in variants)
+        # JPEGはデコード時に1/2〜1/8に縮小できる（展開するメモリと時間を削減）
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha and fmt != 'JPEG' else 'RGB')
+
+        results = {}
+        # 大きい順に縮小し、縮小した画像を次の派生画像の元にする
+        for name, size, quality in sorted(variants, key=lambda v: -v[1]):
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, quality=quality)
+            results[name] = {
+                'data': buffer.getvalue(),
+                'content_type': CONTENT_TYPES[fmt],
+                'extension': EXTENSIONS[fmt],
+                'width': image.width,
+                'height': image.height
+            }
+    return results
+
+def _render(data, fmt):
+    try:
+        return render_variants(data, fmt=fmt)
+    except Exception as e:
+        return e
+
+@contextlib.contextmanager
+def open_pool(workers=None):
+    """
+    派生画像を作成するプロセスプール（1つしか処理しない場合やプロセスプールを作れない場合はNone）
+    Lambdaでは /dev/shm がなくプロセスプールを作れないので、その場合は同じプロセスで順に処理する
+    """
+    workers = workers or pool_size()
+    pool = None
+    if workers > 1:
+        # multiprocessingの読み込みは遅いので、プールを使う場合だけ読み込む
+        from concurrent.futures import ProcessPoolExecutor
+        try:
+            pool = ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=TASKS_PER_CHILD)
+        except (OSError, NotImplementedError) as e:
+            logger.warning(f"process pool is not available, rendering in process: {e}")
+    try:
+        yield pool
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def render_many(sources, pool=None):
+    """
+    複数の画像から派生画像を作成（sources は [(キー, バイト列)]）
+    {キー: render_variants の結果または例外} を返す
+    """
+    fmt = output_format()
+    if pool is None or len(sources) < 2:
+        return {key: _render(data, fmt) for key, data in sources}
+    futures = [(key, pool.submit(_render, data, fmt)) for key, data in sources]
+    return {key: future.result() for key, future in futures}
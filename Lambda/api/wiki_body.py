@@ -0,0 +1,213 @@
+"""
+記事のメタデータと本文の分離（WIKI_BODY_TABLE を設定した場合）
+
+WikiTableのアイテムはタイトル・公開設定・共有設定・更新日時などのメタデータだけを持ち、
+本文（wiki_text の text / text_z / text_codec / text_s3）は同じキー（username, slug）のWikiBodyTableのアイテムに保存する。
+DynamoDBのqueryはProjectionExpressionで属性を絞っても読み込んだアイテム全体のサイズで課金されるため、
+一覧・最近の記事・共有コードの検索が本文の長さに依存しなくなる。
+記事の詳細はメタデータと本文を1回のBatchGetItemで取得する。
+
+本文のアイテムがない記事（移行前の記事）はメタデータのアイテムの本文を使う
+（scripts/split_wiki_bodies.py で移行できる）。WIKI_BODY_TABLE が空の場合は従来どおりメタデータと同じアイテムに保存する
+"""
+import logging
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from project.aws import get_table
+from project.batch import batch_get_tables
+from .wiki_text import TEXT_ATTRIBUTES, encode_text, load_text, discard
+
+logger = logging.getLogger(__name__)
+
+_deserializer = TypeDeserializer()
+
+class BodyPending(Exception):
+    """メタデータの書き込み後、本文のアイテムがまだ保存されていない"""
+
+class VersionConflict(Exception):
+    """条件付き書き込みが失敗した（current は現在のアイテム、記事がなければNone）"""
+    def __init__(self, current):
+        super().__init__("page version conflict")
+        self.current = current
+
+def is_split(settings):
+    """本文を別のテーブルに保存するか"""
+    return bool(settings.WIKI_BODY_TABLE)
+
+def encode_page_text(settings, username, slug, text):
+    """
+    本文を保存する属性に変換し、(メタデータのアイテムに設定する属性, 削除する属性のリスト, 本文のアイテムの属性) を返す
+    本文を別のテーブルに保存する場合は、メタデータのアイテムからは本文の属性（移行前のもの）を削除する
+    （本文のアイテムの属性はメタデータの書き込みに成功してから save_body で保存する。同じテーブルならNone）
+    """
+    attributes, removed = encode_text(settings, username, slug, text)
+    if not is_split(settings):
+        return attributes, removed, None
+    return {}, list(TEXT_ATTRIBUTES), attributes
+
+def save_body(settings, username, slug, body, version):
+    """本文のアイテムを保存（同時に更新された場合に、新しいversionの本文を古い本文で上書きしない）"""
+    if body is None:
+        return
+    try:
+        response = get_table(settings.WIKI_BODY_TABLE).put_item(
+            Item={'username': username, 'slug': slug, 'version': version, **body},
+            ConditionExpression='attribute_not_exists(version) OR version < :version',
+            ExpressionAttributeValues={':version': version},
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        discard(settings, body)
+        return
+    discard(settings, response.get('Attributes'))
+
+def _current_item(error):
+    """条件付き書き込みが失敗した時点のアイテム（ReturnValuesOnConditionCheckFailure、なければNone）"""
+    item = error.response.get('Item')
+    if not item:
+        return None
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
+
+def create_page_item(settings, page_data, text):
+    """
+    記事を1回の条件付きput_itemで新規作成し、保存したアイテムを返す（version は1から始まる）
+    既に存在する場合はVersionConflict
+    """
+    attributes, _, body = encode_page_text(settings, page_data['username'], page_data['slug'], text)
+    item = {**page_data, **attributes, 'version': 1}
+    if body is not None:
+        # 本文のアイテムの保存を待つ処理（検索のインデックスなど）のため、保存する本文のversionを記録する
+        item['body_version'] = 1
+    try:
+        get_table(settings.WIKI_TABLE).put_item(
+            Item=item,
+            ConditionExpression='attribute_not_exists(username)',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+    except ClientError as e:
+        discard(settings, attributes, body)
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise VersionConflict(_current_item(e))
+        raise
+    save_body(settings, page_data['username'], page_data['slug'], body, 1)
+    return item
+
+def update_page_item(settings, username, slug, update_data, remove_attributes=(), text=None, expected_version=None,
+                     share_code=None):
+    """
+    記事を1回の条件付きupdate_itemで更新し、更新後のアイテムを返す（version を1つ増やす）
+    expected_version を指定した場合は現在の version が一致する場合だけ更新する。
+    share_code を指定した場合（共有コードによる編集）は、共有・共有先の編集権限が有効で共有コードが変わっていない場合だけ更新する。
+    条件を満たさない場合や記事がない場合はVersionConflict（記事がなければ current がNone）
+    """
+    update_data = dict(update_data)
+    remove_attributes = list(remove_attributes)
+    body = None
+    if text is not None:
+        attributes, removed, body = encode_page_text(settings, username, slug, text)
+        update_data.update(attributes)
+        remove_attributes.extend(removed)
+    
+    # version のない移行前の記事は0として扱う
+    assignments = [f"#{k} = :{k}" for k in update_data.keys()]
+    assignments.append("#version = if_not_exists(#version, :zero) + :one")
+    if body is not None:
+        # 本文のアイテムの保存を待つ処理（検索のインデックスなど）のため、保存する本文のversionを記録する
+        assignments.append("#body_version = if_not_exists(#version, :zero) + :one")
+    update_expression = "SET " + ", ".join(assignments)
+    if remove_attributes:
+        update_expression += " REMOVE " + ", ".join([f"#{k}" for k in remove_attributes])
+    expression_attribute_names = {f"#{k}": k for k in list(update_data.keys()) + remove_attributes}
+    expression_attribute_names['#version'] = 'version'
+    if body is not None:
+        expression_attribute_names['#body_version'] = 'body_version'
+    expression_attribute_values = {f":{k}": v for k, v in update_data.items()}
+    expression_attribute_values[':zero'] = 0
+    expression_attribute_values[':one'] = 1
+    condition = 'attribute_exists(username)'
+    if expected_version is not None:
+        if expected_version == 0:
+            condition += ' AND (attribute_not_exists(#version) OR #version = :expected)'
+        else:
+            condition += ' AND #version = :expected'
+        expression_attribute_values[':expected'] = expected_version
+    if share_code is not None:
+        condition += ' AND #share = :true AND #share_edit_permission = :true AND #share_code = :share_code'
+        expression_attribute_names.update({
+            '#share': 'share',
+            '#share_edit_permission': 'share_edit_permission',
+            '#share_code': 'share_code'
+        })
+        expression_attribute_values[':true'] = True
+        expression_attribute_values[':share_code'] = share_code
+    
+    # 以前の本文をS3から削除するため、更新前のアイテムを受け取る
+    try:
+        response = get_table(settings.WIKI_TABLE).update_item(
+            Key={'username': username, 'slug': slug},
+            UpdateExpression=update_expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=expression_attribute_names,
+            ExpressionAttributeValues=expression_attribute_values,
+            ReturnValues='ALL_OLD',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+    except ClientError as e:
+        discard(settings, update_data, body)
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise VersionConflict(_current_item(e))
+        raise
+    old_page = response['Attributes']
+    page = {**old_page, **update_data, 'version': int(old_page.get('version', 0)) + 1}
+    if body is not None:
+        page['body_version'] = page['version']
+    for name in remove_attributes:
+        page.pop(name, None)
+    if text is not None:
+        discard(settings, old_page)
+        save_body(settings, username, slug, body, page['version'])
+    return page
+
+def get_page_item(settings, username, slug, consistent=False):
+    """
+    メタデータと本文をまとめたアイテムを取得（記事がなければNone）
+    consistent の場合は強い整合性で読み込み、本文のアイテムがメタデータに記録した body_version より古ければBodyPending
+    """
+    key = {'username': username, 'slug': slug}
+    if not is_split(settings):
+        return get_table(settings.WIKI_TABLE).get_item(Key=key, ConsistentRead=consistent).get('Item')
+    items = batch_get_tables({settings.WIKI_TABLE: [key], settings.WIKI_BODY_TABLE: [key]}, consistent=consistent)
+    if not items[settings.WIKI_TABLE]:
+        return None
+    page = items[settings.WIKI_TABLE][0]
+    body = items[settings.WIKI_BODY_TABLE][0] if items[settings.WIKI_BODY_TABLE] else None
+    if consistent and 'body_version' in page and (body is None or body.get('version', 0) < page['body_version']):
+        raise BodyPending(f"{username}/{slug}")
+    if body:
+        page = {k: v for k, v in page.items() if k not in TEXT_ATTRIBUTES}
+        page.update({k: v for k, v in body.items() if k in TEXT_ATTRIBUTES})
+    return page
+
+def load_page_text(settings, page):
+    """
+    メタデータのアイテムの記事の本文を文字列で返す（本文がなければNone）
+    メタデータのアイテムに本文がなければ本文のアイテムから読み込む
+    """
+    if any(name in page for name in TEXT_ATTRIBUTES) or not is_split(settings):
+        return load_text(settings, page)
+    body = get_table(settings.WIKI_BODY_TABLE).get_item(
+        Key={'username': page['username'], 'slug': page['slug']}
+    ).get('Item')
+    return load_text(settings, body) if body else None
+
+def delete_body(settings, username, slug):
+    """本文のアイテムとS3の本文を削除"""
+    if not is_split(settings):
+        return
+    response = get_table(settings.WIKI_BODY_TABLE).delete_item(
+        Key={'username': username, 'slug': slug},
+        ReturnValues='ALL_OLD'
+    )
+    discard(settings, response.get('Attributes'))
@@ -0,0 +1,70 @@
+"""
+CloudFrontにキャッシュした記事のレスポンスの無効化（CDN_DISTRIBUTION_ID を設定した場合）
+
+パブリック記事（GET /api/wiki/{username}/{slug}）とその共有記事（GET /api/share/{shareCode}）は
+WIKI_EDGE_MAX_AGE 秒CloudFrontにキャッシュされるため、stream_function.py が変更のあった記事のパスを無効化する。
+非公開の記事の共有記事は private で返すのでCloudFrontにはキャッシュされない。
+クエリパラメータ（render=html など）の違うレスポンスもまとめて無効化するため、パスの末尾は * にする。
+内容の更新だけなら無効化に失敗しても WIKI_EDGE_MAX_AGE 秒後には新しい内容になるが、
+非公開・削除・共有の解除（revokes_access）の無効化はストリームの処理で再試行する
+"""
+import hashlib
+import logging
+from urllib.parse import quote
+from project.aws import get_client
+
+logger = logging.getLogger(__name__)
+
+WIKI_PATH_PREFIX = '/api/wiki/'
+SHARE_PATH_PREFIX = '/api/share/'
+
+# 1回の無効化でパスを個別に指定する上限（超えた場合は記事と共有記事のパス全体を無効化する）
+MAX_PATHS = 10
+
+def is_edge_cached(page):
+    """記事のレスポンスがCloudFrontにキャッシュされうるか（パブリック記事か共有中の記事）"""
+    return bool(page) and bool(page.get('public', False) or page.get('share', False))
+
+def revokes_access(old, new):
+    """記事の変更で、CloudFrontにキャッシュされたレスポンスを返してはいけなくなったか（非公開・削除・共有の解除・共有コードの変更）"""
+    if not old or not old.get('public', False):
+        return False
+    if not new or not new.get('public', False):
+        return True
+    return bool(old.get('share', False)) and (
+        not new.get('share', False) or new.get('share_code') != old.get('share_code')
+    )
+
+def _path(prefix, *segments):
+    return prefix + '/'.join(quote(segment, safe='') for segment in segments) + '*'
+
+def page_paths(old, new):
+    """記事の変更（変更前後のアイテム、ない場合はNone）で無効化するパスの集合"""
+    paths = set()
+    for page in (old, new):
+        if not is_edge_cached(page):
+            continue
+        paths.add(_path(WIKI_PATH_PREFIX, page['username'], page['slug']))
+        if page.get('share', False) and page.get('share_code'):
+            paths.add(_path(SHARE_PATH_PREFIX, page['share_code']))
+    return paths
+
+def invalidate(distribution_id, paths, reference):
+    """
+    パスを無効化する（reference が同じ呼び出しは1回の無効化として扱われ、再試行しても重複しない）
+    """
+    if not paths:
+        return None
+    if len(paths) > MAX_PATHS:
+        paths = {WIKI_PATH_PREFIX + '*', SHARE_PATH_PREFIX + '*'}
+    items = sorted(paths)
+    response = get_client('cloudfront').create_invalidation(
+        DistributionId=distribution_id,
+        InvalidationBatch={
+            'Paths': {'Quantity': len(items), 'Items': items},
+            'CallerReference': hashlib.sha256(reference.encode('utf-8')).hexdigest()[:64]
+        }
+    )
+    invalidation_id = response['Invalidation']['Id']
+    logger.info(f"invalidation {invalidation_id}: {items}")
+    return invalidation_id
@@ -0,0 +1,249 @@
+"""
+記事一覧・階層データ（treeData）の事前計算（WIKI_NAV_TABLE を設定した場合）
+
+WikiTableのDynamoDB Streamsを stream_function.py で受け取り、変更のあったユーザーごとに WikiNavTable の
+アイテムを差分で更新する。DynamoDBのアイテムの上限（400KB）を超えないように、記事は分割して保存する。
+- user#{username}: ユーザーのヘッダー（version、全記事・パブリック記事の件数と分割数）
+- pages#{username}#{version}#{n}: そのユーザーの全記事のn番目の分割（slug順、CHUNK_BYTES まで）
+- public#{username}#{version}#{n}: そのユーザーのパブリック記事のn番目の分割
+- public-index#{shard}: パブリック記事のあるユーザーの索引（ユーザー名のハッシュで PUBLIC_SHARDS 個に分け、
+  ユーザーごとの属性 user#{username} に version・件数・分割数を持つ）
+
+分割は version ごとに別のアイテムに書き込んでからヘッダー・索引を新しい version に切り替え、古い分割を削除する。
+階層データのHTMLは読み込んだ記事から返すときに作る。
+get_pages はヘッダーと索引を1回のBatchGetItemで読み、返す範囲のユーザーの分割だけを読み込む。
+アイテムは scripts/build_wiki_nav.py で作り直せる
+"""
+import json
+import html
+import zlib
+import logging
+from datetime import datetime
+from botocore.exceptions import ClientError
+from project.aws import get_table
+from project.batch import batch_get_items, batch_write
+
+logger = logging.getLogger(__name__)
+
+USER_PREFIX = 'user#'
+PAGES_PREFIX = 'pages#'
+PUBLIC_PREFIX = 'public#'
+PUBLIC_INDEX_PREFIX = 'public-index#'
+
+# パブリック記事のあるユーザーの索引の分割数（1つの索引のアイテムに約1万ユーザーまで）
+PUBLIC_SHARDS = 16
+
+# 1つの分割に入れる記事の大きさ（JSONのバイト数の目安。400KBの上限に余裕を持たせる）
+CHUNK_BYTES = 256 * 1024
+
+# ユーザーの更新が競合した場合の再試行回数
+MAX_ATTEMPTS = 5
+
+class NavConflict(Exception):
+    """再試行してもユーザーの更新が競合した"""
+
+def user_id(username):
+    """ユーザーのヘッダーのID"""
+    return USER_PREFIX + username
+
+def chunk_id(prefix, username, version, index):
+    """記事の分割のID（prefix は PAGES_PREFIX または PUBLIC_PREFIX）"""
+    return f"{prefix}{username}#{version}#{index}"
+
+def public_index_id(username):
+    """ユーザーが載る索引のID"""
+    return f"{PUBLIC_INDEX_PREFIX}{zlib.crc32(username.encode('utf-8')) % PUBLIC_SHARDS}"
+
+def public_index_ids():
+    """すべての索引のID"""
+    return [f"{PUBLIC_INDEX_PREFIX}{shard}" for shard in range(PUBLIC_SHARDS)]
+
+def page_entry(item):
+    """WikiTableのアイテムから保存する記事を作成"""
+    return {
+        'slug': item['slug'],
+        'title': item.get('title') or '',
+        'priority': item.get('priority', 0),
+        'public': bool(item.get('public', False)),
+        'last_updated': item.get('last_updated') or ''
+    }
+
+def tree_order(entries):
+    """階層データの並び順（priorityの降順、同じ場合はslug順）"""
+    return sorted(entries, key=lambda entry: (-entry.get('priority', 0), entry['slug']))
+
+def render_tree(username, entries):
+    """ユーザーの階層データのHTML"""
+    user = html.escape(username)
+    parts = [f"<h3>{user}</h3><ul>"]
+    for entry in tree_order(entries):
+        parts.append(
+            f"<li><a href=\"/{user}/{html.escape(entry['slug'])}\">{html.escape(entry['title'])}</a></li>"
+        )
+    parts.append("</ul>")
+    return "".join(parts)
+
+def split_chunks(entries):
+    """slug順の記事を CHUNK_BYTES ごとの分割にする"""
+    chunks = []
+    current = []
+    size = 0
+    for entry in sorted(entries, key=lambda entry: entry['slug']):
+        entry_size = len(json.dumps(entry, ensure_ascii=False, default=str).encode('utf-8'))
+        if current and size + entry_size > CHUNK_BYTES:
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(entry)
+        size += entry_size
+    if current:
+        chunks.append(current)
+    return chunks
+
+def chunk_items(prefix, username, version, chunks):
+    """分割を保存するアイテム"""
+    return [
+        {'id': chunk_id(prefix, username, version, index), 'pages': chunk}
+        for index, chunk in enumerate(chunks)
+    ]
+
+def chunk_keys(prefix, username, version, count):
+    """分割のキー"""
+    return [{'id': chunk_id(prefix, username, version, index)} for index in range(count)]
+
+def load_chunks(table_name, requests):
+    """
+    分割を読み込み、{(prefix, username): slug順の記事} を返す
+    requests は [(prefix, username, version, 分割数)]。読み込めなかった分割（更新中に削除されたもの）は除く
+    """
+    keys = []
+    for prefix, username, version, count in requests:
+        keys.extend(chunk_keys(prefix, username, version, count))
+    items = {item['id']: item for item in batch_get_items(table_name, keys)} if keys else {}
+    result = {}
+    for prefix, username, version, count in requests:
+        pages = []
+        for index in range(count):
+            item = items.get(chunk_id(prefix, username, version, index))
+            if item is not None:
+                pages.extend(item['pages'])
+        result[(prefix, username)] = pages
+    return result
+
+def load_user_pages(table_name, head):
+    """ヘッダーの version の全記事 {slug: 記事}（分割が欠けていればNone）"""
+    if not head:
+        return {}
+    username = head['id'][len(USER_PREFIX):]
+    count = int(head.get('chunks', 0))
+    keys = chunk_keys(PAGES_PREFIX, username, int(head['version']), count)
+    items = batch_get_items(table_name, keys) if keys else []
+    if len(items) != count:
+        return None
+    return {entry['slug']: entry for item in items for entry in item['pages']}
+
+def apply_changes(table_name, username, changes):
+    """
+    ユーザーの記事の変更（[(slug, 記事またはNone)]、古い順）を反映
+    新しい version の分割を書き込んでから、ヘッダーを version による楽観ロックで切り替える
+    """
+    table = get_table(table_name)
+    for _ in range(MAX_ATTEMPTS):
+        head = table.get_item(Key={'id': user_id(username)}, ConsistentRead=True).get('Item') or {}
+        version = int(head.get('version', 0))
+        pages = load_user_pages(table_name, head)
+        if pages is None:
+            # 読み込み中に他の更新が古い分割を削除した
+            continue
+        for slug, entry in changes:
+            if entry is None:
+                pages.pop(slug, None)
+            else:
+                pages[slug] = entry
+
+        new_version = version + 1
+        page_chunks = split_chunks(pages.values())
+        public_chunks = split_chunks(entry for entry in pages.values() if entry['public'])
+        new_items = (chunk_items(PAGES_PREFIX, username, new_version, page_chunks) +
+                     chunk_items(PUBLIC_PREFIX, username, new_version, public_chunks))
+        batch_write(table_name, put_items=new_items)
+        condition = {
+            'ConditionExpression': 'attribute_not_exists(id) OR version = :version',
+            'ExpressionAttributeValues': {':version': version}
+        }
+        try:
+            if pages:
+                table.put_item(
+                    Item={
+                        'id': user_id(username),
+                        'version': new_version,
+                        'count': len(pages),
+                        'chunks': len(page_chunks),
+                        'public_count': sum(len(chunk) for chunk in public_chunks),
+                        'public_chunks': len(public_chunks),
+                        'updated_at': datetime.now().isoformat()
+                    },
+                    **condition
+                )
+            else:
+                table.delete_item(Key={'id': user_id(username)}, **condition)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                batch_write(table_name, delete_keys=[{'id': item['id']} for item in new_items])
+                continue
+            raise
+        set_public(table_name, username, new_version, public_chunks)
+        if head:
+            batch_write(table_name, delete_keys=(
+                chunk_keys(PAGES_PREFIX, username, version, int(head.get('chunks', 0))) +
+                chunk_keys(PUBLIC_PREFIX, username, version, int(head.get('public_chunks', 0)))
+            ))
+        return
+    raise NavConflict(username)
+
+def set_public(table_name, username, version, public_chunks):
+    """
+    索引のユーザーの属性だけを更新（他のユーザーの更新と競合しない）
+    索引のアイテム・属性がなくても作られ、既に新しい version が反映されていれば何もしない
+    """
+    names = {'#user': user_id(username)}
+    values = {':version': version}
+    if public_chunks:
+        expression = 'SET #user = :user'
+        values[':user'] = {
+            'version': version,
+            'count': sum(len(chunk) for chunk in public_chunks),
+            'chunks': len(public_chunks)
+        }
+    else:
+        expression = 'REMOVE #user'
+    try:
+        get_table(table_name).update_item(
+            Key={'id': public_index_id(username)},
+            UpdateExpression=expression,
+            ConditionExpression='attribute_not_exists(#user) OR #user.version < :version',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def load_index(table_name, current_user=None):
+    """
+    (自分のヘッダー, パブリック記事のあるユーザー {username: {'version', 'count', 'chunks'}}) を取得
+    （ないものは空）
+    """
+    keys = [{'id': doc_id} for doc_id in public_index_ids()]
+    if current_user:
+        keys.append({'id': user_id(current_user)})
+    own = {}
+    users = {}
+    for item in batch_get_items(table_name, keys):
+        if item['id'].startswith(USER_PREFIX):
+            own = item
+            continue
+        for name, value in item.items():
+            if name.startswith(USER_PREFIX):
+                users[name[len(USER_PREFIX):]] = value
+    return own, users
@@ -0,0 +1,144 @@
+"""
+記事本文のMarkdownのHTMLへの変換（markdown-it-pyが必要。ない場合は available() が False）
+
+生のHTMLは出力せずにエスケープし（html=False）、javascript: などのリンクは markdown-it の検証で除く。
+見出しにはアンカー（id）を付け、目次（toc）を返す。
+
+変換結果は「RENDERER_VERSION と本文」のSHA-256をキーに、Lambdaのメモリ（LRU）と
+S3の rendered/{ハッシュ}.json にキャッシュする（内容から決まるキーなので上書きは不要）。
+S3の変換結果は記事の更新・削除とは関係なくライフサイクルルール（template.yaml）で7日後に削除され、
+古い本文（非公開の記事を含む）がバケットに残り続けない。削除後に閲覧された場合は変換し直して保存する。
+S3へはストリームの処理（stream_function.py）で更新時に書き込むので、閲覧時は変換済みの結果を読み込むだけになる
+"""
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from project.aws import get_s3
+
+logger = logging.getLogger(__name__)
+
+# 変換結果が変わる変更をした場合に上げる（キャッシュのキーに含まれる）
+RENDERER_VERSION = 1
+
+RENDERED_KEY_PREFIX = 'rendered/'
+
+# メモリにキャッシュする変換結果の数
+CACHE_SIZE = 256
+
+# アンカーに使わない文字（記号と空白以外は日本語も含めてそのまま使う）
+_ANCHOR_STRIP_RE = re.compile(r'[^\w\- ]')
+
+_markdown = None
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def available():
+    """markdown-it-pyが使えるか"""
+    try:
+        import markdown_it  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def _parser():
+    global _markdown
+    if _markdown is None:
+        from markdown_it import MarkdownIt
+        _markdown = MarkdownIt('commonmark', {'html': False, 'linkify': False}).enable(['table', 'strikethrough'])
+    return _markdown
+
+def render_key(text):
+    """変換結果のキャッシュのキー"""
+    return hashlib.sha256(f"{RENDERER_VERSION}\n{text}".encode('utf-8')).hexdigest()
+
+def anchor(text, used):
+    """見出しのアンカー（同じものが既にあれば -1, -2 ... を付ける）"""
+    base = _ANCHOR_STRIP_RE.sub('', unicodedata.normalize('NFKC', text).casefold()).strip().replace(' ', '-') or 'section'
+    candidate = base
+    number = 0
+    while candidate in used:
+        number += 1
+        candidate = f"{base}-{number}"
+    used.add(candidate)
+    return candidate
+
+def render_markdown(text):
+    """MarkdownをHTMLに変換し、{'html', 'toc': [{'level', 'id', 'text'}]} を返す"""
+    md = _parser()
+    env = {}
+    tokens = md.parse(text or '', env)
+    toc = []
+    used = set()
+    for i, token in enumerate(tokens):
+        if token.type != 'heading_open':
+            continue
+        inline = tokens[i + 1]
+        # 見出しの表示上の文字列（強調やリンクの記法を除く）
+        title = ''.join(child.content for child in (inline.children or []) if child.type in ('text', 'code_inline'))
+        anchor_id = anchor(title, used)
+        token.attrSet('id', anchor_id)
+        toc.append({'level': int(token.tag[1]), 'id': anchor_id, 'text': title})
+    return {'html': md.renderer.render(tokens, md.options, env), 'toc': toc}
+
+def _remember(key, rendered):
+    with _cache_lock:
+        _cache[key] = rendered
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def _rendered_key(key):
+    return f"{RENDERED_KEY_PREFIX}{key}.json"
+
+def _put(settings, key, rendered):
+    get_s3().put_object(
+        Bucket=settings.S3_BUCKET,
+        Key=_rendered_key(key),
+        Body=json.dumps(rendered, ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+        ContentType='application/json; charset=utf-8'
+    )
+
+def store(settings, text):
+    """変換結果をS3に保存（既にあれば何もしない）し、キャッシュのキーを返す"""
+    key = render_key(text)
+    s3 = get_s3()
+    try:
+        s3.head_object(Bucket=settings.S3_BUCKET, Key=_rendered_key(key))
+        return key
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+    rendered = render_markdown(text)
+    _put(settings, key, rendered)
+    _remember(key, rendered)
+    return key
+
+def render(settings, text):
+    """
+    本文の変換結果を返す（メモリ、S3の順にキャッシュを探し、なければ変換してS3に保存する）
+    """
+    key = render_key(text)
+    with _cache_lock:
+        rendered = _cache.get(key)
+        if rendered is not None:
+            _cache.move_to_end(key)
+            return rendered
+    s3 = get_s3()
+    try:
+        body = s3.get_object(Bucket=settings.S3_BUCKET, Key=_rendered_key(key))['Body'].read()
+        rendered = json.loads(body)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        rendered = render_markdown(text)
+        try:
+            _put(settings, key, rendered)
+        except Exception as put_error:
+            logger.warning(f"store rendered html failed: {put_error}")
+    _remember(key, rendered)
+    return rendered
@@ -0,0 +1,261 @@
+"""
+記事の全文検索（WIKI_SEARCH_TABLE を設定した場合）
+
+タイトルと本文を NFKC・casefold で正規化し、日本語（ひらがな・カタカナ・漢字）は文字の2-gram、
+それ以外は単語をトークンにする（形態素解析は使わない）。
+
+WikiSearchTable のアイテム
+- 転置インデックス: pk = {スコープ}#{フィールド}#{トークン}, sk = シャード番号、docs = 記事のキー（username/slug）の集合
+  スコープは記事の所有者（user#{username}）と、パブリック記事の public。フィールドは本文（b、タイトルを含む）とタイトル（t）
+  1つのトークンの記事は SHARDS 個のアイテムに分けて持ち、ADD / DELETE で更新する（読み込みと書き込みの競合がない）
+- 記事: pk = doc#{username}/{slug}, sk = doc、インデックスに登録したトークンとスコープ、一覧に表示する属性
+
+stream_function.py がWikiTableの変更のあった記事を index_page で登録し直し、前回登録したトークンとの差分だけを更新する。
+転置インデックスの更新はトークン・スコープごとに1回のUpdateItem（集合へのADD / DELETEはBatchWriteItemにできない）なので、
+長い日本語の記事を初めて登録すると2-gramの数だけ書き込みが発生する。1つの記事の本文のトークンは出現順に
+MAX_BODY_TERMS 個までにし（それ以降にだけ現れる語では検索できない）、書き込みは（トークン数 + タイトルのトークン数）×スコープ数が上限になる。
+検索は各トークンの記事の集合の積で、トークンごとの記事の集合はLambdaのメモリに SEARCH_CACHE_TTL 秒キャッシュする
+"""
+import re
+import gzip
+import time
+import zlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from boto3.dynamodb.conditions import Key
+from project.aws import get_table
+from project.batch import batch_get_items
+from .wiki_body import get_page_item
+from .wiki_text import load_text
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_SCOPE = 'public'
+USER_SCOPE_PREFIX = 'user#'
+DOC_PREFIX = 'doc#'
+DOC_SK = 'doc'
+
+# 本文（タイトルを含む）とタイトル
+FIELD_BODY = 'b'
+FIELD_TITLE = 't'
+
+# 1つのトークンの記事を分けるアイテムの数
+SHARDS = 16
+
+# インデックスの更新・検索で並列に実行するDynamoDBのリクエスト数
+WORKERS = 16
+
+# 検索語のトークン数の上限
+MAX_QUERY_TOKENS = 32
+
+# 1つの記事の本文（タイトルを含む）から登録するトークン数の上限（初回の登録の書き込み数を抑える）
+MAX_BODY_TERMS = 2000
+
+# キャッシュするトークンの数
+CACHE_SIZE = 20000
+
+# ひらがな・カタカナ・漢字の連続と、それ以外の単語
+_CJK = r'぀-ヿ㐀-䶿一-鿿豈-﫿々ー'
+_TOKEN_RE = re.compile(rf'[{_CJK}]+|[^\W{_CJK}]+')
+_CJK_RE = re.compile(rf'[{_CJK}]')
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def normalize(text):
+    """全角・半角、大文字・小文字の違いをなくす"""
+    return unicodedata.normalize('NFKC', text or '').casefold()
+
+def iter_tokens(text):
+    """テキストのトークンを出現順に返す（日本語は2-gram、1文字だけの場合はその文字）"""
+    for run in _TOKEN_RE.findall(normalize(text)):
+        if not _CJK_RE.match(run) or len(run) == 1:
+            yield run
+        else:
+            yield from (run[i:i + 2] for i in range(len(run) - 1))
+
+def tokenize(text):
+    """テキストのトークンの集合"""
+    return set(iter_tokens(text))
+
+def doc_key(username, slug):
+    """転置インデックスに保存する記事のキー"""
+    return f"{username}/{slug}"
+
+def shard(doc):
+    """記事を保存するシャード（プロセスによらず同じ値になるようにcrc32を使う）"""
+    return f"{zlib.crc32(doc.encode('utf-8')) % SHARDS:02d}"
+
+def posting_key(scope, field, token):
+    return f"{scope}#{field}#{token}"
+
+def page_scopes(page):
+    """記事を検索できるスコープ（所有者と、パブリック記事は全員）"""
+    scopes = {USER_SCOPE_PREFIX + page['username']}
+    if page.get('public', False):
+        scopes.add(PUBLIC_SCOPE)
+    return scopes
+
+def page_terms(page, text):
+    """記事のフィールドとトークンの組の集合"""
+    title = page.get('title') or ''
+    terms = {(FIELD_TITLE, token) for token in tokenize(title)}
+    body = dict.fromkeys(iter_tokens(title + '\n' + (text or '')))
+    terms.update((FIELD_BODY, token) for token in list(body)[:MAX_BODY_TERMS])
+    return terms
+
+def _encode_terms(terms):
+    return gzip.compress('\n'.join(f"{field}{token}" for field, token in sorted(terms)).encode('utf-8'), mtime=0)
+
+def _decode_terms(data):
+    if not data:
+        return set()
+    lines = gzip.decompress(getattr(data, 'value', data)).decode('utf-8').split('\n')
+    return {(line[0], line[1:]) for line in lines if line}
+
+def index_page(settings, username, slug):
+    """
+    記事の現在の内容でインデックスを更新（前回登録した内容との差分だけを書き込む。記事がなければ削除する）
+    本文のアイテムがまだ保存されていなければ wiki_body.BodyPending（ストリームの処理で再試行する）
+    """
+    table = get_table(settings.WIKI_SEARCH_TABLE)
+    doc = doc_key(username, slug)
+    page = get_page_item(settings, username, slug, consistent=True)
+    indexed = table.get_item(Key={'pk': DOC_PREFIX + doc, 'sk': DOC_SK}, ConsistentRead=True).get('Item') or {}
+
+    old = {
+        (scope, field, token)
+        for scope in indexed.get('scopes', ())
+        for field, token in _decode_terms(indexed.get('terms'))
+    }
+    if page is None:
+        terms, scopes, new = set(), set(), set()
+    else:
+        terms = page_terms(page, load_text(settings, page))
+        scopes = page_scopes(page)
+        new = {(scope, field, token) for scope in scopes for field, token in terms}
+
+    changes = [('ADD', key) for key in new - old] + [('DELETE', key) for key in old - new]
+    if changes:
+        sk = shard(doc)
+        def apply(change):
+            action, (scope, field, token) = change
+            # Tableはスレッドセーフではないので、ワーカーごとに get_table で取得する
+            get_table(settings.WIKI_SEARCH_TABLE).update_item(
+                Key={'pk': posting_key(scope, field, token), 'sk': sk},
+                UpdateExpression=f"{action} docs :doc",
+                ExpressionAttributeValues={':doc': {doc}}
+            )
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            list(executor.map(apply, changes))
+
+    if page is None:
+        table.delete_item(Key={'pk': DOC_PREFIX + doc, 'sk': DOC_SK})
+    else:
+        table.put_item(Item={
+            'pk': DOC_PREFIX + doc,
+            'sk': DOC_SK,
+            'username': username,
+            'slug': slug,
+            'title': page.get('title') or '',
+            'public': bool(page.get('public', False)),
+            'last_updated': page.get('last_updated') or '',
+            'scopes': sorted(scopes),
+            'terms': _encode_terms(terms),
+            'indexed_at': datetime.now().isoformat()
+        })
+    return len(changes)
+
+def _load_postings(table_name, key):
+    """トークンの記事の集合（全シャード。postings のワーカーから呼ばれ、Tableはワーカーごとに取得する）"""
+    table = get_table(table_name)
+    docs = set()
+    query_kwargs = {'KeyConditionExpression': Key('pk').eq(key), 'ProjectionExpression': 'docs'}
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response['Items']:
+            docs.update(item.get('docs', ()))
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return frozenset(docs)
+
+def postings(settings, keys):
+    """{キー: 記事の集合}（キャッシュにないものだけ並列に読み込む）"""
+    now = time.monotonic()
+    result = {}
+    with _cache_lock:
+        for key in keys:
+            cached = _cache.get(key)
+            if cached and now - cached[0] < settings.SEARCH_CACHE_TTL:
+                _cache.move_to_end(key)
+                result[key] = cached[1]
+    missing = [key for key in keys if key not in result]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(WORKERS, len(missing))) as executor:
+            loaded = dict(zip(missing, executor.map(lambda key: _load_postings(settings.WIKI_SEARCH_TABLE, key), missing)))
+        with _cache_lock:
+            for key, docs in loaded.items():
+                _cache[key] = (now, docs)
+                _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        result.update(loaded)
+    return result
+
+def search(settings, query, current_user=None):
+    """
+    検索語のトークンをすべて含む記事のキーを返す（タイトルに含むものを先に、それぞれキーの順）
+    トークンがなければ空のリスト
+    """
+    tokens = sorted(tokenize(query))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return []
+    scopes = [PUBLIC_SCOPE]
+    if current_user:
+        scopes.append(USER_SCOPE_PREFIX + current_user)
+    keys = [posting_key(scope, field, token) for scope in scopes for field in (FIELD_BODY, FIELD_TITLE) for token in tokens]
+    loaded = postings(settings, keys)
+
+    def intersect(scope, field):
+        # 記事の少ないトークンから順に積を取る
+        sets = sorted((loaded[posting_key(scope, field, token)] for token in tokens), key=len)
+        docs = set(sets[0])
+        for other in sets[1:]:
+            if not docs:
+                break
+            docs &= other
+        return docs
+
+    matched, title_matched = set(), set()
+    for scope in scopes:
+        matched |= intersect(scope, FIELD_BODY)
+        title_matched |= intersect(scope, FIELD_TITLE)
+    return sorted(title_matched & matched) + sorted(matched - title_matched)
+
+def load_docs(settings, docs, current_user=None):
+    """記事のキーから一覧に表示する属性を取得（キャッシュの間に非公開になった他のユーザーの記事は除く）"""
+    items = batch_get_items(
+        settings.WIKI_SEARCH_TABLE,
+        [{'pk': DOC_PREFIX + doc, 'sk': DOC_SK} for doc in docs],
+        projection='pk, username, slug, title, #public, last_updated',
+        attribute_names={'#public': 'public'}
+    )
+    by_doc = {item['pk'][len(DOC_PREFIX):]: item for item in items}
+    results = []
+    for doc in docs:
+        item = by_doc.get(doc)
+        if item is None or (not item.get('public', False) and item.get('username') != current_user):
+            continue
+        results.append({
+            'username': item['username'],
+            'slug': item['slug'],
+            'title': item.get('title'),
+            'public': item.get('public', False),
+            'last_updated': item.get('last_updated')
+        })
+    return results
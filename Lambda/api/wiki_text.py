@@ -0,0 +1,112 @@
+"""
+記事本文（text）の保存形式
+
+短い本文はそのまま text に保存する。WIKI_TEXT_COMPRESS_BYTES 以上の本文は圧縮してBinaryの text_z に保存し、
+形式を text_codec（zstd / gzip）に持つ。圧縮してもアイテムに収まらない本文（WIKI_TEXT_SPILL_BYTES 超）は
+S3の wiki-text/{username}/{slug}/{uuid} に保存して text_s3 にキーを持つ。
+読み込み時は load_text で元の文字列に戻すので、レスポンスの形式は変わらない。
+DynamoDBの読み書きの消費キャパシティユニットはアイテムのサイズで決まるため、圧縮した分だけ減る
+"""
+import gzip
+import uuid
+import logging
+from project.aws import get_s3
+
+logger = logging.getLogger(__name__)
+
+# 本文を保存する属性（どれか1つの形式で保存し、他の属性は削除する）
+TEXT_ATTRIBUTES = ('text', 'text_z', 'text_codec', 'text_s3')
+
+TEXT_KEY_PREFIX = 'wiki-text/'
+
+ZSTD_LEVEL = 6
+GZIP_LEVEL = 6
+
+def _zstandard():
+    """zstandardがインストールされていれば返す（なければgzipで圧縮する）"""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def compress(data):
+    """(形式, 圧縮したバイト列) を返す"""
+    zstandard = _zstandard()
+    if zstandard:
+        return 'zstd', zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return 'gzip', gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def decompress(codec, data):
+    """compress の逆（codec が None なら圧縮されていない）"""
+    if codec is None:
+        return data
+    if codec == 'gzip':
+        return gzip.decompress(data)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"unknown text codec: {codec}")
+
+def encode_text(settings, username, slug, text):
+    """
+    本文を保存する属性に変換し、(設定する属性, 削除する属性のリスト) を返す
+    S3に保存した場合は、アイテムの保存に失敗したら discard で削除する
+    """
+    data = text.encode('utf-8')
+    if len(data) < settings.WIKI_TEXT_COMPRESS_BYTES:
+        attributes = {'text': text}
+    else:
+        codec, compressed = compress(data)
+        # 圧縮しても小さくならない場合はそのまま保存する
+        if len(compressed) >= len(data):
+            codec, compressed = None, data
+        if len(compressed) > settings.WIKI_TEXT_SPILL_BYTES:
+            key = f"{TEXT_KEY_PREFIX}{username}/{slug}/{uuid.uuid4()}"
+            get_s3().put_object(
+                Bucket=settings.S3_BUCKET,
+                Key=key,
+                Body=compressed,
+                ContentType='text/markdown; charset=utf-8'
+            )
+            attributes = {'text_s3': key}
+        elif codec is None:
+            attributes = {'text': text}
+        else:
+            attributes = {'text_z': compressed}
+        if codec is not None:
+            attributes['text_codec'] = codec
+    return attributes, [name for name in TEXT_ATTRIBUTES if name not in attributes]
+
+def load_text(settings, page):
+    """アイテムの本文を文字列で返す（本文がなければNone）"""
+    if 'text' in page:
+        return page['text']
+    if 'text_z' in page:
+        # boto3はBinaryをboto3.dynamodb.types.Binaryで返す
+        data = getattr(page['text_z'], 'value', page['text_z'])
+    elif 'text_s3' in page:
+        data = get_s3().get_object(Bucket=settings.S3_BUCKET, Key=page['text_s3'])['Body'].read()
+    else:
+        return None
+    return decompress(page.get('text_codec'), bytes(data)).decode('utf-8')
+
+def with_text(settings, page, text=None):
+    """本文を文字列の text に戻したアイテム（text を指定した場合はそれを使う）"""
+    result = {k: v for k, v in page.items() if k not in TEXT_ATTRIBUTES}
+    if text is None:
+        text = load_text(settings, page)
+    if text is not None:
+        result['text'] = text
+    return result
+
+def discard(settings, *pages):
+    """アイテムから参照されなくなったS3の本文を削除（失敗しても記事の操作は失敗させない）"""
+    for page in pages:
+        key = (page or {}).get('text_s3')
+        if not key:
+            continue
+        try:
+            get_s3().delete_object(Bucket=settings.S3_BUCKET, Key=key)
+        except Exception as e:
+            logger.exception(f"Delete wiki text error: {e}")
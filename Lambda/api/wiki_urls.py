@@ -1,8 +1,8 @@
-from hadx.urls import Path, Router
-from .wiki_views import pages_handler, recent_handler, page_handler
+from project.routing import LazyPath
 
 urlpatterns = [
-    Path("pages", pages_handler, name="pages_handler"),          # GET/POST /api/wiki/pages
-    Path("recent", recent_handler, name="recent_handler"),       # GET /api/wiki/recent
-    Path("{username}/{slug}", page_handler, name="page_handler"), # GET/PUT/DELETE /api/wiki/{username}/{slug}
-] 
\ No newline at end of file
+    LazyPath("pages", "api.wiki_views.pages_handler", name="pages_handler"),          # GET/POST /api/wiki/pages
+    LazyPath("recent", "api.wiki_views.recent_handler", name="recent_handler"),       # GET /api/wiki/recent
+    LazyPath("search", "api.wiki_views.search_handler", name="search_handler"),       # GET /api/wiki/search
+    LazyPath("{username}/{slug}", "api.wiki_views.page_handler", name="page_handler"), # GET/PUT/DELETE /api/wiki/{username}/{slug}
+] 
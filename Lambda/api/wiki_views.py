@@ -1,18 +1,176 @@
-from hadx.shortcuts import json_response
-import json
+from project.serializers import json_response, serialized_response, dumps
 import logging
-import boto3
 import uuid
 from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
 import os
+import time
+from project.aws import get_table
+from project.pagination import encode_cursor, decode_cursor, parse_limit, InvalidCursor
+from project import http_cache, profiling
+from project.http_body import json_body
+from .wiki_text import with_text, discard
+from .wiki_body import VersionConflict, create_page_item, update_page_item, get_page_item, load_page_text, delete_body
+from .wiki_nav import PAGES_PREFIX, PUBLIC_PREFIX, load_index, load_chunks, render_tree
+from . import wiki_search, wiki_render
 
 logger = logging.getLogger(__name__)
 
-def get_dynamodb():
-    """DynamoDBクライアントを取得"""
-    return boto3.resource('dynamodb', region_name='ap-northeast-1')
+# パブリック記事にのみ付与するPublicCatalogIndexのパーティションキー値（スパースインデックス）
+PUBLIC_PARTITION = 'PUBLIC'
+
+# 一覧取得時に読み込む属性
+LISTING_PROJECTION = '#username, #slug, #title, #last_updated, #public, #priority'
+LISTING_ATTRIBUTE_NAMES = {
+    '#username': 'username',
+    '#slug': 'slug',
+    '#title': 'title',
+    '#last_updated': 'last_updated',
+    '#public': 'public',
+    '#priority': 'priority'
+}
+
+PAGES_LIMIT_DEFAULT = 200
+PAGES_LIMIT_MAX = 1000
+
+# 最近の記事取得時に読み込む属性
+RECENT_PROJECTION = '#username, #slug, #title, #last_updated'
+RECENT_ATTRIBUTE_NAMES = {
+    '#username': 'username',
+    '#slug': 'slug',
+    '#title': 'title',
+    '#last_updated': 'last_updated'
+}
+
+RECENT_LIMIT_DEFAULT = 10
+RECENT_LIMIT_MAX = 100
+
+# RecentIndexがない間に返すパブリック記事の上限（PublicCatalogIndexを並べ替えた新しい順）
+RECENT_CATALOG_LIMIT = 1000
+
+# PublicCatalogIndexを並べ替えた結果のキャッシュ（読み込んだ時刻, 記事）
+_catalog_cache = (0, ())
+
+SEARCH_LIMIT_DEFAULT = 20
+SEARCH_LIMIT_MAX = 100
+
+# レスポンスに含めない内部用の属性
+INTERNAL_ATTRIBUTES = ('public_pk', 'body_version')
+
+def to_response_page(settings, page, text=None):
+    """DynamoDBのアイテムから内部用の属性を除き、本文を文字列に戻したレスポンス用データを作成"""
+    if text is None:
+        text = load_page_text(settings, page)
+    page = with_text(settings, page, text)
+    if 'version' in page:
+        page['version'] = int(page['version'])
+    return {k: v for k, v in page.items() if k not in INTERNAL_ATTRIBUTES}
+
+class RenderUnavailable(Exception):
+    """render=html が指定されたがMarkdownの変換に必要なパッケージがない"""
+
+def render_mode(master):
+    """クエリパラメータの render（html の場合だけ 'html'、それ以外はNone）"""
+    mode = master.request.query_params.get('render')
+    if mode != 'html':
+        return None
+    if not wiki_render.available():
+        raise RenderUnavailable()
+    return mode
+
+def with_rendered(settings, data):
+    """レスポンス用データの本文（text）をHTML（html）と目次（toc）に置き換える"""
+    data = dict(data)
+    rendered = wiki_render.render(settings, data.pop('text', None) or '')
+    data['html'] = rendered['html']
+    data['toc'] = rendered['toc']
+    return data
+
+def page_validators(settings, page, mode, kind='page'):
+    """
+    記事のレスポンスのキャッシュのヘッダー（本文の読み込みや変換の前に作る）
+    ETagは記事のversion・更新日時と表示形式（render=html は変換の版を含む）から作り、
+    パブリック記事とその共有記事はCloudFrontでもキャッシュする（更新時にストリームの処理で無効化する）。
+    非公開の記事の共有記事は、共有の解除後にCloudFrontから返さないようにブラウザだけが再検証する
+    """
+    etag = http_cache.entity_tag(
+        kind,
+        page.get('username'),
+        page.get('slug'),
+        int(page.get('version', 0)),
+        page.get('last_updated') or '',
+        f"html{wiki_render.RENDERER_VERSION}" if mode == 'html' else 'text'
+    )
+    if page.get('public', False):
+        cache_control = http_cache.public_cache_control(settings.WIKI_EDGE_MAX_AGE)
+    else:
+        cache_control = http_cache.PRIVATE_REVALIDATE
+    return http_cache.validators(etag, page.get('last_updated'), cache_control)
+
+def listing_response(master, payload):
+    """
+    一覧のレスポンス（ログインしているユーザーによって内容が変わるのでブラウザだけが再検証する）
+    ETagはシリアライズしたレスポンスの本文から作る。記事の削除は更新日時の最大値を変えないので Last-Modified は付けない
+    """
+    with profiling.phase("serialize"):
+        body = dumps(payload)
+    headers = http_cache.validators(http_cache.entity_tag(body))
+    return http_cache.conditional(master.event, headers, lambda: serialized_response(master, body))
+
+def render_unavailable_response(master):
+    return json_response(master, {
+        "success": False,
+        "message": "HTMLへの変換は利用できません",
+        "error_code": "RENDER_UNAVAILABLE"
+    }, code=503)
+
+class InvalidVersion(ValueError):
+    """versionの値が不正"""
+
+class VersionRequired(InvalidVersion):
+    """versionが指定されていない"""
+
+def parse_version(body):
+    """
+    リクエストのversion（更新前に読み込んだ記事のversion）
+    指定しない更新は他の更新を上書きしてしまうので受け付けない（VersionRequired）
+    """
+    version = body.get('version')
+    if version is None:
+        raise VersionRequired()
+    if isinstance(version, bool) or not isinstance(version, int) or version < 0:
+        raise InvalidVersion(version)
+    return version
+
+def version_error_response(master, error):
+    """versionの指定がない場合は428、不正な場合は400"""
+    if isinstance(error, VersionRequired):
+        return json_response(master, {
+            "success": False,
+            "message": "取得した記事のversionを指定してください",
+            "error_code": "VERSION_REQUIRED"
+        }, code=428)
+    return json_response(master, {
+        "success": False,
+        "message": "versionの値が不正です",
+        "error_code": "VALIDATION_ERROR"
+    }, code=400)
+
+def conflict_response(master, conflict):
+    """条件付き書き込みの失敗のレスポンス（記事がなければ404、他の更新と競合した場合は現在のversionを付けて409）"""
+    if conflict.current is None:
+        return json_response(master, {
+            "success": False,
+            "message": "記事が見つかりません",
+            "error_code": "PAGE_NOT_FOUND"
+        }, code=404)
+    return json_response(master, {
+        "success": False,
+        "message": "記事が他の更新と競合しました",
+        "error_code": "VERSION_CONFLICT",
+        "current_version": int(conflict.current.get('version', 0))
+    }, code=409)
 
 def pages_handler(master):
     """
@@ -46,6 +204,21 @@ def recent_handler(master):
             "error_code": "METHOD_NOT_ALLOWED"
         }, code=405)
 
+def search_handler(master):
+    """
+    記事の検索（GET /api/wiki/search）
+    """
+    method = master.event.get('httpMethod', 'GET')
+    
+    if method == 'GET':
+        return search_pages(master)
+    else:
+        return json_response(master, {
+            "success": False,
+            "message": "サポートされていないHTTPメソッドです",
+            "error_code": "METHOD_NOT_ALLOWED"
+        }, code=405)
+
 def page_handler(master, username, slug):
     """
     個別記事の処理（GET/PUT/DELETE /api/wiki/{username}/{slug}）
@@ -68,35 +241,80 @@ def page_handler(master, username, slug):
 def get_pages(master):
     """
     記事一覧と階層データの取得
-    GET /api/wiki/pages
+    GET /api/wiki/pages?limit=100&next=...
+    パブリック記事はPublicCatalogIndex、自分の記事はusernameでのqueryで取得する
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
-        
-        # 全ページをスキャン
-        response = table.scan()
-        pages = response['Items']
-        
-        # 認証状態に応じてフィルタリング
-        filtered_pages = []
-        for page in pages:
-            # パブリックページまたは認証済みユーザーの場合表示
-            if page.get('public', False) or (master.request.auth and 
-                master.request.decode_token.get('cognito:username') == page.get('username')):
-                filtered_pages.append({
-                    'username': page.get('username'),
-                    'slug': page.get('slug'),
-                    'title': page.get('title'),
-                    'last_updated': page.get('last_updated'),
-                    'public': page.get('public', False),
-                    'priority': page.get('priority', 0)
-                })
+        table = get_table(master.settings.WIKI_TABLE)
+        
+        current_user = None
+        if master.request.auth:
+            current_user = master.request.decode_token.get('cognito:username')
+        
+        limit = parse_limit(master.request.query_params.get('limit'), PAGES_LIMIT_DEFAULT, PAGES_LIMIT_MAX)
+        try:
+            cursor = decode_cursor(master.request.query_params.get('next'))
+        except InvalidCursor:
+            return json_response(master, {
+                "success": False,
+                "message": "nextの値が不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        # 事前計算した一覧・階層データがある場合はそれを返す
+        if master.settings.WIKI_NAV_TABLE:
+            return get_pages_from_nav(master, current_user, limit, cursor)
+        
+        # 取得元ごとの続き位置（値がNoneなら先頭から、キーがなければ取得済み）
+        if cursor is None:
+            cursor = {'own': None, 'public': None}
+        if not current_user:
+            cursor.pop('own', None)
+        
+        pages = []
+        for source in ('own', 'public'):
+            while source in cursor and len(pages) < limit:
+                query_kwargs = {
+                    'Limit': limit - len(pages),
+                    'ProjectionExpression': LISTING_PROJECTION,
+                    'ExpressionAttributeNames': LISTING_ATTRIBUTE_NAMES
+                }
+                if cursor[source]:
+                    query_kwargs['ExclusiveStartKey'] = cursor[source]
+                if source == 'own':
+                    response = table.query(
+                        KeyConditionExpression=Key('username').eq(current_user),
+                        **query_kwargs
+                    )
+                    items = response['Items']
+                else:
+                    response = table.query(
+                        IndexName='PublicCatalogIndex',
+                        KeyConditionExpression=Key('public_pk').eq(PUBLIC_PARTITION),
+                        **query_kwargs
+                    )
+                    # 自分のパブリック記事はownで取得済み
+                    items = [item for item in response['Items'] if item.get('username') != current_user]
+                
+                if 'LastEvaluatedKey' in response:
+                    cursor[source] = response['LastEvaluatedKey']
+                else:
+                    del cursor[source]
+                
+                for page in items:
+                    pages.append({
+                        'username': page.get('username'),
+                        'slug': page.get('slug'),
+                        'title': page.get('title'),
+                        'last_updated': page.get('last_updated'),
+                        'public': page.get('public', False),
+                        'priority': page.get('priority', 0)
+                    })
         
         # 階層データの生成（簡単な実装）
         tree_data = []
-        for username in set(page['username'] for page in filtered_pages):
-            user_pages = [p for p in filtered_pages if p['username'] == username]
+        for username in set(page['username'] for page in pages):
+            user_pages = [p for p in pages if p['username'] == username]
             html = f"<h3>{username}</h3><ul>"
             for page in sorted(user_pages, key=lambda x: x.get('priority', 0), reverse=True):
                 html += f"<li><a href=\"/{username}/{page['slug']}\">{page['title']}</a></li>"
@@ -106,11 +324,12 @@ def get_pages(master):
                 'html': html
             })
         
-        return json_response(master, {
+        return listing_response(master, {
             "success": True,
             "data": {
-                "pages": filtered_pages,
-                "treeData": tree_data
+                "pages": pages,
+                "treeData": tree_data,
+                "next": encode_cursor(cursor)
             }
         })
         
@@ -122,40 +341,196 @@ def get_pages(master):
             "error_code": "INTERNAL_ERROR"
         }, code=500)
 
+def get_pages_from_nav(master, current_user, limit, cursor):
+    """
+    WikiNavTableの事前計算した記事から記事一覧と階層データを返す（続き位置は先頭からの件数）
+    自分の記事をslug順、続いて他のユーザーのパブリック記事をユーザー・slug順に並べる
+    ヘッダー・索引の件数で返す範囲のユーザーを決め、そのユーザーの分割だけを読み込む
+    """
+    offset = (cursor or {}).get('offset', 0)
+    if not isinstance(offset, int) or offset < 0:
+        return json_response(master, {
+            "success": False,
+            "message": "nextの値が不正です",
+            "error_code": "VALIDATION_ERROR"
+        }, code=400)
+    
+    table_name = master.settings.WIKI_NAV_TABLE
+    own_head, public_users = load_index(table_name, current_user)
+    
+    # (分割の種類, ユーザー名, version, 件数, 分割数) を並び順に
+    sources = []
+    if own_head:
+        sources.append((PAGES_PREFIX, current_user, int(own_head['version']),
+                        int(own_head['count']), int(own_head['chunks'])))
+    for username in sorted(public_users):
+        if username != current_user:
+            meta = public_users[username]
+            sources.append((PUBLIC_PREFIX, username, int(meta['version']), int(meta['count']), int(meta['chunks'])))
+    
+    # 返す範囲 [offset, offset + limit) に記事のあるユーザーと、そのユーザー内の範囲
+    ranges = []
+    position = 0
+    for prefix, username, version, count, chunks in sources:
+        start, end = max(offset - position, 0), min(offset + limit - position, count)
+        if start < end:
+            ranges.append((prefix, username, version, chunks, start, end))
+        position += count
+    
+    loaded = load_chunks(table_name, [
+        (prefix, username, version, chunks) for prefix, username, version, chunks, _, _ in ranges
+    ])
+    pages = []
+    tree_data = []
+    for prefix, username, _, _, start, end in ranges:
+        entries = loaded[(prefix, username)]
+        if not entries:
+            # 読み込み中にユーザーの記事が更新され、分割が入れ替わった
+            continue
+        for entry in entries[start:end]:
+            pages.append({
+                'username': username,
+                'slug': entry['slug'],
+                'title': entry['title'],
+                'last_updated': entry['last_updated'],
+                'public': entry['public'],
+                'priority': entry['priority']
+            })
+        # 返す記事のユーザーの階層データ（自分は非公開の記事も含む）
+        tree_data.append({
+            'username': username,
+            'html': render_tree(username, entries)
+        })
+    
+    next_offset = offset + limit
+    return listing_response(master, {
+        "success": True,
+        "data": {
+            "pages": pages,
+            "treeData": tree_data,
+            "next": encode_cursor({'offset': next_offset} if next_offset < position else None)
+        }
+    })
+
 def get_recent(master):
     """
     最近更新された記事の取得
-    GET /api/wiki/recent
+    GET /api/wiki/recent?limit=10&next=...
+    パブリック記事はRecentIndexを新しい順にquery、自分の記事はOwnerRecentIndex（なければusernameでのquery）で取得してマージする
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
-        
-        # 全ページをスキャンして更新日時でソート
-        response = table.scan()
-        pages = response['Items']
-        
-        # 認証状態に応じてフィルタリング
-        filtered_pages = []
-        for page in pages:
-            if page.get('public', False) or (master.request.auth and 
-                master.request.decode_token.get('cognito:username') == page.get('username')):
-                filtered_pages.append({
-                    'username': page.get('username'),
-                    'slug': page.get('slug'),
-                    'title': page.get('title'),
-                    'last_updated': page.get('last_updated')
-                })
-        
-        # 更新日時でソート（最新順）
-        filtered_pages.sort(key=lambda x: x.get('last_updated', ''), reverse=True)
-        
-        # 最新10件を返す
-        recent_pages = filtered_pages[:10]
+        table = get_table(master.settings.WIKI_TABLE)
         
-        return json_response(master, {
+        current_user = None
+        if master.request.auth:
+            current_user = master.request.decode_token.get('cognito:username')
+        
+        limit = parse_limit(master.request.query_params.get('limit'), RECENT_LIMIT_DEFAULT, RECENT_LIMIT_MAX)
+        try:
+            cursor = decode_cursor(master.request.query_params.get('next'))
+        except InvalidCursor:
+            return json_response(master, {
+                "success": False,
+                "message": "nextの値が不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        # 取得元ごとの続き位置（値がNoneなら先頭から、キーがなければ取得済み）
+        if cursor is None:
+            cursor = {'own': None, 'public': None}
+        if not current_user:
+            cursor.pop('own', None)
+        
+        # パブリック記事（自分の記事はownで取得するので除外）
+        public_pages = []
+        public_exhausted = True
+        if 'public' in cursor and not master.settings.WIKI_RECENT_INDEX:
+            public_pages = recent_public_from_catalog(master.settings, table, current_user, cursor['public'])
+        elif 'public' in cursor:
+            start_key = cursor['public']
+            while len(public_pages) < limit:
+                query_kwargs = {
+                    'IndexName': 'RecentIndex',
+                    'KeyConditionExpression': Key('public_pk').eq(PUBLIC_PARTITION),
+                    'ScanIndexForward': False,
+                    'Limit': limit - len(public_pages),
+                    'ProjectionExpression': RECENT_PROJECTION,
+                    'ExpressionAttributeNames': RECENT_ATTRIBUTE_NAMES
+                }
+                if start_key:
+                    query_kwargs['ExclusiveStartKey'] = start_key
+                response = table.query(**query_kwargs)
+                public_pages.extend(item for item in response['Items'] if item.get('username') != current_user)
+                start_key = response.get('LastEvaluatedKey')
+                if not start_key:
+                    break
+            public_exhausted = not start_key
+        
+        # 自分の記事（OwnerRecentIndexがなければ件数は自分の記事数に比例）
+        own_pages = []
+        own_exhausted = True
+        if 'own' in cursor and master.settings.WIKI_OWNER_RECENT_INDEX:
+            own_pages, own_exhausted = recent_own_from_index(table, current_user, cursor['own'], limit)
+        elif 'own' in cursor:
+            query_kwargs = {
+                'KeyConditionExpression': Key('username').eq(current_user),
+                'ProjectionExpression': RECENT_PROJECTION,
+                'ExpressionAttributeNames': RECENT_ATTRIBUTE_NAMES
+            }
+            while True:
+                response = table.query(**query_kwargs)
+                own_pages.extend(response['Items'])
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+            own_pages.sort(key=recent_sort_key, reverse=True)
+            if cursor['own']:
+                position = tuple(cursor['own'])
+                own_pages = [p for p in own_pages if recent_sort_key(p) < position]
+        
+        # 更新日時でマージ（最新順、それぞれの取得順は維持する）
+        recent = []
+        i = j = 0
+        while len(recent) < limit and (i < len(public_pages) or j < len(own_pages)):
+            if j >= len(own_pages) or (i < len(public_pages) and
+                public_pages[i].get('last_updated', '') >= own_pages[j].get('last_updated', '')):
+                recent.append(public_pages[i])
+                i += 1
+            else:
+                recent.append(own_pages[j])
+                j += 1
+        
+        # 次回の続き位置
+        if 'public' in cursor:
+            if public_exhausted and i == len(public_pages):
+                del cursor['public']
+            elif i > 0:
+                last = public_pages[i - 1]
+                cursor['public'] = {
+                    'public_pk': PUBLIC_PARTITION,
+                    'last_updated': last['last_updated'],
+                    'username': last['username'],
+                    'slug': last['slug']
+                }
+        if 'own' in cursor:
+            if own_exhausted and j == len(own_pages):
+                del cursor['own']
+            elif j > 0:
+                cursor['own'] = list(recent_sort_key(own_pages[j - 1]))
+        
+        recent_pages = []
+        for page in recent:
+            recent_pages.append({
+                'username': page.get('username'),
+                'slug': page.get('slug'),
+                'title': page.get('title'),
+                'last_updated': page.get('last_updated')
+            })
+        
+        return listing_response(master, {
             "success": True,
-            "data": recent_pages
+            "data": recent_pages,
+            "next": encode_cursor(cursor)
         })
         
     except Exception as e:
@@ -166,6 +541,128 @@ def get_recent(master):
             "error_code": "INTERNAL_ERROR"
         }, code=500)
 
+def search_pages(master):
+    """
+    記事の全文検索
+    GET /api/wiki/search?q=...&limit=20&next=...
+    パブリック記事と自分の記事から、検索語をすべて含む記事をタイトルに含むものを先に返す
+    """
+    if not master.settings.WIKI_SEARCH_TABLE:
+        return json_response(master, {
+            "success": False,
+            "message": "検索は利用できません",
+            "error_code": "SEARCH_UNAVAILABLE"
+        }, code=503)
+    
+    try:
+        query = (master.request.query_params.get('q') or '').strip()
+        if not query:
+            return json_response(master, {
+                "success": False,
+                "message": "qは必須です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        limit = parse_limit(master.request.query_params.get('limit'), SEARCH_LIMIT_DEFAULT, SEARCH_LIMIT_MAX)
+        try:
+            offset = (decode_cursor(master.request.query_params.get('next')) or {}).get('offset', 0)
+        except InvalidCursor:
+            offset = None
+        if not isinstance(offset, int) or offset < 0:
+            return json_response(master, {
+                "success": False,
+                "message": "nextの値が不正です",
+                "error_code": "VALIDATION_ERROR"
+            }, code=400)
+        
+        current_user = None
+        if master.request.auth:
+            current_user = master.request.decode_token.get('cognito:username')
+        
+        docs = wiki_search.search(master.settings, query, current_user)
+        results = wiki_search.load_docs(master.settings, docs[offset:offset + limit], current_user)
+        next_offset = offset + limit
+        
+        return json_response(master, {
+            "success": True,
+            "data": results,
+            "total": len(docs),
+            "next": encode_cursor({'offset': next_offset} if next_offset < len(docs) else None)
+        })
+        
+    except Exception as e:
+        logger.exception(f"Search pages error: {e}")
+        return json_response(master, {
+            "success": False,
+            "message": "記事の検索に失敗しました",
+            "error_code": "INTERNAL_ERROR"
+        }, code=500)
+
+def _catalog_position(page):
+    return (page.get('last_updated', ''), page.get('username', ''), page.get('slug', ''))
+
+def recent_catalog(settings, table):
+    """
+    PublicCatalogIndexの全件を新しい順に並べた先頭の RECENT_CATALOG_LIMIT 件
+    （全件の読み込みと並べ替えはLambdaごとに RECENT_CATALOG_CACHE_TTL 秒に1回）
+    """
+    global _catalog_cache
+    loaded_at, pages = _catalog_cache
+    now = time.monotonic()
+    if pages and now - loaded_at < settings.RECENT_CATALOG_CACHE_TTL:
+        return pages
+    query_kwargs = {
+        'IndexName': 'PublicCatalogIndex',
+        'KeyConditionExpression': Key('public_pk').eq(PUBLIC_PARTITION),
+        'ProjectionExpression': RECENT_PROJECTION,
+        'ExpressionAttributeNames': RECENT_ATTRIBUTE_NAMES
+    }
+    items = []
+    while True:
+        response = table.query(**query_kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    items.sort(key=_catalog_position, reverse=True)
+    pages = tuple(items[:RECENT_CATALOG_LIMIT])
+    _catalog_cache = (now, pages)
+    return pages
+
+def recent_public_from_catalog(settings, table, current_user, start_key):
+    """
+    RecentIndexを作成する前（WIKI_RECENT_INDEX が無効）のパブリック記事の取得
+    recent_catalog の記事のうち、start_key（RecentIndexと同じ形式の続き位置）より後の他のユーザーのものを返す
+    """
+    pages = [page for page in recent_catalog(settings, table) if page.get('username') != current_user]
+    if start_key:
+        start = _catalog_position(start_key)
+        pages = [page for page in pages if _catalog_position(page) < start]
+    return pages
+
+def recent_own_from_index(table, current_user, position, limit):
+    """
+    OwnerRecentIndexから自分の記事を新しい順に最大 limit 件取得（position は recent_sort_key の続き位置）
+    (記事, 続きがないか) を返す
+    """
+    query_kwargs = {
+        'IndexName': 'OwnerRecentIndex',
+        'KeyConditionExpression': Key('username').eq(current_user),
+        'ScanIndexForward': False,
+        'Limit': limit,
+        'ProjectionExpression': RECENT_PROJECTION,
+        'ExpressionAttributeNames': RECENT_ATTRIBUTE_NAMES
+    }
+    if position:
+        last_updated, slug = position
+        query_kwargs['ExclusiveStartKey'] = {'username': current_user, 'slug': slug, 'last_updated': last_updated}
+    response = table.query(**query_kwargs)
+    return response['Items'], 'LastEvaluatedKey' not in response
+
+def recent_sort_key(page):
+    """最近の記事の並び順（更新日時、同時刻はslug）"""
+    return (page.get('last_updated', ''), page.get('slug', ''))
+
 def create_page(master):
     """
     新規記事作成
@@ -179,7 +676,7 @@ def create_page(master):
         }, code=401)
     
     try:
-        body = json.loads(master.event.get('body', '{}'))
+        body = json_body(master.event)
         username = master.request.decode_token.get('cognito:username')
         
         # 必須フィールドの検証
@@ -200,7 +697,6 @@ def create_page(master):
             'username': username,
             'slug': body['slug'],
             'title': body['title'],
-            'text': body['text'],
             'priority': body.get('priority', 0),
             'public': body.get('public', False),
             'edit_permission': body.get('edit_permission', False),
@@ -209,28 +705,23 @@ def create_page(master):
             'share_edit_permission': body.get('share_edit_permission', False),
             'last_updated': now
         }
+        if page_data['public']:
+            page_data['public_pk'] = PUBLIC_PARTITION
         
-        # DynamoDBに保存
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
-        
-        # 既存チェック
+        # 存在しない場合だけ保存する（本文は大きさに応じて圧縮・S3・WIKI_BODY_TABLE に保存する）
         try:
-            existing = table.get_item(Key={'username': username, 'slug': body['slug']})
-            if 'Item' in existing:
-                return json_response(master, {
-                    "success": False,
-                    "message": "この記事は既に存在します",
-                    "error_code": "PAGE_EXISTS"
-                }, code=400)
-        except ClientError:
-            pass
-        
-        table.put_item(Item=page_data)
+            page = create_page_item(master.settings, page_data, body['text'])
+        except VersionConflict as conflict:
+            return json_response(master, {
+                "success": False,
+                "message": "この記事は既に存在します",
+                "error_code": "PAGE_EXISTS",
+                "current_version": int(conflict.current.get('version', 0)) if conflict.current else 0
+            }, code=409)
         
         return json_response(master, {
             "success": True,
-            "data": page_data
+            "data": to_response_page(master.settings, page, body['text'])
         })
         
     except Exception as e:
@@ -244,23 +735,25 @@ def create_page(master):
 def get_page(master, username, slug):
     """
     記事詳細の取得
-    GET /api/wiki/{username}/{slug}
+    GET /api/wiki/{username}/{slug}?render=html
+    render=html の場合は本文（text）の代わりにサニタイズしたHTML（html）と目次（toc）を返す
     """
     try:
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
+        try:
+            mode = render_mode(master)
+        except RenderUnavailable:
+            return render_unavailable_response(master)
         
-        response = table.get_item(Key={'username': username, 'slug': slug})
+        # メタデータと本文をまとめて取得
+        page = get_page_item(master.settings, username, slug)
         
-        if 'Item' not in response:
+        if page is None:
             return json_response(master, {
                 "success": False,
                 "message": "記事が見つかりません",
                 "error_code": "PAGE_NOT_FOUND"
             }, code=404)
         
-        page = response['Item']
-        
         # アクセス権限チェック
         is_owner = (master.request.auth and 
                    master.request.decode_token.get('cognito:username') == username)
@@ -273,10 +766,20 @@ def get_page(master, username, slug):
                 "error_code": "PERMISSION_DENIED"
             }, code=403)
         
-        return json_response(master, {
+        # 変わっていなければ本文を読み込まずに304を返す
+        headers = page_validators(master.settings, page, mode)
+        if http_cache.is_not_modified(master.event, headers):
+            return http_cache.not_modified(headers)
+        
+        data = to_response_page(master.settings, page)
+        if mode == 'html':
+            # 本文のハッシュでキャッシュした変換結果を使う
+            data = with_rendered(master.settings, data)
+        
+        return http_cache.add_headers(json_response(master, {
             "success": True,
-            "data": page
-        })
+            "data": data
+        }), headers)
         
     except Exception as e:
         logger.exception(f"Get page error: {e}")
@@ -309,7 +812,11 @@ def update_page(master, username, slug):
                 "error_code": "PERMISSION_DENIED"
             }, code=403)
         
-        body = json.loads(master.event.get('body', '{}'))
+        body = json_body(master.event)
+        try:
+            expected_version = parse_version(body)
+        except InvalidVersion as e:
+            return version_error_response(master, e)
         
         # 現在時刻
         now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -330,26 +837,25 @@ def update_page(master, username, slug):
         # Noneの値を除外
         update_data = {k: v for k, v in update_data.items() if v is not None}
         
-        # DynamoDBを更新
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
+        # 本文は大きさに応じて圧縮・S3・WIKI_BODY_TABLE に保存する
+        text = update_data.pop('text', None)
         
-        # 更新式を作成
-        update_expression = "SET " + ", ".join([f"#{k} = :{k}" for k in update_data.keys()])
-        expression_attribute_names = {f"#{k}": k for k in update_data.keys()}
-        expression_attribute_values = {f":{k}": v for k, v in update_data.items()}
+        # パブリック記事のみPublicCatalogIndexに載せる
+        remove_attributes = []
+        if update_data['public']:
+            update_data['public_pk'] = PUBLIC_PARTITION
+        else:
+            remove_attributes.append('public_pk')
         
-        response = table.update_item(
-            Key={'username': username, 'slug': slug},
-            UpdateExpression=update_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues=expression_attribute_values,
-            ReturnValues='ALL_NEW'
-        )
+        # versionが一致する場合だけ更新する
+        try:
+            page = update_page_item(master.settings, username, slug, update_data, remove_attributes, text, expected_version)
+        except VersionConflict as conflict:
+            return conflict_response(master, conflict)
         
         return json_response(master, {
             "success": True,
-            "data": response['Attributes']
+            "data": to_response_page(master.settings, page, text)
         })
         
     except Exception as e:
@@ -384,10 +890,11 @@ def delete_page(master, username, slug):
             }, code=403)
         
         # DynamoDBから削除
-        dynamodb = get_dynamodb()
-        table = dynamodb.Table(master.settings.WIKI_TABLE)
+        table = get_table(master.settings.WIKI_TABLE)
         
-        table.delete_item(Key={'username': username, 'slug': slug})
+        response = table.delete_item(Key={'username': username, 'slug': slug}, ReturnValues='ALL_OLD')
+        discard(master.settings, response.get('Attributes'))
+        delete_body(master.settings, username, slug)
         
         return json_response(master, {
             "success": True,
@@ -1,19 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+_INIT_STARTED = time.perf_counter()
 import sys
 import os
 from hadx.handler import Master
+from project import profiling, jwt_auth, http_cache, compression
+_IMPORT_MS = (time.perf_counter() - _INIT_STARTED) * 1000
+_cold_start = True
+
+def _profile_cold_start(profile):
+  """コールドスタート時にモジュールの読み込みを個別に計測"""
+  profile.record("import_hadx", _IMPORT_MS)
+  with profile.phase("import_boto3"):
+    import boto3
+  with profile.phase("import_settings"):
+    import project.settings
+  with profile.phase("router_build"):
+    import project.urls
+
+def _run_storage_job(event, context):
+  """フォルダの削除・移動の続きを処理（storage_tree.invoke_jobによる非同期呼び出し）"""
+  import project.settings
+  from api import storage_tree
+  storage_tree.run_job(project.settings, event[storage_tree.JOB_EVENT_KEY], context)
+
+def _run_storage_gc(event, context):
+  """確定されなかったアップロードと重複排除の不要な実体を削除（EventBridgeのスケジュールによる呼び出し）"""
+  import project.settings
+  from api import storage_blobs, storage_views
+  expired = storage_views.expire_pending_uploads(project.settings)
+  return {"expired": expired, "deleted": storage_blobs.collect_garbage(project.settings)}
+
+def _run_storage_derive(event, context):
+  """画像のサムネイル・プレビューを作成（storage_derivatives.scheduleによる非同期呼び出し）"""
+  import project.settings
+  from api import storage_derivatives
+  storage_derivatives.run(project.settings, event[storage_derivatives.DERIVE_EVENT_KEY], context)
 
 def lambda_handler(event, context):
+  global _cold_start
+  if "storage_job" in event:
+    return _run_storage_job(event, context)
+  if "storage_gc" in event:
+    return _run_storage_gc(event, context)
+  if "storage_derive" in event:
+    return _run_storage_derive(event, context)
+  profile = profiling.start(cold_start=_cold_start)
+  if profile is not None and _cold_start:
+    _profile_cold_start(profile)
+  _cold_start = False
   sys.path.append(os.path.dirname(__file__))
-  master = Master(event, context)
+  with profiling.phase("master"):
+    master = Master(event, context)
   master.logger.info(f"path: {master.request.path}")
   master.logger.info(f"event: {event}")
-  # master.settings.COGNITO.set_auth_by_code(master)
-  master.settings.COGNITO.set_auth_by_cookie(master)
   try:
-    view, kwargs = master.router.path2view(master.request.path)
-    response = view(master, **kwargs)
-    master.settings.COGNITO.add_set_cookie_to_header(master, response)
-    master.logger.info(f"response: {response}")
+    with profiling.phase("routing"):
+      from project.urls import routes
+      route, kwargs = routes.resolve(master.request.path)
+      view = route.view
+    # master.settings.COGNITO.set_auth_by_code(master)
+    if not route.public:
+      with profiling.phase("auth"):
+        if not jwt_auth.authenticate(master):
+          master.settings.COGNITO.set_auth_by_cookie(master)
+    with profiling.phase("view"):
+      response = view(master, **kwargs)
+    with profiling.phase("response"):
+      if not route.public:
+        master.settings.COGNITO.add_set_cookie_to_header(master, response)
+      # Cache-Control のないレスポンスはキャッシュさせない
+      http_cache.finalize(response)
+      master.logger.info(f"response: {response}")
+    with profiling.phase("compress"):
+      compression.compress_response(event, response, master.settings.RESPONSE_COMPRESS_MIN_BYTES)
     return response
   except Exception as e:
     if master.request.path == "/favicon.ico":
@@ -23,3 +84,5 @@ def lambda_handler(event, context):
     from hadx.shortcuts import error_render
     import traceback
     return error_render(master, traceback.format_exc())
+  finally:
+    profiling.finish(master.logger, getattr(context, "function_name", ""), path=master.request.path)
@@ -0,0 +1,100 @@
+"""
+boto3のクライアント・リソースをコンテナ内で共有する
+
+Lambdaのコンテナは複数の呼び出しで再利用されるため、クライアントは最初に使う時に一度だけ作成し、
+以降の呼び出しではサービスモデルの読み込みやTLS接続を使い回す。
+クライアントはスレッドセーフなのでスレッド間で共有するが、リソース（Tableなど）はスレッドセーフではないため、
+スレッドごとに作成する（ThreadPoolExecutorの各ワーカーは自分のリソースを使う）
+"""
+import os
+import json
+import threading
+import boto3
+from botocore.config import Config
+
+REGION = "ap-northeast-1"
+
+_BASE_CONFIG = Config(
+  region_name=REGION,
+  max_pool_connections=32,
+  tcp_keepalive=True,
+  connect_timeout=3,
+  read_timeout=10,
+  retries={"mode": "adaptive", "max_attempts": 5},
+)
+
+# サービスごとの上書き設定
+_SERVICE_CONFIG = {
+  "s3": Config(read_timeout=60, s3={"addressing_style": "virtual"}),
+}
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+# スレッドごとのリソース・Table
+_local = threading.local()
+
+def _get_session():
+  global _session
+  if _session is None:
+    _session = boto3.session.Session(region_name=REGION)
+  return _session
+
+def _config(service_name):
+  if service_name in _SERVICE_CONFIG:
+    return _BASE_CONFIG.merge(_SERVICE_CONFIG[service_name])
+  return _BASE_CONFIG
+
+def get_client(service_name):
+  """サービスのクライアントを取得（コンテナ内で共有）"""
+  client = _clients.get(service_name)
+  if client is None:
+    with _lock:
+      client = _clients.get(service_name)
+      if client is None:
+        client = _get_session().client(service_name, config=_config(service_name))
+        _clients[service_name] = client
+  return client
+
+def _thread_cache(name):
+  cache = getattr(_local, name, None)
+  if cache is None:
+    cache = {}
+    setattr(_local, name, cache)
+  return cache
+
+def get_resource(service_name):
+  """サービスのリソースを取得（スレッドごとに作成して共有）"""
+  resources = _thread_cache("resources")
+  resource = resources.get(service_name)
+  if resource is None:
+    # Sessionもスレッドセーフではないので、作成は排他する（サービスモデルはSessionにキャッシュされる）
+    with _lock:
+      resource = _get_session().resource(service_name, config=_config(service_name))
+    resources[service_name] = resource
+  return resource
+
+def get_dynamodb():
+  """DynamoDBリソースを取得"""
+  return get_resource("dynamodb")
+
+def get_s3():
+  """S3クライアントを取得"""
+  return get_client("s3")
+
+def invoke_self(payload):
+  """実行中のLambda自身を非同期に呼び出す（時間のかかる処理をリクエストの外で行う）"""
+  get_client("lambda").invoke(
+    FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+    InvocationType="Event",
+    Payload=json.dumps(payload).encode("utf-8"),
+  )
+
+def get_table(table_name):
+  """DynamoDBのTableを取得（スレッド・テーブル名ごとに共有）"""
+  tables = _thread_cache("tables")
+  table = tables.get(table_name)
+  if table is None:
+    table = get_dynamodb().Table(table_name)
+    tables[table_name] = table
+  return table
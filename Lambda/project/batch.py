@@ -0,0 +1,107 @@
+"""
+DynamoDB・S3のバッチ操作（記事・ストレージの両方から使う）
+
+- BatchGetItem: 100件ずつ、UnprocessedKeysは指数バックオフで再試行
+- BatchWriteItem: 25件ずつ、UnprocessedItemsは指数バックオフで再試行
+- S3 DeleteObjects: 1000件ずつ
+"""
+import time
+import random
+import logging
+from .aws import get_dynamodb, get_s3
+
+logger = logging.getLogger(__name__)
+
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+S3_DELETE_SIZE = 1000
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 0.05
+BACKOFF_MAX = 2.0
+
+class BatchIncomplete(Exception):
+  """再試行しても処理されなかったリクエストが残った"""
+
+def _chunks(values, size):
+  for i in range(0, len(values), size):
+    yield values[i:i + size]
+
+def _backoff(attempt):
+  # フルジッター
+  time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))))
+
+def batch_get_items(table_name, keys, projection=None, attribute_names=None):
+  """キーのリストに対応するアイテムを取得（存在しないキーは結果に含まれない）"""
+  dynamodb = get_dynamodb()
+  items = []
+  # 重複したキーはBatchGetItemでエラーになる
+  unique = list({tuple(sorted(k.items())): k for k in keys}.values())
+  for chunk in _chunks(unique, BATCH_GET_SIZE):
+    request = {'Keys': chunk, 'ConsistentRead': True}
+    if projection:
+      request['ProjectionExpression'] = projection
+    if attribute_names:
+      request['ExpressionAttributeNames'] = attribute_names
+    request_items = {table_name: request}
+    for attempt in range(MAX_ATTEMPTS):
+      response = dynamodb.batch_get_item(RequestItems=request_items)
+      items.extend(response['Responses'].get(table_name, []))
+      request_items = response.get('UnprocessedKeys') or {}
+      if not request_items:
+        break
+      _backoff(attempt)
+    else:
+      raise BatchIncomplete(f"unprocessed keys remain for {table_name}")
+  return items
+
+def batch_get_tables(keys_by_table, consistent=True):
+  """
+  複数のテーブルのアイテムを1回のBatchGetItemで取得（キーは合計100件まで）
+  {テーブル名: [アイテム]} を返す
+  """
+  dynamodb = get_dynamodb()
+  items = {table_name: [] for table_name in keys_by_table}
+  request_items = {
+    table_name: {'Keys': keys, 'ConsistentRead': consistent}
+    for table_name, keys in keys_by_table.items() if keys
+  }
+  for attempt in range(MAX_ATTEMPTS):
+    response = dynamodb.batch_get_item(RequestItems=request_items)
+    for table_name, table_items in response['Responses'].items():
+      items[table_name].extend(table_items)
+    request_items = response.get('UnprocessedKeys') or {}
+    if not request_items:
+      return items
+    _backoff(attempt)
+  raise BatchIncomplete(f"unprocessed keys remain for {', '.join(request_items)}")
+
+def batch_write(table_name, put_items=(), delete_keys=()):
+  """アイテムの保存・削除をまとめて実行"""
+  dynamodb = get_dynamodb()
+  requests = [{'PutRequest': {'Item': item}} for item in put_items]
+  requests += [{'DeleteRequest': {'Key': key}} for key in delete_keys]
+  for chunk in _chunks(requests, BATCH_WRITE_SIZE):
+    request_items = {table_name: chunk}
+    for attempt in range(MAX_ATTEMPTS):
+      response = dynamodb.batch_write_item(RequestItems=request_items)
+      request_items = response.get('UnprocessedItems') or {}
+      if not request_items:
+        break
+      _backoff(attempt)
+    else:
+      raise BatchIncomplete(f"unprocessed items remain for {table_name}")
+
+def delete_s3_objects(bucket, keys):
+  """S3のオブジェクトをまとめて削除し、削除できなかったキーの一覧を返す"""
+  s3 = get_s3()
+  errors = []
+  for chunk in _chunks(list(dict.fromkeys(keys)), S3_DELETE_SIZE):
+    response = s3.delete_objects(
+      Bucket=bucket,
+      Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+    )
+    for error in response.get('Errors', []):
+      logger.warning(f"delete object failed: {error}")
+      errors.append(error['Key'])
+  return errors
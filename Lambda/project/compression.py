@@ -0,0 +1,111 @@
+"""
+レスポンスの圧縮（Accept-Encoding に応じて brotli / gzip）
+
+テキストのレスポンス（JSON・HTML）が RESPONSE_COMPRESS_MIN_BYTES 以上なら圧縮し、base64（isBase64Encoded）で返す。
+API GatewayのBinaryMediaTypesに */* を含めておく必要がある（含めないとbase64のままクライアントに届く）。
+brotliはBrotliがインストールされている場合だけ使う（なければgzip）。
+圧縮したレスポンスのETagは弱いETag（W/）にする（If-None-Match は弱い比較なので304の判定は変わらない）
+"""
+import gzip
+import base64
+
+# 圧縮するContent-Type
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+BROTLI_QUALITY = 5
+GZIP_LEVEL = 6
+
+def _brotli():
+  """Brotliがインストールされていれば返す"""
+  try:
+    import brotli
+  except ImportError:
+    return None
+  return brotli
+
+def _header(headers, name):
+  """ヘッダーのキー（大文字・小文字を区別しない、なければNone）"""
+  name = name.lower()
+  return next((key for key in headers if key.lower() == name), None)
+
+def accepted_encodings(accept_encoding):
+  """Accept-Encoding から {形式: q値}（q=0 のものは除く）"""
+  encodings = {}
+  for item in (accept_encoding or "").split(","):
+    coding, _, params = item.strip().partition(";")
+    coding = coding.strip().lower()
+    if not coding:
+      continue
+    quality = 1.0
+    for param in params.split(";"):
+      name, _, value = param.strip().partition("=")
+      if name.strip().lower() == "q":
+        try:
+          quality = float(value)
+        except ValueError:
+          quality = 0.0
+    if quality > 0:
+      encodings[coding] = quality
+  return encodings
+
+def choose_encoding(accept_encoding):
+  """使う形式（br / gzip、どちらも受け付けない場合はNone。q値が同じならbrを優先）"""
+  encodings = accepted_encodings(accept_encoding)
+  wildcard = encodings.get("*", 0)
+  candidates = []
+  if _brotli():
+    candidates.append(("br", encodings.get("br", wildcard)))
+  candidates.append(("gzip", encodings.get("gzip", wildcard)))
+  coding, quality = max(candidates, key=lambda candidate: candidate[1])
+  return coding if quality > 0 else None
+
+def encode(coding, data):
+  """バイト列を圧縮"""
+  if coding == "br":
+    return _brotli().compress(data, quality=BROTLI_QUALITY)
+  return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def is_compressible(response, min_bytes):
+  """圧縮の対象のレスポンスか（テキストで、まだ圧縮・base64化されておらず、min_bytes 以上）"""
+  if min_bytes <= 0 or response.get("isBase64Encoded", False):
+    return False
+  body = response.get("body")
+  if not isinstance(body, str) or len(body) < min_bytes:
+    return False
+  headers = response.get("headers") or {}
+  if _header(headers, "Content-Encoding"):
+    return False
+  content_type = headers.get(_header(headers, "Content-Type"), "application/json").lower()
+  return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def compress_response(event, response, min_bytes):
+  """
+  リクエストの Accept-Encoding に応じてレスポンスを圧縮する（対象外ならそのまま返す）
+  """
+  if not isinstance(response, dict) or not is_compressible(response, min_bytes):
+    return response
+  headers = response.get("headers")
+  if headers is None:
+    headers = response["headers"] = {}
+  vary = _header(headers, "Vary")
+  if vary is None:
+    headers["Vary"] = "Accept-Encoding"
+  elif "accept-encoding" not in headers[vary].lower():
+    headers[vary] += ", Accept-Encoding"
+
+  request_headers = event.get("headers") or {}
+  coding = choose_encoding(request_headers.get(_header(request_headers, "Accept-Encoding")))
+  if coding is None:
+    return response
+  data = response["body"].encode("utf-8")
+  compressed = encode(coding, data)
+  # base64で増える分を含めて小さくならなければ圧縮しない
+  if len(compressed) * 4 // 3 >= len(data):
+    return response
+  response["body"] = base64.b64encode(compressed).decode("ascii")
+  response["isBase64Encoded"] = True
+  headers["Content-Encoding"] = coding
+  etag = _header(headers, "ETag")
+  if etag and not headers[etag].startswith("W/"):
+    headers[etag] = "W/" + headers[etag]
+  return response
@@ -0,0 +1,133 @@
+"""
+SSMパラメータストアの設定値を遅延読み込みする
+
+- 最初に値が必要になった時に、全パラメータをGetParametersの1回の呼び出しでまとめて取得する
+- 取得した値はプロセス内でTTLの間キャッシュし、refresh()で強制的に再取得できる
+- 環境変数またはJSONファイルで値を上書きでき、全て上書きされていればSSMにはアクセスしない
+"""
+import os
+import json
+import time
+import threading
+import logging
+from . import profiling
+
+logger = logging.getLogger(__name__)
+
+# 上書き用のJSONファイルのパスを指定する環境変数
+CONFIG_FILE_ENV = "WIKIPROJECT_CONFIG_FILE"
+
+class ConfigError(Exception):
+  """設定値が取得できない"""
+
+class ParameterStore:
+  """
+  SSMパラメータをまとめて取得・キャッシュする
+
+  parameters: {キー: {"name": SSMパラメータ名, "env": 上書き用の環境変数名, "file": 上書き用JSONファイル内のパス}}
+  """
+  def __init__(self, parameters, ttl=900, admin_file=None):
+    self.parameters = parameters
+    self.ttl = ttl
+    self.admin_file = admin_file
+    self.version = 0
+    self._values = None
+    self._loaded_at = 0.0
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    return self.values()[key]
+
+  def values(self):
+    """全設定値を取得（TTLを過ぎていれば再取得）"""
+    if self._values is None or time.monotonic() - self._loaded_at > self.ttl:
+      with self._lock:
+        if self._values is None or time.monotonic() - self._loaded_at > self.ttl:
+          self._load()
+    return self._values
+
+  def refresh(self):
+    """キャッシュを破棄して再取得"""
+    with self._lock:
+      self._load()
+    return self._values
+
+  def _load(self):
+    values = self._load_overrides()
+    missing = {key: spec["name"] for key, spec in self.parameters.items() if key not in values}
+    if missing:
+      with profiling.phase("ssm"):
+        values.update(self._load_from_ssm(missing))
+    if values != self._values:
+      self.version += 1
+    self._values = values
+    self._loaded_at = time.monotonic()
+
+  def _load_overrides(self):
+    values = {}
+    path = os.environ.get(CONFIG_FILE_ENV)
+    if path:
+      with open(path) as f:
+        data = json.load(f)
+      for key, spec in self.parameters.items():
+        value = data
+        for part in spec.get("file", ()):
+          if not isinstance(value, dict) or part not in value:
+            value = None
+            break
+          value = value[part]
+        if value is not None:
+          values[key] = value
+    for key, spec in self.parameters.items():
+      env = spec.get("env")
+      if env and os.environ.get(env):
+        values[key] = os.environ[env]
+    return values
+
+  def _load_from_ssm(self, names):
+    ssm = self._ssm_client()
+    response = ssm.get_parameters(Names=list(names.values()), WithDecryption=True)
+    by_name = {p["Name"]: p["Value"] for p in response["Parameters"]}
+    if response.get("InvalidParameters"):
+      raise ConfigError(f"SSM parameters not found: {response['InvalidParameters']}")
+    logger.info(f"loaded {len(by_name)} parameters from SSM")
+    return {key: by_name[name] for key, name in names.items()}
+
+  def _ssm_client(self):
+    # ローカル開発時はadmin.jsonのリージョン・プロファイルを使用
+    if self.admin_file and os.path.exists(self.admin_file):
+      import boto3
+      with open(self.admin_file) as f:
+        admin = json.load(f)
+      kwargs = {}
+      if "region" in admin:
+        kwargs["region_name"] = admin["region"]
+      if "profile" in admin:
+        kwargs["profile_name"] = admin["profile"]
+      return boto3.Session(**kwargs).client("ssm")
+    from .aws import get_client
+    return get_client("ssm")
+
+class LazySetting:
+  """
+  設定値を使うオブジェクトを最初の属性アクセス時に作成するプロキシ
+  ParameterStoreの値が変わった場合は作り直す
+  """
+  def __init__(self, factory, store):
+    self._factory = factory
+    self._store = store
+    self._wrapped = None
+    self._version = None
+    self._lock = threading.Lock()
+
+  def _resolve(self):
+    values = self._store.values()
+    if self._wrapped is None or self._version != self._store.version:
+      with self._lock:
+        if self._wrapped is None or self._version != self._store.version:
+          self._wrapped = self._factory(values)
+          self._version = self._store.version
+    return self._wrapped
+
+  def __getattr__(self, name):
+    return getattr(self._resolve(), name)
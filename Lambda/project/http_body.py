@@ -0,0 +1,22 @@
+"""
+リクエストの本文の読み込み
+
+API GatewayのBinaryMediaTypesに */* を含めている（レスポンスの圧縮のため）ので、
+JSONの本文も base64（isBase64Encoded）でLambdaに渡される場合がある
+"""
+import json
+import base64
+
+def body_bytes(event):
+  """リクエストの本文をバイト列で返す（base64なら復号する）"""
+  body = event.get("body") or ""
+  if event.get("isBase64Encoded", False):
+    return base64.b64decode(body)
+  if isinstance(body, bytes):
+    return body
+  return body.encode("utf-8")
+
+def json_body(event, default="{}"):
+  """リクエストの本文をJSONとして読み込む（本文がなければ default、不正な場合はValueError）"""
+  data = body_bytes(event)
+  return json.loads(data if data else default)
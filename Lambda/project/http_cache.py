@@ -0,0 +1,123 @@
+"""
+HTTPのキャッシュ（ETag・Last-Modified・Cache-Control と 304 Not Modified）
+
+ビューは内容から決まる強いETagと更新日時をレスポンスのヘッダーに付け、
+リクエストの If-None-Match / If-Modified-Since が一致する場合は本文のない304を返す。
+Cache-Control は public（CloudFrontでもキャッシュする）と private（ブラウザだけが再検証して使う）を使い分け、
+指定のないレスポンスは no-store にする（エラーや他のユーザーのデータをキャッシュさせない）
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+# ブラウザは毎回再検証し、変更がなければ304を受け取る
+PRIVATE_REVALIDATE = "private, no-cache"
+NO_STORE = "no-store"
+
+def public_cache_control(edge_max_age):
+  """CloudFrontに edge_max_age 秒キャッシュさせ、ブラウザは毎回再検証する（0ならCloudFrontも毎回再検証）"""
+  if edge_max_age <= 0:
+    return "public, no-cache"
+  return f"public, max-age=0, s-maxage={edge_max_age}, must-revalidate"
+
+def entity_tag(*parts):
+  """値の組から強いETagを作る"""
+  digest = hashlib.sha256("\n".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+  return f"\"{digest[:32]}\""
+
+def http_date(value):
+  """last_updated（ISO 8601、タイムゾーンがなければUTC）をHTTPの日時にする（変換できなければNone）"""
+  if not value:
+    return None
+  try:
+    moment = datetime.fromisoformat(str(value))
+  except ValueError:
+    return None
+  if moment.tzinfo is None:
+    moment = moment.replace(tzinfo=timezone.utc)
+  return format_datetime(moment.astimezone(timezone.utc).replace(microsecond=0), usegmt=True)
+
+def validators(etag, last_updated=None, cache_control=PRIVATE_REVALIDATE):
+  """レスポンスに付けるキャッシュのヘッダー"""
+  headers = {"ETag": etag, "Cache-Control": cache_control}
+  last_modified = http_date(last_updated)
+  if last_modified:
+    headers["Last-Modified"] = last_modified
+  return headers
+
+def request_header(event, name):
+  """リクエストヘッダーの値（大文字・小文字を区別しない、なければNone）"""
+  name = name.lower()
+  for key, value in (event.get("headers") or {}).items():
+    if key.lower() == name:
+      return value
+  return None
+
+def _etag_matches(header, etag):
+  if header.strip() == "*":
+    return True
+  # If-None-Match は弱い比較（W/ を無視する）
+  candidates = [candidate.strip() for candidate in header.split(",")]
+  return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def is_not_modified(event, headers):
+  """
+  条件付きリクエストの対象が変わっていないか
+  If-None-Match があればETagで判定し、なければ If-Modified-Since と Last-Modified で判定する
+  """
+  if_none_match = request_header(event, "If-None-Match")
+  if if_none_match:
+    return _etag_matches(if_none_match, headers["ETag"])
+  if_modified_since = request_header(event, "If-Modified-Since")
+  if not if_modified_since or "Last-Modified" not in headers:
+    return False
+  try:
+    since = parsedate_to_datetime(if_modified_since)
+  except (TypeError, ValueError):
+    return False
+  if since is None or since.tzinfo is None:
+    return False
+  return parsedate_to_datetime(headers["Last-Modified"]) <= since
+
+def not_modified(headers):
+  """304 Not Modified のレスポンス（本文なし）"""
+  return {
+    "statusCode": 304,
+    "headers": dict(headers),
+    "body": ""
+  }
+
+def conditional(event, headers, build):
+  """変わっていなければ304を、変わっていれば build() のレスポンスにキャッシュのヘッダーを付けて返す"""
+  if is_not_modified(event, headers):
+    return not_modified(headers)
+  return add_headers(build(), headers)
+
+def add_headers(response, headers):
+  """レスポンスにヘッダーを追加"""
+  if response.get("headers") is None:
+    response["headers"] = {}
+  response["headers"].update(headers)
+  return response
+
+def _has_set_cookie(response):
+  names = list(response.get("headers") or {}) + list(response.get("multiValueHeaders") or {})
+  return any(name.lower() == "set-cookie" for name in names)
+
+def finalize(response):
+  """
+  返す直前のレスポンスのキャッシュの指定を整える
+  - Cache-Control がなければ no-store
+  - Set-Cookie を含むレスポンスは共有のキャッシュに保存させない（public を private に変える）
+  """
+  if not isinstance(response, dict):
+    return response
+  headers = response.get("headers")
+  if headers is None:
+    headers = response["headers"] = {}
+  name = next((key for key in headers if key.lower() == "cache-control"), None)
+  if name is None:
+    headers["Cache-Control"] = NO_STORE
+  elif _has_set_cookie(response) and "public" in headers[name]:
+    headers[name] = PRIVATE_REVALIDATE
+  return response
@@ -0,0 +1,152 @@
+"""
+CognitoのトークンをJWKSでローカルに検証する
+
+- JWKSはコンテナごとに一度取得してTTLの間キャッシュする（未知のkidの場合のみ再取得）
+- 検証済みのトークンはexpまでクレームをメモ化する
+- RS256の署名検証は標準ライブラリのみで行う
+"""
+import json
+import time
+import hmac
+import base64
+import hashlib
+import threading
+import logging
+import urllib.request
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# SHA-256のDigestInfo（RFC 8017 9.2）
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
+
+def _b64url_decode(value):
+  if isinstance(value, str):
+    value = value.encode("ascii")
+  return base64.urlsafe_b64decode(value + b"=" * (-len(value) % 4))
+
+def _b64url_uint(value):
+  return int.from_bytes(_b64url_decode(value), "big")
+
+def verify_rs256(message, signature, n, e):
+  """RSASSA-PKCS1-v1_5 (SHA-256) の署名を検証"""
+  k = (n.bit_length() + 7) // 8
+  if len(signature) != k:
+    return False
+  s = int.from_bytes(signature, "big")
+  if s >= n:
+    return False
+  em = pow(s, e, n).to_bytes(k, "big")
+  t = _SHA256_DIGEST_INFO + hashlib.sha256(message).digest()
+  if k < len(t) + 11:
+    return False
+  expected = b"\x00\x01" + b"\xff" * (k - len(t) - 3) + b"\x00" + t
+  return hmac.compare_digest(em, expected)
+
+class CognitoJWTVerifier:
+  def __init__(self, region, user_pool_id, client_id, jwks_ttl=3600, leeway=30, cache_size=1024):
+    self.issuer = f"https://cognito-idp.{region}.amazonaws.com/{user_pool_id}"
+    self.jwks_url = f"{self.issuer}/.well-known/jwks.json"
+    self.client_id = client_id
+    self.jwks_ttl = jwks_ttl
+    self.leeway = leeway
+    self.cache_size = cache_size
+    self._keys = {}
+    self._keys_fetched_at = None
+    self._claims = OrderedDict()
+    self._lock = threading.Lock()
+
+  def verify(self, token, token_use="id"):
+    """トークンを検証してクレームを返す（無効な場合はNone）"""
+    now = time.time()
+    cached = self._claims.get(token)
+    if cached is not None:
+      if cached["exp"] > now - self.leeway:
+        return cached
+      self._claims.pop(token, None)
+    try:
+      claims = self._verify(token, token_use, now)
+    except (ValueError, KeyError, TypeError, OSError) as e:
+      logger.info(f"token verification failed: {e}")
+      return None
+    with self._lock:
+      self._claims[token] = claims
+      while len(self._claims) > self.cache_size:
+        self._claims.popitem(last=False)
+    return claims
+
+  def _verify(self, token, token_use, now):
+    header_b64, payload_b64, signature_b64 = token.split(".")
+    header = json.loads(_b64url_decode(header_b64))
+    if header.get("alg") != "RS256":
+      raise ValueError("unsupported alg")
+    n, e = self._get_key(header["kid"])
+    if not verify_rs256(f"{header_b64}.{payload_b64}".encode("ascii"), _b64url_decode(signature_b64), n, e):
+      raise ValueError("invalid signature")
+    claims = json.loads(_b64url_decode(payload_b64))
+    if claims.get("iss") != self.issuer:
+      raise ValueError("invalid issuer")
+    if claims.get("token_use") != token_use:
+      raise ValueError("invalid token_use")
+    audience = claims.get("aud") if token_use == "id" else claims.get("client_id")
+    if audience != self.client_id:
+      raise ValueError("invalid audience")
+    if claims["exp"] <= now - self.leeway:
+      raise ValueError("token expired")
+    return claims
+
+  def _get_key(self, kid):
+    now = time.monotonic()
+    expired = self._keys_fetched_at is None or now - self._keys_fetched_at > self.jwks_ttl
+    # 鍵のローテーションに備え、未知のkidの場合は再取得（ただし1分に1回まで）
+    unknown = kid not in self._keys and (self._keys_fetched_at is None or now - self._keys_fetched_at > 60)
+    if expired or unknown:
+      with self._lock:
+        self._fetch_keys()
+    return self._keys[kid]
+
+  def _fetch_keys(self):
+    with urllib.request.urlopen(self.jwks_url, timeout=3) as response:
+      jwks = json.load(response)
+    self._keys = {
+      key["kid"]: (_b64url_uint(key["n"]), _b64url_uint(key["e"]))
+      for key in jwks["keys"] if key.get("kty") == "RSA"
+    }
+    self._keys_fetched_at = time.monotonic()
+
+def parse_cookies(event):
+  """API Gatewayのイベントからクッキーを取得"""
+  cookies = {}
+  headers = event.get("multiValueHeaders") or {}
+  values = []
+  for name, header_values in headers.items():
+    if name.lower() == "cookie":
+      values.extend(header_values or [])
+  if not values:
+    for name, value in (event.get("headers") or {}).items():
+      if name.lower() == "cookie" and value:
+        values.append(value)
+  for value in values:
+    for pair in value.split(";"):
+      name, sep, cookie_value = pair.strip().partition("=")
+      if sep:
+        cookies[name] = cookie_value
+  return cookies
+
+def authenticate(master):
+  """
+  クッキーのIDトークンをローカルで検証して認証状態を設定する
+  検証できなかった場合はFalseを返す（hadxの通常の認証処理にフォールバックする）
+  """
+  settings = master.settings
+  cookies = parse_cookies(master.event)
+  id_token = cookies.get(settings.AUTH_COOKIE_ID_TOKEN)
+  if not id_token:
+    return False
+  claims = settings.JWT_VERIFIER.verify(id_token, token_use="id")
+  if claims is None:
+    return False
+  master.request.auth = True
+  master.request.decode_token = claims
+  master.request.access_token = cookies.get(settings.AUTH_COOKIE_ACCESS_TOKEN)
+  return True
@@ -0,0 +1,41 @@
+import json
+from .common import encode_for_url, decode_from_url
+
+class InvalidCursor(ValueError):
+  """ページネーション用のトークンが不正"""
+
+def encode_cursor(state):
+  """
+  LastEvaluatedKeyなどを含む辞書を不透明なトークンに変換する
+  続きがない場合（stateが空）はNoneを返す
+  """
+  if not state:
+    return None
+  return encode_for_url(json.dumps(state, separators=(",", ":"), ensure_ascii=False))
+
+def decode_cursor(token):
+  """
+  encode_cursorで作成したトークンを辞書に戻す
+  トークンが指定されていない場合はNoneを返す
+  """
+  if not token:
+    return None
+  try:
+    state = json.loads(decode_from_url(token))
+  except ValueError as e:
+    raise InvalidCursor("invalid cursor") from e
+  if not isinstance(state, dict):
+    raise InvalidCursor("invalid cursor")
+  return state
+
+def parse_limit(value, default, maximum):
+  """
+  クエリパラメータのlimitを1〜maximumの整数に丸める
+  """
+  if value in (None, ""):
+    return default
+  try:
+    limit = int(value)
+  except (TypeError, ValueError):
+    return default
+  return max(1, min(limit, maximum))
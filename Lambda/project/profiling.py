@@ -0,0 +1,93 @@
+"""
+リクエスト処理のフェーズごとの所要時間を計測する
+
+環境変数 WIKIPROJECT_PROFILE=1 の時のみ有効
+計測結果は構造化ログ（JSON）とCloudWatch Embedded Metric Format（EMF）で出力する
+"""
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+ENABLED = os.environ.get("WIKIPROJECT_PROFILE", "").lower() in ("1", "true", "yes")
+NAMESPACE = os.environ.get("WIKIPROJECT_PROFILE_NAMESPACE", "WikiProject")
+
+class Profile:
+  def __init__(self, cold_start):
+    self.cold_start = cold_start
+    self.phases = {}
+    # 他のフェーズの中で計測したフェーズ（合計には含めない）
+    self.nested = set()
+    self._depth = 0
+
+  @contextmanager
+  def phase(self, name):
+    if self._depth:
+      self.nested.add(name)
+    self._depth += 1
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self._depth -= 1
+      self.record(name, (time.perf_counter() - start) * 1000)
+
+  def record(self, name, elapsed_ms):
+    self.phases[name] = self.phases.get(name, 0.0) + elapsed_ms
+
+  def fields(self):
+    return {
+      "cold_start": self.cold_start,
+      "phases_ms": {k: round(v, 3) for k, v in self.phases.items()},
+      "total_ms": round(sum(v for k, v in self.phases.items() if k not in self.nested), 3),
+    }
+
+  def emf(self, function_name):
+    """CloudWatch Embedded Metric Format のドキュメントを作成"""
+    metrics = {f"{name}Ms": round(value, 3) for name, value in self.phases.items()}
+    return {
+      "_aws": {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+          "Namespace": NAMESPACE,
+          "Dimensions": [["FunctionName", "ColdStart"]],
+          "Metrics": [{"Name": name, "Unit": "Milliseconds"} for name in metrics],
+        }],
+      },
+      "FunctionName": function_name,
+      "ColdStart": str(self.cold_start).lower(),
+      **metrics,
+    }
+
+_current = None
+
+def start(cold_start=False):
+  """リクエストごとの計測を開始（無効時は何もしない）"""
+  global _current
+  _current = Profile(cold_start) if ENABLED else None
+  return _current
+
+def current():
+  return _current
+
+def phase(name):
+  """with文でフェーズの所要時間を計測"""
+  if _current is None:
+    return nullcontext()
+  return _current.phase(name)
+
+def record(name, elapsed_ms):
+  if _current is not None:
+    _current.record(name, elapsed_ms)
+
+def finish(logger, function_name, **fields):
+  """計測結果をログとEMFで出力して計測を終了"""
+  global _current
+  profile, _current = _current, None
+  if profile is None:
+    return
+  logger.info("profile", extra={"profile": {**profile.fields(), **fields}})
+  # EMFは標準出力に1行のJSONとして出力する
+  sys.stdout.write(json.dumps(profile.emf(function_name)) + "\n")
+  sys.stdout.flush()
@@ -0,0 +1,113 @@
+"""
+遅延読み込みのURLルーティング
+
+LazyRouterのサブモジュールとLazyPathのビューは、最初にマッチするリクエストが来た時にimportする
+パスの照合は、固定部分をセグメント単位のトライ・辞書で引き、可変部分のみ事前にコンパイルした正規表現で照合する
+"""
+import re
+import importlib
+import threading
+
+_PARAMETER = re.compile(r"^\{(\w+)\}$")
+
+class RouteNotFound(Exception):
+  """マッチするルートがない"""
+
+def _split(path):
+  path = path.strip("/")
+  return path.split("/") if path else []
+
+def _import_string(dotted_path):
+  module_path, _, attribute = dotted_path.rpartition(".")
+  return getattr(importlib.import_module(module_path), attribute)
+
+class LazyPath:
+  """
+  パスとビューの対応（hadx.urls.Pathに相当）
+  viewには関数または "module.function" 形式の文字列を指定する
+  public=True のルートは認証情報を使わないため、Cookieによる認証を行わない
+  """
+  def __init__(self, pattern, view, name=None, public=False):
+    self.pattern = pattern.strip("/")
+    self.name = name
+    self.public = public
+    self._view = view
+    self.regex = None
+    segments = _split(self.pattern)
+    if any(_PARAMETER.match(s) for s in segments):
+      self.regex = re.compile("^" + "/".join(
+        _PARAMETER.sub(r"(?P<\1>[^/]+)", s) if _PARAMETER.match(s) else re.escape(s) for s in segments
+      ) + "$")
+
+  @property
+  def view(self):
+    if isinstance(self._view, str):
+      self._view = _import_string(self._view)
+    return self._view
+
+class LazyRouter:
+  """
+  パスのプレフィックスとサブモジュールの対応（hadx.urls.Routerに相当）
+  サブモジュールのurlpatterns（LazyPath/LazyRouterのリスト）は最初にマッチした時に読み込む
+  """
+  def __init__(self, prefix, module, name=None):
+    self.prefix = prefix.strip("/")
+    self.module = module
+    self.name = name
+    self._table = None
+    self._lock = threading.Lock()
+
+  @property
+  def table(self):
+    if self._table is None:
+      with self._lock:
+        if self._table is None:
+          self._table = RouteTable(importlib.import_module(self.module).urlpatterns)
+    return self._table
+
+class RouteTable:
+  def __init__(self, patterns):
+    self._literal = {}    # 可変部分のないパス -> LazyPath
+    self._patterns = []   # 可変部分のあるLazyPath（定義順）
+    self._routers = {}    # プレフィックスのトライ（セグメント -> 子ノード、None -> LazyRouter）
+    for entry in patterns:
+      if isinstance(entry, LazyRouter):
+        node = self._routers
+        for segment in _split(entry.prefix):
+          node = node.setdefault(segment, {})
+        node.setdefault(None, entry)
+      elif entry.regex is None:
+        self._literal.setdefault(entry.pattern, entry)
+      else:
+        self._patterns.append(entry)
+
+  def resolve(self, path):
+    """パスに対応する (LazyPath, kwargs) を返す"""
+    segments = _split(path)
+    # 長いプレフィックスのLazyRouterから順に試す
+    candidates = []
+    node = self._routers
+    for depth, segment in enumerate(segments):
+      node = node.get(segment)
+      if node is None:
+        break
+      if None in node:
+        candidates.append((depth + 1, node[None]))
+    for depth, router in reversed(candidates):
+      try:
+        return router.table.resolve("/".join(segments[depth:]))
+      except RouteNotFound:
+        pass
+    relative = "/".join(segments)
+    if relative in self._literal:
+      return self._literal[relative], {}
+    for route in self._patterns:
+      match = route.regex.match(relative)
+      if match:
+        return route, match.groupdict()
+    raise RouteNotFound(path)
+
+  def path2view(self, path):
+    """hadxのRouter.path2viewと同じく (view, kwargs) を返す"""
+    route, kwargs = self.resolve(path)
+    return route.view, kwargs
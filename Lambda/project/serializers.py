@@ -0,0 +1,65 @@
+"""
+レスポンスのJSONのシリアライズ
+
+orjsonがインストールされていれば使い、なければ標準のjsonを使う。
+DynamoDBのアイテムの値（Decimal は整数なら int、それ以外は float、set はリスト、bytes / Binary はbase64の文字列）を
+そのまま変換できるので、ビューはアイテムを新しい辞書にコピーせずにレスポンスに含められる。
+json_response は hadx の json_response と同じヘッダーのレスポンスを作り、本文だけをここでシリアライズする
+"""
+import json
+import base64
+from decimal import Decimal
+from datetime import date, datetime
+from . import profiling
+
+def _orjson():
+  """orjsonがインストールされていれば返す"""
+  try:
+    import orjson
+  except ImportError:
+    return None
+  return orjson
+
+_ORJSON = _orjson()
+
+def default(value):
+  """標準のjson・orjsonが変換できない値の変換"""
+  if isinstance(value, Decimal):
+    return int(value) if value == value.to_integral_value() else float(value)
+  if isinstance(value, (set, frozenset)):
+    try:
+      return sorted(value)
+    except TypeError:
+      return list(value)
+  if isinstance(value, (bytes, bytearray, memoryview)):
+    return base64.b64encode(value).decode("ascii")
+  # boto3.dynamodb.types.Binary
+  data = getattr(value, "value", None)
+  if isinstance(data, (bytes, bytearray)):
+    return base64.b64encode(data).decode("ascii")
+  if isinstance(value, (datetime, date)):
+    return value.isoformat()
+  raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(data):
+  """JSONの文字列"""
+  if _ORJSON is not None:
+    return _ORJSON.dumps(data, default=default, option=_ORJSON.OPT_NON_STR_KEYS).decode("utf-8")
+  return json.dumps(data, default=default, ensure_ascii=False, separators=(",", ":"))
+
+def backend():
+  """使っているシリアライザの名前"""
+  return "orjson" if _ORJSON is not None else "json"
+
+def json_response(master, data, code=200):
+  """hadx.shortcuts.json_response と同じレスポンスを返す（本文はdumpsでシリアライズする）"""
+  with profiling.phase("serialize"):
+    body = dumps(data)
+  return serialized_response(master, body, code=code)
+
+def serialized_response(master, body, code=200):
+  """シリアライズ済みのJSONの文字列を本文にしたレスポンス"""
+  from hadx.shortcuts import json_response as hadx_json_response
+  response = hadx_json_response(master, {}, code=code)
+  response["body"] = body
+  return response
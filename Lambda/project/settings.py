@@ -13,40 +13,96 @@ WIKI_TABLE = os.environ.get('WIKI_TABLE', 'wikiproject-table')
 STORAGE_TABLE = os.environ.get('STORAGE_TABLE', 'wikiproject-storage-table')
 S3_BUCKET = os.environ.get('S3_BUCKET', 'wikiproject-storage')
 
+# 最近の記事にWikiTableのRecentIndexを使う（無効ならPublicCatalogIndexを読んで並べ替える）
+# RecentIndexはPublicCatalogIndexの作成後の2回目のデプロイで作成する（READMEを参照）
+WIKI_RECENT_INDEX = os.environ.get('WIKI_RECENT_INDEX', '').lower() in ('1', 'true', 'yes')
+# RecentIndexがない間にPublicCatalogIndexを並べ替えた結果をLambdaのメモリにキャッシュする秒数
+RECENT_CATALOG_CACHE_TTL = int(os.environ.get('RECENT_CATALOG_CACHE_TTL', 30))
+
+# 自分の最近の記事にWikiTableのOwnerRecentIndexを使う（無効なら自分の全記事をqueryして並べ替える）
+# OwnerRecentIndexはRecentIndexの作成後の3回目のデプロイで作成する（READMEを参照）
+WIKI_OWNER_RECENT_INDEX = os.environ.get('WIKI_OWNER_RECENT_INDEX', '').lower() in ('1', 'true', 'yes')
+
+# 記事本文を保存するテーブル（空ならメタデータと同じWIKI_TABLEのアイテムに保存する）
+WIKI_BODY_TABLE = os.environ.get('WIKI_BODY_TABLE', '')
+
+# 記事一覧・階層データを事前計算したテーブル（空なら一覧の取得時にWikiTableをqueryする）
+WIKI_NAV_TABLE = os.environ.get('WIKI_NAV_TABLE', '')
+
+# 全文検索のインデックスのテーブル（空なら検索は使えない）と、Lambdaのメモリにキャッシュする秒数
+WIKI_SEARCH_TABLE = os.environ.get('WIKI_SEARCH_TABLE', '')
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 60))
+
+# パブリック記事・共有記事をCloudFrontにキャッシュする秒数（0ならCloudFrontも毎回再検証する）と、
+# 記事の更新時にキャッシュを無効化するディストリビューション（空なら無効化しない）
+WIKI_EDGE_MAX_AGE = int(os.environ.get('WIKI_EDGE_MAX_AGE', 300))
+CDN_DISTRIBUTION_ID = os.environ.get('CDN_DISTRIBUTION_ID', '')
+
+# このバイト数以上のテキストのレスポンスを Accept-Encoding に応じて圧縮する（0なら圧縮しない）
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+
+# 記事本文の保存形式（このバイト数以上は圧縮し、圧縮後もこのバイト数を超える場合はS3に保存する）
+WIKI_TEXT_COMPRESS_BYTES = int(os.environ.get('WIKI_TEXT_COMPRESS_BYTES', 2048))
+WIKI_TEXT_SPILL_BYTES = int(os.environ.get('WIKI_TEXT_SPILL_BYTES', 256 * 1024))
+
+# ストレージの容量の上限（所有者ごと、0は無制限）
+STORAGE_QUOTA_BYTES = int(os.environ.get('STORAGE_QUOTA_BYTES', 0))
+STORAGE_QUOTA_FILES = int(os.environ.get('STORAGE_QUOTA_FILES', 0))
+
+# 同じ内容のファイルの実体を共有する（内容のSHA-256で保存する）
+STORAGE_DEDUP = os.environ.get('STORAGE_DEDUP', '').lower() in ('1', 'true', 'yes')
+
+# ストレージのダウンロードをCloudFrontの署名付きURLで配信する場合の設定（未設定ならS3の署名付きURL）
+STORAGE_CDN_DOMAIN = os.environ.get('STORAGE_CDN_DOMAIN', '')
+STORAGE_CDN_KEY_PAIR_ID = os.environ.get('STORAGE_CDN_KEY_PAIR_ID', '')
+STORAGE_CDN_PRIVATE_KEY_PARAMETER = os.environ.get('STORAGE_CDN_PRIVATE_KEY_PARAMETER', '/WikiProject/v2/Storage/cdn_private_key')
+
 # ログイン周りの設定
-from hadx.authenticate import Cognito, ManagedAuthPage
-import boto3
-
-# 設定値を環境変数またはSSMから取得
-if os.path.exists(os.path.join(BASE_DIR, "../admin.json")):
-  import json
-  with open(os.path.join(BASE_DIR, "../admin.json")) as f:
-    admin = json.load(f)
-  kwargs = {}
-  try:
-    kwargs["region_name"] = admin["region"]
-  except KeyError:
-    pass
-  try:
-    kwargs["profile_name"] = admin["profile"]
-  except KeyError:
-    pass
-  session = boto3.Session(**kwargs)
-  ssm = session.client('ssm')
-else:
-  ssm = boto3.client('ssm')
-
-COGNITO = Cognito(
-  domain=ssm.get_parameter(Name="/WikiProject/v2/Cognito/domain")["Parameter"]["Value"],
-  user_pool_id=ssm.get_parameter(Name="/WikiProject/v2/Cognito/user_pool_id")["Parameter"]["Value"],
-  client_id=ssm.get_parameter(Name="/WikiProject/v2/Cognito/client_id")["Parameter"]["Value"],
-  client_secret=ssm.get_parameter(Name="/WikiProject/v2/Cognito/client_secret")["Parameter"]["Value"],
-  region="ap-northeast-1"
-)
+# SSMの値は最初に使われた時にまとめて取得する（環境変数 or WIKIPROJECT_CONFIG_FILE で上書き可）
+from .config import ParameterStore, LazySetting
 
-AUTH_PAGE = ManagedAuthPage(
-  scope="aws.cognito.signin.user.admin email openid phone",
-  login_redirect_uri = ssm.get_parameter(Name="/WikiProject/v2/URL/home")["Parameter"]["Value"],
-  local_login_redirect_uri="http://localhost:8080"
+CONFIG = ParameterStore(
+  {
+    "cognito_domain": {"name": "/WikiProject/v2/Cognito/domain", "env": "COGNITO_DOMAIN", "file": ("cognito", "domain")},
+    "cognito_user_pool_id": {"name": "/WikiProject/v2/Cognito/user_pool_id", "env": "COGNITO_USER_POOL_ID", "file": ("cognito", "user_pool_id")},
+    "cognito_client_id": {"name": "/WikiProject/v2/Cognito/client_id", "env": "COGNITO_CLIENT_ID", "file": ("cognito", "client_id")},
+    "cognito_client_secret": {"name": "/WikiProject/v2/Cognito/client_secret", "env": "COGNITO_CLIENT_SECRET", "file": ("cognito", "client_secret")},
+    "url_home": {"name": "/WikiProject/v2/URL/home", "env": "URL_HOME", "file": ("url", "home")},
+  },
+  ttl=int(os.environ.get('CONFIG_TTL_SECONDS', '900')),
+  admin_file=os.path.join(BASE_DIR, "../admin.json")
 )
 
+def _cognito(config):
+  from hadx.authenticate import Cognito
+  return Cognito(
+    domain=config["cognito_domain"],
+    user_pool_id=config["cognito_user_pool_id"],
+    client_id=config["cognito_client_id"],
+    client_secret=config["cognito_client_secret"],
+    region="ap-northeast-1"
+  )
+
+def _auth_page(config):
+  from hadx.authenticate import ManagedAuthPage
+  return ManagedAuthPage(
+    scope="aws.cognito.signin.user.admin email openid phone",
+    login_redirect_uri=config["url_home"],
+    local_login_redirect_uri="http://localhost:8080"
+  )
+
+def _jwt_verifier(config):
+  from .jwt_auth import CognitoJWTVerifier
+  return CognitoJWTVerifier(
+    region="ap-northeast-1",
+    user_pool_id=config["cognito_user_pool_id"],
+    client_id=config["cognito_client_id"],
+    jwks_ttl=int(os.environ.get('JWKS_TTL_SECONDS', '3600'))
+  )
+
+COGNITO = LazySetting(_cognito, CONFIG)
+AUTH_PAGE = LazySetting(_auth_page, CONFIG)
+# Cookieのトークンをローカルで検証する（検証できない場合はCOGNITO.set_auth_by_cookieにフォールバック）
+JWT_VERIFIER = LazySetting(_jwt_verifier, CONFIG)
+AUTH_COOKIE_ID_TOKEN = os.environ.get('AUTH_COOKIE_ID_TOKEN', 'id_token')
+AUTH_COOKIE_ACCESS_TOKEN = os.environ.get('AUTH_COOKIE_ACCESS_TOKEN', 'access_token')
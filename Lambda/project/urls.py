@@ -1,11 +1,18 @@
-from hadx.urls import Path, Router
+from hadx.urls import Path
+from .routing import LazyPath, LazyRouter, RouteTable
 from .views import home
 
+# hadx用（名前からのURLの逆引きに使用）
 urlpatterns = [
   Path("", home, name="home"),
-  Router("api/auth", "api.auth_urls", name="auth_api"),
-  Router("api/wiki", "api.wiki_urls", name="wiki_api"),
-  Router("api/storage", "api.storage_urls", name="storage_api"),
-  Router("api/share", "api.share_urls", name="share_api"),
-  Router("accounts", "accounts.urls", name="accounts"),
 ]
+
+# リクエストのルーティング用（サブモジュールとビューは最初にマッチした時にimportする）
+routes = RouteTable([
+  LazyPath("", home, name="home", public=True),
+  LazyRouter("api/auth", "api.auth_urls", name="auth_api"),
+  LazyRouter("api/wiki", "api.wiki_urls", name="wiki_api"),
+  LazyRouter("api/storage", "api.storage_urls", name="storage_api"),
+  LazyRouter("api/share", "api.share_urls", name="share_api"),
+  LazyRouter("accounts", "accounts.urls", name="accounts"),
+])
@@ -1,4 +1,4 @@
-from hadx.shortcuts import json_response
+from .serializers import json_response
 
 def home(master):
     """
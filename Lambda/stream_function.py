@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WikiTableのDynamoDB Streamsの処理
+
+- 変更のあった記事をユーザーごとにまとめ、WikiNavTableの一覧・階層データのアイテムに差分を反映する（api.wiki_nav）
+- 変更のあった記事を全文検索のインデックスに登録し直す（api.wiki_search）
+- 本文の変わった記事のHTMLへの変換結果をS3に保存し、閲覧時に変換しなくてよいようにする（api.wiki_render）
+- 変更のあったパブリック記事・共有記事のCloudFrontのキャッシュを無効化する（api.wiki_cdn、失敗しても再試行しない）
+
+ユーザー・記事の単位で失敗した場合はその最初のレコードを batchItemFailures で返し、そこから再試行させる
+（どちらも同じ変更を繰り返しても結果が変わらない）
+"""
+import logging
+from boto3.dynamodb.types import TypeDeserializer
+import project.settings
+from api import wiki_nav, wiki_search, wiki_render, wiki_cdn
+from api.wiki_body import get_page_item
+from api.wiki_text import TEXT_ATTRIBUTES, load_text
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+_deserializer = TypeDeserializer()
+
+# 検索のインデックスに関係する属性
+SEARCH_ATTRIBUTES = ("title", "public", "body_version") + TEXT_ATTRIBUTES
+
+# 本文の変更を表す属性
+BODY_ATTRIBUTES = ("body_version",) + TEXT_ATTRIBUTES
+
+def _image(record, name):
+  """レコードのKeys / OldImage / NewImageを通常の値に変換（ない場合はNone）"""
+  image = record["dynamodb"].get(name)
+  if image is None:
+    return None
+  return {key: _deserializer.deserialize(value) for key, value in image.items()}
+
+def _nav_changes(records):
+  """ユーザーごとの記事の変更 {username: [(slug, 記事またはNone)]} と、ユーザーごとの最初のシーケンス番号"""
+  changes = {}
+  first_sequence = {}
+  for record in records:
+    keys = _image(record, "Keys")
+    old, new = _image(record, "OldImage"), _image(record, "NewImage")
+    entry = wiki_nav.page_entry(new) if new else None
+    # 本文だけの変更など、一覧に関係しない変更は反映しない
+    if old and entry and wiki_nav.page_entry(old) == entry:
+      continue
+    changes.setdefault(keys["username"], []).append((keys["slug"], entry))
+    first_sequence.setdefault(keys["username"], record["dynamodb"]["SequenceNumber"])
+  return changes, first_sequence
+
+def _page_changes(records, attributes, removed=True):
+  """attributes のいずれかが変わった記事 {(username, slug): 最初のシーケンス番号}（removed がFalseなら削除は除く）"""
+  changes = {}
+  for record in records:
+    keys = _image(record, "Keys")
+    old, new = _image(record, "OldImage"), _image(record, "NewImage")
+    if new is None and not removed:
+      continue
+    if old and new and all(old.get(name) == new.get(name) for name in attributes):
+      continue
+    changes.setdefault((keys["username"], keys["slug"]), record["dynamodb"]["SequenceNumber"])
+  return changes
+
+def _prerender(username, slug):
+  """記事の現在の本文のHTMLへの変換結果をS3に保存"""
+  page = get_page_item(project.settings, username, slug, consistent=True)
+  if page is not None:
+    wiki_render.store(project.settings, load_text(project.settings, page) or "")
+
+def _invalidate(records):
+  """変更のあったパブリック記事・共有記事のCloudFrontのキャッシュを無効化（同じレコードの再試行では重複しない）"""
+  paths = set()
+  for record in records:
+    paths |= wiki_cdn.page_paths(_image(record, "OldImage"), _image(record, "NewImage"))
+  if paths:
+    reference = f"{records[0]['dynamodb']['SequenceNumber']}-{records[-1]['dynamodb']['SequenceNumber']}"
+    wiki_cdn.invalidate(project.settings.CDN_DISTRIBUTION_ID, paths, reference)
+
+def lambda_handler(event, context):
+  records = event.get("Records", [])
+  failures = []
+  if project.settings.WIKI_SEARCH_TABLE:
+    for (username, slug), sequence in _page_changes(records, SEARCH_ATTRIBUTES).items():
+      try:
+        wiki_search.index_page(project.settings, username, slug)
+      except Exception as e:
+        logger.exception(f"Update search index error: {username}/{slug}: {e}")
+        failures.append(sequence)
+  if wiki_render.available():
+    for (username, slug), sequence in _page_changes(records, BODY_ATTRIBUTES, removed=False).items():
+      try:
+        _prerender(username, slug)
+      except Exception as e:
+        logger.exception(f"Prerender error: {username}/{slug}: {e}")
+        failures.append(sequence)
+  if project.settings.WIKI_NAV_TABLE:
+    changes, first_sequence = _nav_changes(records)
+    for username, user_changes in changes.items():
+      try:
+        wiki_nav.apply_changes(project.settings.WIKI_NAV_TABLE, username, user_changes)
+      except Exception as e:
+        logger.exception(f"Update navigation error: {username}: {e}")
+        failures.append(first_sequence[username])
+  if project.settings.CDN_DISTRIBUTION_ID and records:
+    try:
+      _invalidate(records)
+    except Exception as e:
+      logger.exception(f"Invalidate cache error: {e}")
+      # 内容の更新のキャッシュは WIKI_EDGE_MAX_AGE 秒で期限切れになるので再試行しないが、
+      # 非公開・削除・共有の解除は期限切れまで見えてしまうので、最初のレコードから再試行する
+      revoked = [
+        record["dynamodb"]["SequenceNumber"] for record in records
+        if wiki_cdn.revokes_access(_image(record, "OldImage"), _image(record, "NewImage"))
+      ]
+      if revoked:
+        failures.append(revoked[0])
+  logger.info(f"stream: {len(records)} records, {len(failures)} failed")
+  return {"batchItemFailures": [{"itemIdentifier": sequence} for sequence in dict.fromkeys(failures)]}
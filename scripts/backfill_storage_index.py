@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+既存のファイル・フォルダにインデックス用の属性を付与する移行スクリプト
+
+  python scripts/backfill_storage_index.py --profile default [--dry-run]
+
+- parent / name_key: フォルダの直下を一覧するParentIndexに載せるための属性
+"""
+import argparse
+import boto3
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="既存のファイル・フォルダにインデックス用の属性を付与する")
+  parser.add_argument("--table", default="wikiproject-storage-table", help="ストレージテーブル名")
+  parser.add_argument("--region", default="ap-northeast-1", help="リージョン")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="更新せずに対象件数のみ表示")
+  return parser.parse_args()
+
+def index_updates(item):
+  """アイテムに必要なSETを返す（Lambda/api/storage_paths.py の index_attributes と同じ値）"""
+  if 'owner' not in item or 'path' not in item:
+    # フォルダの削除・移動のジョブなど
+    return {}
+  expected = {
+    'parent': f"{item['owner']}#{item['path']}",
+    'name_key': f"{0 if item.get('type', 'file') == 'folder' else 1}#{(item.get('name') or '').casefold()}"
+  }
+  return {k: v for k, v in expected.items() if item.get(k) != v}
+
+def main():
+  args = parse_args()
+  session = boto3.Session(profile_name=args.profile, region_name=args.region)
+  table = session.resource('dynamodb').Table(args.table)
+  scan_kwargs = {}
+  scanned = updated = 0
+  while True:
+    response = table.scan(**scan_kwargs)
+    for item in response['Items']:
+      scanned += 1
+      set_values = index_updates(item)
+      if not set_values:
+        continue
+      updated += 1
+      if args.dry_run:
+        continue
+      table.update_item(
+        Key={'id': item['id']},
+        UpdateExpression="SET " + ", ".join([f"#{k} = :{k}" for k in set_values]),
+        ExpressionAttributeNames={f"#{k}": k for k in set_values},
+        ExpressionAttributeValues={f":{k}": v for k, v in set_values.items()}
+      )
+    if 'LastEvaluatedKey' not in response:
+      break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+  print(f"scanned: {scanned}, {'to update' if args.dry_run else 'updated'}: {updated}")
+
+if __name__ == "__main__":
+  main()
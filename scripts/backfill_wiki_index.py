@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+既存の記事にインデックス用の属性を付与する移行スクリプト
+
+  python scripts/backfill_wiki_index.py --profile default [--dry-run]
+
+- public_pk: パブリック記事のみPublicCatalogIndexに載せるための属性
+"""
+import argparse
+import boto3
+
+PUBLIC_PARTITION = 'PUBLIC'
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="既存記事にインデックス用の属性を付与する")
+  parser.add_argument("--table", default="wikiproject-table", help="Wikiテーブル名")
+  parser.add_argument("--region", default="ap-northeast-1", help="リージョン")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="更新せずに対象件数のみ表示")
+  return parser.parse_args()
+
+def index_updates(item):
+  """アイテムに必要なSET/REMOVEを返す"""
+  set_values = {}
+  remove_attributes = []
+  if item.get('public', False):
+    if item.get('public_pk') != PUBLIC_PARTITION:
+      set_values['public_pk'] = PUBLIC_PARTITION
+  elif 'public_pk' in item:
+    remove_attributes.append('public_pk')
+  return set_values, remove_attributes
+
+def main():
+  args = parse_args()
+  session = boto3.Session(profile_name=args.profile, region_name=args.region)
+  table = session.resource('dynamodb').Table(args.table)
+  scan_kwargs = {}
+  scanned = updated = 0
+  while True:
+    response = table.scan(**scan_kwargs)
+    for item in response['Items']:
+      scanned += 1
+      set_values, remove_attributes = index_updates(item)
+      if not set_values and not remove_attributes:
+        continue
+      updated += 1
+      if args.dry_run:
+        continue
+      expressions = []
+      if set_values:
+        expressions.append("SET " + ", ".join([f"#{k} = :{k}" for k in set_values]))
+      if remove_attributes:
+        expressions.append("REMOVE " + ", ".join([f"#{k}" for k in remove_attributes]))
+      update_kwargs = {
+        'Key': {'username': item['username'], 'slug': item['slug']},
+        'UpdateExpression': " ".join(expressions),
+        'ExpressionAttributeNames': {f"#{k}": k for k in list(set_values) + remove_attributes}
+      }
+      if set_values:
+        update_kwargs['ExpressionAttributeValues'] = {f":{k}": v for k, v in set_values.items()}
+      table.update_item(**update_kwargs)
+    if 'LastEvaluatedKey' not in response:
+      break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+  print(f"scanned: {scanned}, {'to update' if args.dry_run else 'updated'}: {updated}")
+
+if __name__ == "__main__":
+  main()
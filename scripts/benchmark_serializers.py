@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+レスポンスのJSONのシリアライズ速度を計測する
+
+  python scripts/benchmark_serializers.py [--items 1000] [--seconds 1.0]
+
+記事詳細・記事一覧（treeData を含む）・ストレージの一覧の、DynamoDBのアイテムと同じ値（Decimal・set）を含む
+データを作成し、以下の1秒あたりの回数・MBを比較する
+- copy+json: Decimal を変換した辞書にコピーしてから標準のjsonでシリアライズ（従来のビューの方法）
+- json: project.serializers.default を使った標準のjson（orjsonがない場合）
+- orjson: project.serializers.default を使ったorjson（インストールされている場合）
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from decimal import Decimal
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Lambda"))
+
+from project import serializers  # noqa: E402
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="レスポンスのJSONのシリアライズ速度を計測する")
+  parser.add_argument("--items", type=int, default=1000, help="一覧の件数")
+  parser.add_argument("--seconds", type=float, default=1.0, help="1つの計測の時間（秒）")
+  return parser.parse_args()
+
+def page_payload():
+  """記事詳細（長い日本語の本文）"""
+  text = "\n".join(f"## 見出し{i}\n\n日本語の本文です。将棋の棋譜やメモを書きます。Markdownの**強調**や`code`も含みます。" * 3 for i in range(200))
+  return {
+    "success": True,
+    "data": {
+      "username": "user01",
+      "slug": "notes/2026",
+      "title": "メモ",
+      "text": text,
+      "public": True,
+      "priority": Decimal("10"),
+      "version": Decimal("42"),
+      "share": False,
+      "share_code": "0f8fad5b-d9cb-469f-a165-70867728950e",
+      "share_edit_permission": False,
+      "created_at": "2026-01-01T09:00:00.000000",
+      "last_updated": "2026-10-01T12:34:56.789012"
+    }
+  }
+
+def pages_payload(count):
+  """記事一覧と階層データ"""
+  pages = [{
+    "username": f"user{i % 20:02d}",
+    "slug": f"page-{i:05d}",
+    "title": f"記事のタイトル{i}",
+    "last_updated": "2026-10-01T12:34:56.789012",
+    "public": i % 3 == 0,
+    "priority": Decimal(i % 7)
+  } for i in range(count)]
+  tree = [{
+    "username": f"user{u:02d}",
+    "html": f"<h3>user{u:02d}</h3><ul>" + "".join(
+      f"<li><a href=\"/user{u:02d}/page-{i:05d}\">記事のタイトル{i}</a></li>" for i in range(u, count, 20)
+    ) + "</ul>"
+  } for u in range(20)]
+  return {"success": True, "data": {"pages": pages, "treeData": tree, "next": None}}
+
+def storage_payload(count):
+  """ストレージの一覧（DynamoDBのアイテムのまま）"""
+  items = [{
+    "id": f"0f8fad5b-d9cb-469f-a165-{i:012d}",
+    "name": f"ファイル{i}.png",
+    "type": "file",
+    "path": f"/images/ファイル{i}.png",
+    "size": Decimal(1024 * (i + 1)),
+    "mimetype": "image/png",
+    "created_at": "2026-01-01T09:00:00.000000",
+    "updated_at": "2026-10-01T12:34:56.789012",
+    "owner": "user01",
+    "tags": {"image", "png"},
+    "thumbnail_url": None,
+    "preview_url": None
+  } for i in range(count)]
+  return {"success": True, "data": {"items": items, "next": None}}
+
+def _plain(value):
+  if isinstance(value, dict):
+    return {k: _plain(v) for k, v in value.items()}
+  if isinstance(value, list):
+    return [_plain(v) for v in value]
+  if isinstance(value, (set, frozenset)):
+    return sorted(_plain(v) for v in value)
+  if isinstance(value, Decimal):
+    return int(value) if value == value.to_integral_value() else float(value)
+  return value
+
+def copy_json(data):
+  return json.dumps(_plain(data), ensure_ascii=False)
+
+def stdlib_json(data):
+  return json.dumps(data, default=serializers.default, ensure_ascii=False, separators=(",", ":"))
+
+def measure(function, data, seconds):
+  """(1秒あたりの回数, 1回の出力のバイト数)"""
+  size = len(function(data).encode("utf-8"))
+  count = 0
+  start = time.perf_counter()
+  deadline = start + seconds
+  while True:
+    function(data)
+    count += 1
+    now = time.perf_counter()
+    if now >= deadline:
+      return count / (now - start), size
+
+def main():
+  args = parse_args()
+  candidates = [("copy+json", copy_json), ("json", stdlib_json)]
+  try:
+    import orjson
+  except ImportError:
+    print("orjson is not installed (skipped)")
+  else:
+    def orjson_dumps(data):
+      return orjson.dumps(data, default=serializers.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    candidates.append(("orjson", orjson_dumps))
+  print(f"serializers backend: {serializers.backend()}")
+
+  payloads = (
+    ("page", page_payload()),
+    (f"pages x{args.items}", pages_payload(args.items)),
+    (f"storage x{args.items}", storage_payload(args.items)),
+  )
+  for label, data in payloads:
+    # 変換結果が同じことを確認
+    expected = json.loads(copy_json(data))
+    print(label)
+    for name, function in candidates:
+      if json.loads(function(data)) != expected:
+        raise SystemExit(f"{name}: output differs")
+      per_second, size = measure(function, data, args.seconds)
+      print(f"  {name:<10} {per_second:>10.1f} ops/s {per_second * size / 1024 / 1024:>8.1f} MB/s ({size / 1024:.0f} KB)")
+
+if __name__ == "__main__":
+  main()
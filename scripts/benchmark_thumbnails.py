@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+サムネイル・プレビューの作成速度を計測する（Pillowが必要）
+
+  python scripts/benchmark_thumbnails.py [--count 8] [--workers 4]
+
+大きさの異なる合成画像（JPEG）を作成し、1枚ずつ処理した場合とプロセスプールで処理した場合の
+1秒あたりの枚数・MBを比較する
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Lambda"))
+
+from api import thumbnails  # noqa: E402
+
+SIZES = ((640, 480), (1920, 1080), (4000, 3000), (8000, 6000))
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="サムネイル・プレビューの作成速度を計測する")
+  parser.add_argument("--count", type=int, default=8, help="大きさごとの画像の数")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="プロセスプールのワーカー数")
+  return parser.parse_args()
+
+def make_image(width, height):
+  """グラデーションの合成画像（JPEG）のバイト列"""
+  from PIL import Image
+  image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+  buffer = io.BytesIO()
+  image.save(buffer, "JPEG", quality=90)
+  return buffer.getvalue()
+
+def report(label, count, total_bytes, seconds):
+  print(f"  {label:<12} {count / seconds:>8.1f} images/s {total_bytes / seconds / 1024 / 1024:>8.1f} MB/s")
+
+def main():
+  args = parse_args()
+  if not thumbnails.available():
+    raise SystemExit("Pillow is not installed")
+  print(f"format: {thumbnails.output_format()}, workers: {args.workers}")
+  for width, height in SIZES:
+    data = make_image(width, height)
+    sources = [(i, data) for i in range(args.count)]
+    total_bytes = len(data) * args.count
+    print(f"{width}x{height} ({len(data) / 1024:.0f} KB)")
+
+    start = time.perf_counter()
+    for _, source in sources:
+      thumbnails.render_variants(source)
+    report("sequential", args.count, total_bytes, time.perf_counter() - start)
+
+    with thumbnails.open_pool(args.workers) as pool:
+      # ワーカーの起動時間は含めない
+      thumbnails.render_many(sources[:2], pool)
+      start = time.perf_counter()
+      results = thumbnails.render_many(sources, pool)
+      seconds = time.perf_counter() - start
+    errors = [r for r in results.values() if isinstance(r, Exception)]
+    if errors:
+      print(f"  errors: {errors[0]}")
+    report("pool" if pool else "in process", args.count, total_bytes, seconds)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WikiNavTableの記事一覧・階層データのアイテムをWikiTableから作り直す
+
+  python scripts/build_wiki_nav.py --profile default [--dry-run]
+
+初回の導入時や、ストリームの処理が失敗し続けてアイテムがずれた場合に実行する。
+ユーザーごとに新しい version の分割を書き込んでからヘッダー・索引を置き換え、
+参照されなくなったアイテム（古い分割、記事がなくなったユーザー、以前の形式の public）を削除する
+"""
+import os
+import sys
+import argparse
+import boto3
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Lambda"))
+
+from api.wiki_nav import (  # noqa: E402
+  PAGES_PREFIX, PUBLIC_PREFIX, page_entry, split_chunks, chunk_items, user_id,
+  public_index_id, public_index_ids
+)
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="WikiNavTableのアイテムを作り直す")
+  parser.add_argument("--table", default="wikiproject-table", help="Wikiテーブル名")
+  parser.add_argument("--nav-table", default="wikiproject-nav-table", help="一覧・階層データのテーブル名")
+  parser.add_argument("--region", default="ap-northeast-1", help="リージョン")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="保存せずに件数のみ表示")
+  return parser.parse_args()
+
+def scan_all(table, **scan_kwargs):
+  while True:
+    response = table.scan(**scan_kwargs)
+    yield from response['Items']
+    if 'LastEvaluatedKey' not in response:
+      return
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def main():
+  args = parse_args()
+  session = boto3.Session(profile_name=args.profile, region_name=args.region)
+  dynamodb = session.resource('dynamodb')
+  table = dynamodb.Table(args.table)
+  nav_table = dynamodb.Table(args.nav_table)
+
+  pages = {}
+  for item in scan_all(table,
+                       ProjectionExpression='#username, #slug, #title, #priority, #public, #last_updated',
+                       ExpressionAttributeNames={f"#{k}": k for k in ('username', 'slug', 'title', 'priority', 'public', 'last_updated')}):
+    pages.setdefault(item['username'], {})[item['slug']] = page_entry(item)
+
+  # 既存のアイテムのID（新しい version は既存のヘッダーの次にする）
+  existing = {item['id']: item for item in scan_all(nav_table, ProjectionExpression='id, #version',
+                                                      ExpressionAttributeNames={'#version': 'version'})}
+
+  heads = []
+  chunks = []
+  indexes = {doc_id: {'id': doc_id} for doc_id in public_index_ids()}
+  for username, user_pages in pages.items():
+    version = int(existing.get(user_id(username), {}).get('version', 0)) + 1
+    page_chunks = split_chunks(user_pages.values())
+    public_chunks = split_chunks(entry for entry in user_pages.values() if entry['public'])
+    chunks += chunk_items(PAGES_PREFIX, username, version, page_chunks)
+    chunks += chunk_items(PUBLIC_PREFIX, username, version, public_chunks)
+    public_count = sum(len(chunk) for chunk in public_chunks)
+    heads.append({
+      'id': user_id(username),
+      'version': version,
+      'count': len(user_pages),
+      'chunks': len(page_chunks),
+      'public_count': public_count,
+      'public_chunks': len(public_chunks)
+    })
+    if public_chunks:
+      indexes[public_index_id(username)][user_id(username)] = {
+        'version': version, 'count': public_count, 'chunks': len(public_chunks)
+      }
+  keep = {item['id'] for item in heads + chunks} | set(indexes)
+  stale = [doc_id for doc_id in existing if doc_id not in keep]
+  public_users = sum(len(index) - 1 for index in indexes.values())
+  print(f"users: {len(pages)}, pages: {sum(len(p) for p in pages.values())}, public users: {public_users}, "
+        f"chunks: {len(chunks)}, stale items: {len(stale)}")
+  if args.dry_run:
+    return
+
+  # 分割を先に書き込み、ヘッダー・索引を切り替えてから古いアイテムを削除する
+  with nav_table.batch_writer() as batch:
+    for item in chunks:
+      batch.put_item(Item=item)
+  with nav_table.batch_writer() as batch:
+    for item in heads + list(indexes.values()):
+      batch.put_item(Item=item)
+  with nav_table.batch_writer() as batch:
+    for doc_id in stale:
+      batch.delete_item(Key={'id': doc_id})
+  print(f"deleted stale items: {len(stale)}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文検索のインデックスをWikiTableの全記事で登録し直す
+
+  python scripts/build_wiki_search.py --profile default [--dry-run]
+
+初回の導入時や、ストリームの処理が失敗し続けてインデックスがずれた場合に実行する
+（記事ごとに前回登録した内容との差分だけを書き込むので、何度実行してもよい）
+"""
+import os
+import sys
+import argparse
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Lambda"))
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="全文検索のインデックスを登録し直す")
+  parser.add_argument("--table", default="wikiproject-table", help="Wikiテーブル名")
+  parser.add_argument("--body-table", default="wikiproject-body-table", help="本文のテーブル名（空なら本文はWikiテーブル）")
+  parser.add_argument("--search-table", default="wikiproject-search-table", help="検索のインデックスのテーブル名")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="登録せずに記事数のみ表示")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  # Lambdaのコードの設定は環境変数から読み込まれる
+  if args.profile:
+    os.environ["AWS_PROFILE"] = args.profile
+  os.environ["WIKI_TABLE"] = args.table
+  os.environ["WIKI_BODY_TABLE"] = args.body_table
+  os.environ["WIKI_SEARCH_TABLE"] = args.search_table
+  import project.settings as settings
+  from project.aws import get_table
+  from api.wiki_search import index_page
+
+  table = get_table(settings.WIKI_TABLE)
+  scan_kwargs = {'ProjectionExpression': '#username, #slug', 'ExpressionAttributeNames': {'#username': 'username', '#slug': 'slug'}}
+  pages = changes = 0
+  while True:
+    response = table.scan(**scan_kwargs)
+    for item in response['Items']:
+      pages += 1
+      if not args.dry_run:
+        changes += index_page(settings, item['username'], item['slug'])
+    if 'LastEvaluatedKey' not in response:
+      break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+  print(f"pages: {pages}, posting changes: {changes}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+コールドスタート時のimport時間を計測し、予算を超えていれば失敗する
+
+  python scripts/import_budget.py [--budget scripts/import_budget.json] [--repeat 5]
+
+新しいインタプリタで python -X importtime を実行し、
+予算ファイルに記載したモジュールの累積import時間（複数回実行の中央値）を比較する
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LAMBDA_DIR = os.path.join(ROOT, "Lambda")
+DEFAULT_BUDGET = os.path.join(os.path.dirname(__file__), "import_budget.json")
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="コールドスタート時のimport時間を計測する")
+  parser.add_argument("--budget", default=DEFAULT_BUDGET, help="予算ファイル（JSON）")
+  parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+  parser.add_argument("--top", type=int, default=15, help="表示する遅いモジュールの数")
+  return parser.parse_args()
+
+def run_importtime(modules):
+  """新しいインタプリタでimportし、モジュールごとの累積時間（ms）を返す"""
+  env = dict(os.environ)
+  env["PYTHONPATH"] = LAMBDA_DIR + os.pathsep + env.get("PYTHONPATH", "")
+  env.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+  code = "; ".join(f"import {m}" for m in modules)
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    cwd=LAMBDA_DIR, env=env, capture_output=True, text=True
+  )
+  if result.returncode != 0:
+    sys.stderr.write(result.stderr)
+    raise SystemExit(f"import failed: {code}")
+  cumulative = {}
+  total = 0.0
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "cumulative" in line:
+      continue
+    _, _, fields = line.partition(":")
+    self_us, cumulative_us, name = fields.split("|")
+    module = name.strip()
+    cumulative[module] = max(cumulative.get(module, 0.0), int(cumulative_us) / 1000)
+    # インデントのないものがトップレベルのimport
+    if not name[1:].startswith(" "):
+      total += int(cumulative_us) / 1000
+  cumulative["<total>"] = total
+  return cumulative
+
+def main():
+  args = parse_args()
+  with open(args.budget) as f:
+    budget = json.load(f)
+  runs = [run_importtime(budget["entrypoints"]) for _ in range(args.repeat)]
+  modules = set().union(*runs)
+  median = {m: statistics.median(run.get(m, 0.0) for run in runs) for m in modules}
+
+  print(f"{'module':<40} {'median ms':>10}")
+  for module, ms in sorted(median.items(), key=lambda x: x[1], reverse=True)[:args.top]:
+    print(f"{module:<40} {ms:>10.1f}")
+
+  failed = []
+  limits = dict(budget.get("modules", {}))
+  limits["<total>"] = budget["total_ms"]
+  for module, limit in limits.items():
+    ms = median.get(module, 0.0)
+    status = "OK" if ms <= limit else "OVER"
+    print(f"[{status}] {module}: {ms:.1f} ms (budget {limit} ms)")
+    if ms > limit:
+      failed.append(module)
+  if failed:
+    raise SystemExit(1)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ストレージの使用量のカウンター（usage#{owner}#{path}）をファイルのアイテムから作り直すスクリプト
+
+  python scripts/reconcile_storage_usage.py --profile default [--dry-run]
+
+テーブルを1回スキャンして集計し、値の異なるカウンターをまとめて書き込む（不要になったカウンターは削除）。
+合計のカウンターの容量の上限の判定用の値（charged_bytes / charged_files）も作り直すので、デプロイ後に一度実行する。
+集計中に行われたアップロード・削除の分がずれる可能性があるので、利用の少ない時間に実行する
+"""
+import argparse
+from datetime import datetime
+import boto3
+
+USAGE_PREFIX = 'usage#'
+JOB_PREFIX = 'job-'
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="ストレージの使用量のカウンターを作り直す")
+  parser.add_argument("--table", default="wikiproject-storage-table", help="ストレージテーブル名")
+  parser.add_argument("--region", default="ap-northeast-1", help="リージョン")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="更新せずに差分の件数のみ表示")
+  return parser.parse_args()
+
+def ancestors(path):
+  """path とその祖先のフォルダのパス（Lambda/api/storage_usage.py と同じ）"""
+  paths = ['/']
+  current = ''
+  for segment in (path or '/').split('/'):
+    if segment:
+      current += '/' + segment
+      paths.append(current)
+  return paths
+
+def add(counters, owner, path, **values):
+  counter = counters.setdefault((owner, path), {'bytes': 0, 'files': 0, 'reserved': 0})
+  for name, value in values.items():
+    counter[name] = counter.get(name, 0) + value
+
+def main():
+  args = parse_args()
+  session = boto3.Session(profile_name=args.profile, region_name=args.region)
+  table = session.resource('dynamodb').Table(args.table)
+
+  expected = {}
+  current = {}
+  scan_kwargs = {}
+  scanned = 0
+  while True:
+    response = table.scan(**scan_kwargs)
+    for item in response['Items']:
+      scanned += 1
+      if item['id'].startswith(USAGE_PREFIX):
+        current[(item['usage_owner'], item['usage_path'])] = item
+        continue
+      if item['id'].startswith(JOB_PREFIX) or item.get('type') != 'file' or 'owner' not in item:
+        continue
+      size = int(item.get('size') or 0)
+      add(expected, item['owner'], '/', charged_bytes=size, charged_files=1)
+      if item.get('status'):
+        add(expected, item['owner'], '/', reserved=size)
+        continue
+      for path in ancestors(item.get('path')):
+        add(expected, item['owner'], path, bytes=size, files=1)
+    if 'LastEvaluatedKey' not in response:
+      break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+  now = datetime.now().isoformat()
+  puts = []
+  for (owner, path), counter in expected.items():
+    item = current.get((owner, path), {})
+    if all(int(item.get(name, 0)) == value for name, value in counter.items()):
+      continue
+    puts.append({
+      'id': f"{USAGE_PREFIX}{owner}#{path}",
+      'usage_owner': owner,
+      'usage_path': path,
+      **counter,
+      'updated_at': now
+    })
+  deletes = [item['id'] for key, item in current.items() if key not in expected]
+
+  if not args.dry_run:
+    with table.batch_writer() as batch:
+      for item in puts:
+        batch.put_item(Item=item)
+      for item_id in deletes:
+        batch.delete_item(Key={'id': item_id})
+  print(f"scanned: {scanned}, {'to update' if args.dry_run else 'updated'}: {len(puts)}, "
+        f"{'to delete' if args.dry_run else 'deleted'}: {len(deletes)}")
+
+if __name__ == "__main__":
+  main()
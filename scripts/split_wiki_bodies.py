@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+既存の記事の本文をWikiBodyTableに移す移行スクリプト
+
+  python scripts/split_wiki_bodies.py --profile default [--dry-run]
+
+WikiTableのアイテムの本文の属性（text / text_z / text_codec / text_s3）を同じキーでWikiBodyTableに保存し、
+WikiTableのアイテムからは削除する。既に本文のアイテムがある記事は、その本文を新しいものとして残す
+"""
+import argparse
+import boto3
+from botocore.exceptions import ClientError
+
+TEXT_ATTRIBUTES = ('text', 'text_z', 'text_codec', 'text_s3')
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="既存記事の本文をWikiBodyTableに移す")
+  parser.add_argument("--table", default="wikiproject-table", help="Wikiテーブル名")
+  parser.add_argument("--body-table", default="wikiproject-body-table", help="本文のテーブル名")
+  parser.add_argument("--region", default="ap-northeast-1", help="リージョン")
+  parser.add_argument("--profile", default=None, help="AWSプロファイル")
+  parser.add_argument("--dry-run", action="store_true", help="移さずに対象件数のみ表示")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  session = boto3.Session(profile_name=args.profile, region_name=args.region)
+  dynamodb = session.resource('dynamodb')
+  table = dynamodb.Table(args.table)
+  body_table = dynamodb.Table(args.body_table)
+  scan_kwargs = {}
+  scanned = moved = 0
+  while True:
+    response = table.scan(**scan_kwargs)
+    for item in response['Items']:
+      scanned += 1
+      body = {k: v for k, v in item.items() if k in TEXT_ATTRIBUTES}
+      if not body:
+        continue
+      moved += 1
+      if args.dry_run:
+        continue
+      key = {'username': item['username'], 'slug': item['slug']}
+      try:
+        # 移行中にアプリケーションが保存した本文は上書きしない
+        body_table.put_item(Item={**key, **body}, ConditionExpression='attribute_not_exists(username)')
+      except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+          raise
+      table.update_item(
+        Key=key,
+        UpdateExpression="REMOVE " + ", ".join(f"#{k}" for k in body),
+        ExpressionAttributeNames={f"#{k}": k for k in body}
+      )
+    if 'LastEvaluatedKey' not in response:
+      break
+    scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+  print(f"scanned: {scanned}, {'to move' if args.dry_run else 'moved'}: {moved}")
+
+if __name__ == "__main__":
+  main()